@@ -2,12 +2,14 @@ import os
 from typing import Optional
 
 from flask import Flask, Blueprint,  send_from_directory
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 from dotenv import load_dotenv
 
 from .config import config_by_name
 from .utils.logging import setup_logging
 from .utils.extensions import login_manager, redis_client
+from .utils.sessions import RedisSessionInterface
 from .database import db, ensure_db_directory
 from .styles import get_theme_loader
 from pathlib import Path
@@ -33,6 +35,12 @@ def create_app(config_name: Optional[str] = None) -> Flask:
     app.config.from_object(config_by_name[config_name])
     config_by_name[config_name].init_app(app)
     app.config.from_envvar("OSHKELOSH_SETTINGS", silent=True)  
+
+    # Behind a reverse proxy remote_addr is the proxy's; the client address
+    # (rate limits, logs) comes from X-Forwarded-For set by TRUSTED_PROXIES hops
+    if app.config["TRUSTED_PROXIES"]:
+        proxies = app.config["TRUSTED_PROXIES"]
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies)  # type: ignore[method-assign]
     
     # ------------------------------------------------------------------
     # Logging
@@ -47,6 +55,8 @@ def create_app(config_name: Optional[str] = None) -> Flask:
     login_manager.login_message_category = "warning"
     
     redis_client.init_app(app)
+    if app.config.get("SESSION_BACKEND") == "redis":
+        app.session_interface = RedisSessionInterface(redis_client)
     
     # ------------------------------------------------------------------
     # SQLAlchemy Database
@@ -81,6 +91,15 @@ def create_app(config_name: Optional[str] = None) -> Flask:
             )
             raise
         
+        # create_all() never alters existing tables; flag columns/indexes added since
+        from app.database import upgrade
+        pending = upgrade.describe(*upgrade.pending_changes())
+        if pending:
+            app.logger.warning(
+                "Database schema is behind the models (%s). Run `flask upgrade-db`.",
+                ", ".join(pending),
+            )
+
         from app.database import default_list
         models.set_defaults(default_list = default_list)
 
@@ -105,10 +124,14 @@ def create_app(config_name: Optional[str] = None) -> Flask:
         init_blueprints(app)
         from .utils.error_handlers import register_error_handlers
         register_error_handlers(app)
+        from .utils.commands import register_commands
+        register_commands(app)
+
+        from .utils.identity import CachedUser, load_identity
 
         @login_manager.user_loader
-        def load_user(user_id: int) -> models.User | None:
-            return models.User.query.get(int(user_id))
+        def load_user(user_id: str) -> CachedUser | None:
+            return load_identity(int(user_id))
     
         app.logger.info("Oshkelosh %s server ready (theme: %s)", config_name, app.config.get("ACTIVE_THEME", 'basic'))
 
@@ -1,4 +1,7 @@
 from . import functions
+from . import webhooks
+from .webhooks import verify_webhook, webhook_event_id, webhook_updates
+from .processor import PaypalProcessor as processor
 import json
 import logging
 
@@ -28,4 +31,26 @@ default_list = [
             "secure":True,
         },
     },
+    {
+        "object_name": "SETUP",
+        "type": "NOT_NULL",
+        "key": "key",
+        "value": "webhook_id",
+        "data": {
+            "value": "your_paypal_webhook_id",
+            "description": "Webhook ID from your PayPal app, used to verify webhook signatures",
+            "secure":True,
+        },
+    },
+    {
+        "object_name": "SETUP",
+        "type": "NOT_NULL",
+        "key": "key",
+        "value": "sandbox",
+        "data": {
+            "value": True,
+            "description": "Use the PayPal sandbox instead of live payments",
+            "type": "BOOLEAN",
+        },
+    },
 ]
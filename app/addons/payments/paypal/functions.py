@@ -1,17 +1,86 @@
-import requests
-import time
 import base64
-from typing import Optional
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import redis
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+log = logging.getLogger(__name__)
+
+TOKEN_PREFIX = "oshkelosh:paypal:token:"
+EARLY_REFRESH = 300      # seconds before expiry a token is treated as stale
+LOCK_TTL = 10            # seconds one worker may spend fetching a token
+LOCK_WAIT = 5.0          # how long other workers wait for it before fetching themselves
+POOL_SIZE = 20
+TIMEOUT = (3.05, 15)     # connect, read
+SEARCH_PAGE_SIZE = 500   # Transaction Search maximum
+SEARCH_WINDOW = timedelta(days=31)  # longest range one search may cover
+
+# Shared per process: one keep-alive pool per PayPal host
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+def _session(base_url: str) -> requests.Session:
+    with _sessions_lock:
+        session = _sessions.get(base_url)
+        if session is None:
+            retry = Retry(
+                total=3,
+                backoff_factor=0.5,
+                status_forcelist=(429, 500, 502, 503, 504),
+                # POSTs carry PayPal-Request-Id, so PayPal dedupes the retries
+                allowed_methods=frozenset({"GET", "POST", "PATCH"}),
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=retry)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[base_url] = session
+        return session
+
+
+def _default_redis() -> Optional["redis.Redis"]:
+    try:
+        from app.utils.extensions import redis_client
+        return redis_client.client
+    except RuntimeError:
+        return None
+
 
 class PaypalClient:
     SANDBOX_BASE: str = "https://api-m.sandbox.paypal.com"
     LIVE_BASE: str = "https://api-m.paypal.com"
-    
-    def __init__(self) -> None:
-        self._ts: float = 0.0
-        self._token: str = ""
-        self.sandbox: bool = True
-        
+
+    def __init__(
+        self,
+        client_id: str,
+        client_secret: str,
+        sandbox: bool = True,
+        base_url: Optional[str] = None,
+        cache: Optional["redis.Redis"] = None,
+    ) -> None:
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.sandbox = sandbox
+        # PAYPAL_API_BASE points every client at a stand-in server (see bench/fake_api.py)
+        self.base_url = (base_url or os.getenv("PAYPAL_API_BASE") or (self.SANDBOX_BASE if sandbox else self.LIVE_BASE)).rstrip("/")
+        self.session = _session(self.base_url)
+        self.cache = cache if cache is not None else _default_redis()
+        digest = hashlib.sha1(f"{self.base_url}:{client_id}".encode("utf-8")).hexdigest()
+        self._token_key = f"{TOKEN_PREFIX}{digest}"
+        self._token: Tuple[str, float] = ("", 0.0)   # token, refresh-after timestamp
+
     @staticmethod
     def _get_auth_header(client_id: str, client_secret: str) -> str:
         """Base64-encoded Basic auth header for client credentials."""
@@ -19,9 +88,140 @@ class PaypalClient:
         encoded = base64.b64encode(credentials).decode("utf-8")
         return f"Basic {encoded}"
 
-    def get_access_token(self, client_id: str, client_secret: str) -> Optional[str]:
-        ts = time.time()
-        if ts - self._ts < 3600 and self._token:
-            return self._token
-        # TODO: Implement token retrieval logic
-        return None 
+    def _fetch_token(self) -> Tuple[str, int]:
+        response = self.session.post(
+            f"{self.base_url}/v1/oauth2/token",
+            headers={"Authorization": self._get_auth_header(self.client_id, self.client_secret)},
+            data={"grant_type": "client_credentials"},
+            timeout=TIMEOUT,
+        )
+        response.raise_for_status()
+        result = response.json()
+        return result["access_token"], int(result.get("expires_in", 3600))
+
+    def _remember(self, token: str, ttl: int) -> None:
+        self._token = (token, time.time() + ttl)
+
+    def get_access_token(self, force: bool = False) -> str:
+        """
+        Token shared by every worker through Redis. It is refreshed EARLY_REFRESH
+        seconds before PayPal's expires_in, and only one worker fetches at a
+        time; the others wait for its result.
+        """
+        token, refresh_after = self._token
+        if token and not force and time.time() < refresh_after:
+            return token
+        if self.cache is None:
+            token, expires_in = self._fetch_token()
+            self._remember(token, max(expires_in - EARLY_REFRESH, 1))
+            return token
+
+        if force and token:
+            # Drop the shared copy only if it is still the token PayPal just rejected
+            cached = self.cache.get(self._token_key)
+            if cached in (token, token.encode("utf-8")):
+                self.cache.delete(self._token_key)
+
+        lock_key = f"{self._token_key}:lock"
+        deadline = time.time() + LOCK_WAIT
+        while True:
+            pipe = self.cache.pipeline()
+            pipe.get(self._token_key)
+            pipe.ttl(self._token_key)
+            cached, ttl = pipe.execute()
+            if cached:
+                self._remember(cached.decode() if isinstance(cached, bytes) else cached, max(int(ttl), 1))
+                return self._token[0]
+            if self.cache.set(lock_key, 1, nx=True, ex=LOCK_TTL):
+                try:
+                    token, expires_in = self._fetch_token()
+                    ttl = max(expires_in - EARLY_REFRESH, 1)
+                    self.cache.set(self._token_key, token, ex=ttl)
+                finally:
+                    self.cache.delete(lock_key)
+                self._remember(token, ttl)
+                return token
+            if time.time() >= deadline:
+                log.warning("Timed out waiting for another worker's PayPal token, fetching directly")
+                token, expires_in = self._fetch_token()
+                self._remember(token, max(expires_in - EARLY_REFRESH, 1))
+                return token
+            time.sleep(0.05)  # another worker is fetching; pick its token up from Redis
+
+    def request(self, method: str, path: str, request_id: Optional[str] = None, **kwargs: Any) -> Dict[str, Any]:
+        """Authenticated API call. A 401 (revoked/expired token) refreshes the token once."""
+        headers = kwargs.pop("headers", {})
+        if method.upper() == "POST":
+            headers.setdefault("PayPal-Request-Id", request_id or str(uuid.uuid4()))
+        for attempt in range(2):
+            headers["Authorization"] = f"Bearer {self.get_access_token(force=attempt > 0)}"
+            response = self.session.request(method, f"{self.base_url}{path}", headers=headers, timeout=TIMEOUT, **kwargs)
+            if response.status_code != 401:
+                break
+        response.raise_for_status()
+        return response.json() if response.content else {}
+
+    def create_order(
+        self,
+        amount: float,
+        currency: str,
+        reference_id: str,
+        request_id: Optional[str] = None,
+        custom_id: Optional[str] = None,
+        return_url: Optional[str] = None,
+        cancel_url: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        unit: Dict[str, Any] = {
+            "reference_id": reference_id,
+            "amount": {"currency_code": currency, "value": f"{amount:.2f}"},
+        }
+        if custom_id:
+            unit["custom_id"] = custom_id  # reported back as custom_field by Transaction Search
+        body: Dict[str, Any] = {"intent": "CAPTURE", "purchase_units": [unit]}
+        if return_url and cancel_url:
+            body["application_context"] = {"return_url": return_url, "cancel_url": cancel_url, "user_action": "PAY_NOW"}
+        return self.request("POST", "/v2/checkout/orders", request_id=request_id, json=body)
+
+    def capture_order(self, order_id: str, request_id: Optional[str] = None) -> Dict[str, Any]:
+        return self.request("POST", f"/v2/checkout/orders/{order_id}/capture", request_id=request_id, json={})
+
+    def get_order(self, order_id: str) -> Dict[str, Any]:
+        return self.request("GET", f"/v2/checkout/orders/{order_id}")
+
+    def refund_capture(self, capture_id: str, amount: Optional[float] = None, currency: Optional[str] = None, request_id: Optional[str] = None) -> Dict[str, Any]:
+        body = {"amount": {"currency_code": currency, "value": f"{amount:.2f}"}} if amount is not None else {}
+        return self.request("POST", f"/v2/payments/captures/{capture_id}/refund", request_id=request_id, json=body)
+
+    def search_transactions(self, start: datetime, end: datetime) -> Iterator[Dict[str, Any]]:
+        """
+        Every transaction between start and end (UTC), SEARCH_PAGE_SIZE per call,
+        split into the 31-day windows the Transaction Search API allows.
+        """
+        while start < end:
+            window_end = min(start + SEARCH_WINDOW, end)
+            page, total_pages = 1, 1
+            while page <= total_pages:
+                result = self.request("GET", "/v1/reporting/transactions", params={
+                    "start_date": start.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                    "end_date": window_end.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                    "fields": "transaction_info",
+                    "page_size": SEARCH_PAGE_SIZE,
+                    "page": page,
+                })
+                yield from result.get("transaction_details", [])
+                total_pages = int(result.get("total_pages", 1))
+                page += 1
+            start = window_end
+
+
+_clients: Dict[Tuple[str, str, bool], PaypalClient] = {}
+
+
+def get_client(paypal_data: Dict[str, Any]) -> PaypalClient:
+    """Process-wide client for the configured credentials."""
+    sandbox = str(paypal_data.get("sandbox", True)).lower() not in ("false", "0", "no")
+    key = (paypal_data["client_id"], paypal_data["client_secret"], sandbox)
+    client = _clients.get(key)
+    if client is None:
+        client = _clients[key] = PaypalClient(paypal_data["client_id"], paypal_data["client_secret"], sandbox=sandbox)
+    return client
@@ -0,0 +1,141 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+import requests
+
+from app.processor.payments import PaymentProcessor
+from app.utils.exceptions import PaymentError
+from . import functions
+
+CUSTOM_PREFIX = "oshkelosh-"
+ORDER_EXPIRY = timedelta(hours=72)  # PayPal drops orders that were never captured
+SEARCH_MARGIN = timedelta(minutes=10)
+
+ORDER_STATUSES = {
+    "CREATED": "CREATED",
+    "SAVED": "CREATED",
+    "PAYER_ACTION_REQUIRED": "CREATED",
+    "APPROVED": "APPROVED",
+    "VOIDED": "VOIDED",
+    "COMPLETED": "COMPLETED",
+}
+CAPTURE_STATUSES = {
+    "COMPLETED": "COMPLETED",
+    "PENDING": "PENDING",
+    "DECLINED": "DENIED",
+    "FAILED": "DENIED",
+    "REFUNDED": "REFUNDED",
+    "PARTIALLY_REFUNDED": "COMPLETED",
+}
+# Transaction Search status codes: Success, Pending, Denied, reVersed
+TRANSACTION_STATUSES = {"S": "COMPLETED", "P": "PENDING", "D": "DENIED", "V": "REVERSED"}
+REFUND_STATUSES = {"S": "REFUNDED", "P": "PENDING", "D": "DENIED", "V": "REVERSED"}
+
+
+def _capture_of(order: Dict[str, Any]) -> Dict[str, Any]:
+    units = order.get("purchase_units") or [{}]
+    captures = (units[0].get("payments") or {}).get("captures") or []
+    return captures[0] if captures else {}
+
+
+def _error(e: requests.HTTPError) -> str:
+    try:
+        body = e.response.json()
+    except ValueError:
+        return str(e)
+    issues = ", ".join(detail.get("issue", "") for detail in body.get("details", []))
+    return issues or body.get("name") or str(e)
+
+
+class PaypalProcessor(PaymentProcessor):
+
+    @property
+    def client(self) -> functions.PaypalClient:
+        return functions.get_client(self.config)
+
+    def create(self, order: Any, currency: str, return_url: str, cancel_url: str) -> Dict[str, Any]:
+        try:
+            result = self.client.create_order(
+                order.total,
+                currency,
+                reference_id=str(order.id),
+                custom_id=f"{CUSTOM_PREFIX}{order.id}",
+                return_url=return_url,
+                cancel_url=cancel_url,
+                request_id=f"{CUSTOM_PREFIX}order-{order.id}",
+            )
+        except requests.HTTPError as e:
+            raise PaymentError(f"PayPal refused the order: {_error(e)}") from e
+        approve_url = next((link["href"] for link in result.get("links", []) if link.get("rel") in ("approve", "payer-action")), None)
+        return {"payment_id": result["id"], "status": ORDER_STATUSES.get(result.get("status"), "CREATED"), "approve_url": approve_url}
+
+    def capture(self, payment_id: str, request_id: Optional[str] = None) -> Dict[str, Any]:
+        try:
+            result = self.client.capture_order(payment_id, request_id=request_id)
+        except requests.HTTPError as e:
+            if "ORDER_ALREADY_CAPTURED" not in _error(e):
+                raise PaymentError(f"PayPal capture failed: {_error(e)}") from e
+            result = self.client.get_order(payment_id)
+        capture = _capture_of(result)
+        return {"status": CAPTURE_STATUSES.get(capture.get("status"), "PENDING"), "capture_id": capture.get("id")}
+
+    def refund(self, payment_id: str, amount: Optional[float] = None, currency: Optional[str] = None, request_id: Optional[str] = None) -> Dict[str, Any]:
+        capture = _capture_of(self.client.get_order(payment_id))
+        if not capture:
+            raise PaymentError("PayPal order has no capture to refund")
+        if amount is not None and currency is None:
+            currency = capture["amount"]["currency_code"]
+        try:
+            result = self.client.refund_capture(capture["id"], amount=amount, currency=currency, request_id=request_id)
+        except requests.HTTPError as e:
+            raise PaymentError(f"PayPal refund failed: {_error(e)}") from e
+        return {"refund_id": result["id"], "status": "REFUNDED" if result.get("status") == "COMPLETED" else "PENDING"}
+
+    def bulk_status(self, payments: List[Dict[str, Any]]) -> Dict[str, str]:
+        """
+        One Transaction Search over the period the payments were created in,
+        500 transactions per call, matched on the custom_id set in create().
+        Orders PayPal has no payment for and that are past ORDER_EXPIRY are voided.
+        """
+        if not payments:
+            return {}
+        by_order = {payment["order_id"]: payment["payment_id"] for payment in payments}
+        now = datetime.utcnow()
+        start = min(payment["created_at"] for payment in payments) - SEARCH_MARGIN
+        statuses: Dict[str, str] = {}
+        for transaction in self.transactions(start, now):
+            payment_id = by_order.get(transaction["order_id"])
+            if transaction["kind"] == "PAYMENT" and payment_id:
+                statuses[payment_id] = transaction["status"]
+        for payment in payments:
+            if payment["payment_id"] not in statuses and payment["created_at"] < now - ORDER_EXPIRY:
+                statuses[payment["payment_id"]] = "VOIDED"
+        return statuses
+
+    def transactions(self, start: datetime, end: datetime) -> Iterator[Dict[str, Any]]:
+        """
+        Transaction Search results. Captures (T00xx) carry our order through
+        custom_id; refunds (T11xx) are the refund ids refund() returned.
+        Other event types (fees, transfers, holds) are skipped.
+        """
+        for transaction in self.client.search_transactions(start, end):
+            info = transaction.get("transaction_info") or {}
+            event_code = info.get("transaction_event_code", "")
+            if event_code.startswith("T00"):
+                kind, statuses, payment_id = "PAYMENT", TRANSACTION_STATUSES, None
+            elif event_code.startswith("T11"):
+                kind, statuses, payment_id = "REFUND", REFUND_STATUSES, info.get("transaction_id")
+            else:
+                continue
+            custom_id = info.get("custom_field") or ""
+            order_ref = custom_id[len(CUSTOM_PREFIX):] if custom_id.startswith(CUSTOM_PREFIX) else ""
+            amount = info.get("transaction_amount") or {}
+            yield {
+                "transaction_id": info.get("transaction_id"),
+                "kind": kind,
+                "status": statuses.get(info.get("transaction_status"), "PENDING"),
+                "amount": abs(float(amount.get("value", 0) or 0)),
+                "currency": amount.get("currency_code"),
+                "payment_id": payment_id,
+                "order_id": int(order_ref) if order_ref.isdigit() else None,
+            }
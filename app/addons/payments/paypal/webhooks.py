@@ -0,0 +1,88 @@
+import base64
+import logging
+import time
+import zlib
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+
+log = logging.getLogger(__name__)
+
+CERT_TTL = 24 * 3600
+_certs: Dict[str, Tuple[float, Any]] = {}
+
+# PayPal event types → OrderPayment status
+PAYMENT_STATUSES = {
+    "CHECKOUT.ORDER.APPROVED": "APPROVED",
+    "PAYMENT.CAPTURE.COMPLETED": "COMPLETED",
+    "PAYMENT.CAPTURE.PENDING": "PENDING",
+    "PAYMENT.CAPTURE.DENIED": "DENIED",
+    "PAYMENT.CAPTURE.REFUNDED": "REFUNDED",
+    "PAYMENT.CAPTURE.REVERSED": "REVERSED",
+}
+
+
+def _public_key(cert_url: str) -> Optional[Any]:
+    parsed = urlparse(cert_url)
+    # Only ever trust certificates served by PayPal itself
+    if parsed.scheme != "https" or not (parsed.hostname or "").endswith(".paypal.com"):
+        return None
+    cached = _certs.get(cert_url)
+    if cached and cached[0] > time.time():
+        return cached[1]
+    response = requests.get(cert_url, timeout=5)
+    response.raise_for_status()
+    key = x509.load_pem_x509_certificate(response.content).public_key()
+    _certs[cert_url] = (time.time() + CERT_TTL, key)
+    return key
+
+
+def verify_webhook(paypal_data: Dict[str, Any], headers: Mapping[str, str], args: Mapping[str, str], body: bytes) -> bool:
+    """
+    Offline PayPal signature check: SHA256withRSA over
+    transmission_id|transmission_time|webhook_id|crc32(body), using the
+    (cached) certificate named in PAYPAL-CERT-URL.
+    """
+    webhook_id = paypal_data.get("webhook_id")
+    if not webhook_id or headers.get("PAYPAL-AUTH-ALGO") != "SHA256withRSA":
+        return False
+    try:
+        key = _public_key(headers.get("PAYPAL-CERT-URL", ""))
+        if key is None:
+            return False
+        message = "|".join([
+            headers.get("PAYPAL-TRANSMISSION-ID", ""),
+            headers.get("PAYPAL-TRANSMISSION-TIME", ""),
+            webhook_id,
+            str(zlib.crc32(body)),
+        ])
+        signature = base64.b64decode(headers.get("PAYPAL-TRANSMISSION-SIG", ""))
+        key.verify(signature, message.encode("utf-8"), padding.PKCS1v15(), hashes.SHA256())
+        return True
+    except (InvalidSignature, ValueError, requests.RequestException) as e:
+        log.warning(f"PayPal webhook verification failed: {e}")
+        return False
+
+
+def webhook_event_id(event: Dict[str, Any]) -> str:
+    return str(event["id"])
+
+
+def webhook_updates(event: Dict[str, Any]) -> List[Dict[str, Any]]:
+    status = PAYMENT_STATUSES.get(event.get("event_type"))
+    resource = event.get("resource") or {}
+    if status is None:
+        return []
+    if event["event_type"].startswith("CHECKOUT.ORDER."):
+        paypal_order_id = resource.get("id")
+    else:
+        related = (resource.get("supplementary_data") or {}).get("related_ids") or {}
+        paypal_order_id = related.get("order_id")
+    if not paypal_order_id:
+        return []
+    return [{"target": "ORDER_PAYMENT", "payment_id": paypal_order_id, "status": status}]
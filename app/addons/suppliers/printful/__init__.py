@@ -1,5 +1,7 @@
 from . import functions
 from . import limit_session
+from . import webhooks
+from .webhooks import verify_webhook, webhook_event_id, webhook_updates
 import json
 import logging
 
@@ -44,6 +46,10 @@ def sync_product(printful_data):
     except Exception:
         raise
 
+def submit_order(printful_data, payload):
+    token = printful_data["token"]
+    return functions.submit_order(token, payload)
+
 addon_data = {
     "name": "printful",
     "type": "SUPPLIER"
@@ -60,5 +66,16 @@ default_list = [
             "secure":True,
         },
     },
+    {
+        "object_name": "SETUP",
+        "type": "NOT_NULL",
+        "key": "key",
+        "value": "webhook_secret",
+        "data": {
+            "value": webhooks.DEFAULT_WEBHOOK_SECRET,
+            "description": "Secret appended to the Printful webhook URL (?secret=...)",
+            "secure":True,
+        },
+    },
 ]
 options = []
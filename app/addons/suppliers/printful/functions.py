@@ -1,13 +1,18 @@
 from .limit_session import session
 import logging
+import os
+from requests import HTTPError
 from typing import Any, Dict, List, Optional
 
 log = logging.getLogger(__name__)
 
+# PRINTFUL_API_BASE points the addon at a stand-in server (see bench/fake_api.py)
+BASE_URL = os.getenv("PRINTFUL_API_BASE", "https://api.printful.com").rstrip("/")
+
 def check_token(token: Optional[str]) -> bool:
     if token is None:
         return False
-    url = "https://api.printful.com/oauth/scopes"
+    url = f"{BASE_URL}/oauth/scopes"
     header = {
         "Authorization": f"Bearer {token}"
     }
@@ -30,13 +35,13 @@ def get_products(token: str) -> List[Dict[str, Any]]:
     result_list: List[Dict[str, Any]] = []
     try:
         while True:
-            url = f"https://api.printful.com/store/products?offset={offset}"
+            url = f"{BASE_URL}/store/products?offset={offset}"
             response = session.get(url = url, headers = header)
             response.raise_for_status()
             result = response.json()
             result_list.extend(result["result"])
             next_offset = result["paging"]["offset"] + len(result["result"])
-            if next_offset <= result["paging"]["total"]:
+            if not result["result"] or next_offset >= result["paging"]["total"]:
                 break
             offset = next_offset
         return result_list
@@ -49,7 +54,7 @@ def get_product_details(token: str, product_id: str) -> Optional[Dict[str, Any]]
         "Authorization" : f"Bearer {token}"
     }
     try:
-        url = f"https://api.printful.com/store/products/{product_id}"
+        url = f"{BASE_URL}/store/products/{product_id}"
         response = session.get(url = url, headers = header)
         response.raise_for_status()
         return response.json()
@@ -58,3 +63,64 @@ def get_product_details(token: str, product_id: str) -> Optional[Dict[str, Any]]
         return None
 
 
+def submit_order(token: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Create a Printful order from an outbox SUBMIT_ORDER payload.
+    external_id makes resubmits after a lost response fail as duplicates
+    instead of creating a second order; such a duplicate is looked up and
+    returned as the result. Errors are raised for the caller to retry or
+    give up on.
+    """
+    header = {
+        "Authorization" : f"Bearer {token}"
+    }
+    recipient = payload.get("recipient") or {}
+    body = {
+        "external_id": f"oshkelosh-{payload['order_id']}",
+        "recipient": {
+            "name": recipient.get("name"),
+            "address1": recipient.get("street"),
+            "city": recipient.get("city"),
+            "state_code": recipient.get("state"),
+            "zip": recipient.get("postal_code"),
+            "country_code": recipient.get("country"),
+        },
+        "items": [
+            {
+                "sync_variant_id": int(item["external_id"]),
+                "quantity": item["quantity"],
+                "retail_price": f"{item['price']:.2f}",
+            }
+            for item in payload["items"]
+        ],
+    }
+    url = f"{BASE_URL}/orders"
+    try:
+        # Only paid orders are queued, so they go straight to fulfillment instead of staying drafts
+        response = session.post(url = url, headers = header, json = body, params = {"confirm": "true"})
+    except HTTPError as e:
+        if e.response is None or e.response.status_code not in (400, 409):
+            raise
+        # An earlier attempt may have created the order and lost the response
+        existing = get_order(token, f"@{body['external_id']}")
+        if existing is None:
+            raise
+        log.info(f"Printful order {body['external_id']} already exists, using it")
+        return {"id": existing["id"], "status": existing["status"]}
+    result = response.json()["result"]
+    return {"id": result["id"], "status": result["status"]}
+
+
+def get_order(token: str, order_ref: str) -> Optional[Dict[str, Any]]:
+    """Order by Printful id or "@<external_id>"; None if there is no such order."""
+    header = {
+        "Authorization" : f"Bearer {token}"
+    }
+    url = f"{BASE_URL}/orders/{order_ref}"
+    try:
+        response = session.get(url = url, headers = header)
+    except HTTPError as e:
+        if e.response is not None and e.response.status_code == 404:
+            return None
+        raise
+    return response.json()["result"]
@@ -1,3 +1,4 @@
+import os
 import time
 from collections import deque
 import requests
@@ -7,10 +8,11 @@ import logging
 log = logging.getLogger(__name__)
 
 class LimitSession(requests.Session):
-    def __init__(self, calls: int = 120, period: float = 60.0):
+    def __init__(self, calls: int = 120, period: float = 60.0, max_retries: int = 3):
         """
         :param calls: Maximum number of requests allowed in the period.
         :param period: Time window in seconds.
+        :param max_retries: Times a 429 (any method) or 5xx (GET/HEAD) response is retried.
         """
         if calls <= 0:
             raise ValueError("calls must be positive")
@@ -20,6 +22,7 @@ class LimitSession(requests.Session):
         super().__init__()
         self.calls = calls
         self.period = period
+        self.max_retries = max_retries
         self._timestamps = deque(maxlen=calls)
         self._lock = Lock()  # Protects the deque in multithreaded use
 
@@ -41,17 +44,38 @@ class LimitSession(requests.Session):
             # Record this request
             self._timestamps.append(now)
 
+    def _retry_delay(self, method: str, response: requests.Response, attempt: int) -> float | None:
+        """Seconds to wait before retrying, or None if the response is final."""
+        if response.status_code == 429:
+            try:
+                delay = float(response.headers.get("Retry-After", 1))
+            except ValueError:
+                delay = 1.0
+            return min(max(delay, 0.0), self.period)
+        if response.status_code >= 500 and method.upper() in ("GET", "HEAD"):
+            return 0.5 * 2 ** attempt
+        return None
+
     def request(self, method: str, url: str, **kwargs) -> requests.Response:
         """
         Override the core request method to enforce rate limiting before every request.
+        A 429 (the server's own limit, shared with other clients of the token)
+        waits for its Retry-After and tries again; reads that hit a 5xx back off
+        and try again, so one bad response doesn't abort a whole sync.
         """
-        self._enforce_rate_limit()
-
-        try:
-            response = super().request(method, url, **kwargs)
-            response.raise_for_status()
-            return response
-        except requests.RequestException as e:
-            log.warning(f"Request failed ({method} {url}): {e}")
-            raise
-session = LimitSession()
+        for attempt in range(self.max_retries + 1):
+            self._enforce_rate_limit()
+            try:
+                response = super().request(method, url, **kwargs)
+                delay = self._retry_delay(method, response, attempt) if attempt < self.max_retries else None
+                if delay is not None:
+                    response.close()
+                    log.warning(f"{response.status_code} from {method} {url}, retrying in {delay:.1f}s")
+                    time.sleep(delay)
+                    continue
+                response.raise_for_status()
+                return response
+            except requests.RequestException as e:
+                log.warning(f"Request failed ({method} {url}): {e}")
+                raise
+session = LimitSession(calls=int(os.getenv("PRINTFUL_RATE_LIMIT", 120)))
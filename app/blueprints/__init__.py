@@ -25,3 +25,4 @@ def init_blueprints(app: Flask) -> None:
 from .admin import *
 from .main import *
 from .user import *
+from .webhooks import *
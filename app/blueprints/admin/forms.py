@@ -8,7 +8,6 @@ from wtforms.validators import DataRequired, Length, Optional, URL
 from typing import Type, Any, List, Tuple
 
 from app.models import models
-import json
 
 def dynamic_form(configs: models.Config) -> Type[FlaskForm]:
     type_map = {
@@ -69,8 +68,8 @@ def create_product_form(product: models.Product) -> FlaskForm:
             default=product.price
         )
         
-        supplier_config = models.get_config(addon_id=product.supplier_id)
-        if getattr(supplier_config, 'manual', False):
+        supplier_config = models.get_configs([product.supplier_id]).get(product.supplier_id)
+        if supplier_config is not None and "manual" in supplier_config:
             stock = StringField(
                 'Stock',
                 validators=[DataRequired()],
@@ -196,7 +195,9 @@ def create_manual_product_form() -> FlaskForm:
 
 def get_suppliers() -> List[Tuple[int, str]]:
     suppliers = models.Addon.query.filter_by(type="SUPPLIER").all()
-    supplier_data = [models.Config(addon_id=supplier.id) for supplier in suppliers] if suppliers else []
-    for supplier in supplier_data:
-        print(json.dumps(supplier.data(), indent=4))
-    return [(supplier.id, supplier.name) for supplier in supplier_data if "manual" in supplier.keys()] if supplier_data else []
+    configs = models.get_configs(supplier.id for supplier in suppliers)
+    return [
+        (supplier.id, supplier.name)
+        for supplier in suppliers
+        if supplier.id in configs and "manual" in configs[supplier.id]
+    ]
@@ -6,6 +6,7 @@ from flask import (
     abort,
     Response,
     request,
+    jsonify,
     session as flask_session
 )
 from . import bp
@@ -14,15 +15,16 @@ from app.utils import site_config
 from flask_login import current_user, login_required
 
 from functools import wraps
-from typing import Callable, Any
+from typing import Callable, Any, Dict
 import json
 import tempfile
 import pathlib
 
-from app.models import models, get_previews
+from app.models import models, get_previews, get_user_page, get_image_page, USERS_PER_PAGE, IMAGES_PER_PAGE
 from app.database import db
 
 from app.utils.site_config import invalidate_config_cache
+from app.utils.user_directory import ROLES
 from app.utils.logging import get_logger
 
 import app.processor as processors
@@ -86,18 +88,54 @@ def settings(style_name: str | None = None) -> str | Response:
     )
 
 
+def _user_page() -> Dict[str, Any]:
+    role = request.args.get("role", "CLIENT").upper()
+    if role not in ROLES:
+        abort(400, description="Unknown role")
+    return get_user_page(
+        role=role,
+        search=request.args.get("q", ""),
+        page=request.args.get("page", 1, type=int),
+        per_page=request.args.get("per_page", USERS_PER_PAGE, type=int),
+    )
+
 @bp.route('/users')
 @admin_required
 def users() -> str:
-    data = models.User.query.all()
-    users = [user for user in data if user.role == 'CLIENT']
-    admins = [user for user in data if user.role == 'ADMIN']
     return render_template(
         "core/users.html",
-        users = users,
-        admins = admins
+        directory = _user_page(),
     )
 
+@bp.route('/users.json')
+@admin_required
+def users_json() -> Response:
+    """Backs the live filter on the users page."""
+    directory = _user_page()
+    direction = 'REMOVE' if directory["role"] == 'ADMIN' else 'ADD'
+    return jsonify({
+        "users": [
+            {
+                "id": user.id,
+                "name": user.name,
+                "surname": user.surname,
+                "email": user.email,
+                "phone": user.phone,
+                "role": user.role,
+                "created_at": user.created_at.isoformat() if user.created_at else None,
+                "role_url": url_for('admin.set_user_role', id=user.id, direction=direction),
+            }
+            for user in directory["users"]
+        ],
+        "counts": directory["counts"],
+        "role": directory["role"],
+        "page": directory["page"],
+        "per_page": directory["per_page"],
+        "pages": directory["pages"],
+        "total": directory["total"],
+        "has_next": directory["has_next"],
+    })
+
 @bp.route('/set-user/<int:id>/<direction>', methods=["POST"])
 @admin_required
 def set_user_role(id: int, direction: str) -> Response:
@@ -161,6 +199,8 @@ def product(product_id: str) -> str | Response:
                 update = True
         if update:
             db.session.commit()
+            if product.variant_of_id is not None:
+                models.refresh_variant_aggregates([product.variant_of_id])
             flash(f"Product {product.name} updated successfully", "success")
         else:
             flash(f"Failed to update product {product.name}", "error")
@@ -175,10 +215,15 @@ def product(product_id: str) -> str | Response:
 @bp.route('/images')
 @admin_required
 def images() -> str:
-    images = models.Image.query.all()
+    gallery = get_image_page(
+        product_id=request.args.get("product_id", None, type=int),
+        orphaned=request.args.get("orphaned", "") in ("1", "true", "on"),
+        page=request.args.get("page", 1, type=int),
+        per_page=request.args.get("per_page", IMAGES_PER_PAGE, type=int),
+    )
     return render_template(
         'core/images.html',
-        images=images
+        gallery=gallery
     )
 
 @bp.route('/images/<image_id>', methods=["GET", "POST"])
@@ -226,9 +271,10 @@ def add_iamge(product_id: str) -> str | Response:
             db.session.add(new_image)
             db.session.flush()  # Get the ID
             filename = f"productimage_{new_image.product_id}_{new_image.id}"
-            new_image.filename = filename
+            # save_image adds the upload's extension; store the name it actually wrote
+            for key, value in processors.save_image(filename, file).items():
+                setattr(new_image, key, value)
             db.session.commit()
-            processors.save_image(filename, file)
 
         except Exception as e:
             log.error(f'An error occured while uploading a new product image: {e}')
@@ -281,9 +327,13 @@ def suppliers() -> str | Response:
 
 
     addons = models.Addon.query.filter_by(type="SUPPLIER", active=True).all()
+    configs = models.get_configs(supplier.id for supplier in addons)
     supplier_data = []
     for supplier in addons:
-        config = models.get_config(addon_id=supplier.id)
+        config = configs.get(supplier.id)
+        if config is None:
+            log.warning(f"Supplier {supplier.name} has no config, skipping")
+            continue
         formClass = forms.dynamic_form(config)
 
         class extendedForm(formClass):
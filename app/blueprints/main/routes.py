@@ -3,26 +3,39 @@ from flask import (
     render_template,
     send_from_directory,
     Response,
+    jsonify,
+    request,
 )
 from . import bp
-from app.models import models, get_previews
+from app.models import models, get_listing, LISTING_SORTS
 
-from app.utils import site_config
+from app.utils import site_config, catalog, feeds
+from app.utils.http_cache import conditional
 import random
 from pathlib import Path
 
 @bp.route("/index")
 @bp.route("/")
+# Listed rows are bases (carrying their variants' aggregates) and standalone products
+@conditional(lambda: catalog.products_last_modified(models.Product.variant_of_id.is_(None)))
 def index() -> str:
-    products = get_previews("ACTIVE")
+    sort = request.args.get("sort", "newest")
+    listing = {
+        "min_price": request.args.get("min_price", type=float),
+        "max_price": request.args.get("max_price", type=float),
+        "sort": sort if sort in LISTING_SORTS else "newest",
+    }
+    products = get_listing("ACTIVE", **listing)
     return render_template(
         "main/index.html",
         site = site_config.get_config("site_config"),
         products = products,
+        listing = listing,
     )
 
 
 @bp.route("/about")
+@conditional(max_age=600)
 def about() -> str:
     return render_template(
         "main/about.html",
@@ -30,6 +43,7 @@ def about() -> str:
     )
 
 @bp.route("/category/<category_id>")
+@conditional()
 def category(category_id: str) -> str:
     category = models.Category.query.get(category_id)
     if not category:
@@ -46,20 +60,39 @@ def category(category_id: str) -> str:
         categories = categories,
     )
 
-@bp.route('/product/<product_id>')
-def product(product_id: str) -> str:
-    product = models.Product.query.get(product_id)
+@bp.route('/product/<int:product_id>')
+@conditional(catalog.family_last_modified)
+def product(product_id: int) -> str:
+    product = catalog.get_product(product_id)
     if not product:
         from flask import abort
         abort(404)
-    images = models.Image.query.filter_by(product_id=product.id).order_by(models.Image.position).all()
     return render_template(
         "main/product.html",
         site = site_config.get_config("site_config"),
         product = product,
-        images = images
+        images = product["images"]
     )
 
+@bp.route('/product/<int:product_id>/data')
+@conditional(catalog.family_last_modified, max_age=300)
+def product_data(product_id: int) -> Response:
+    product = catalog.get_product(product_id)
+    if not product:
+        from flask import abort
+        abort(404)
+    return jsonify(product)
+
+@bp.route('/sitemap.xml')
+@conditional(max_age=3600)
+def sitemap() -> Response:
+    return feeds.feed_response("sitemap.xml")
+
+@bp.route('/feeds/<any("products.xml", "products.csv"):name>')
+@conditional(max_age=3600)
+def product_feed(name: str) -> Response:
+    return feeds.feed_response(name)
+
 @bp.route('/image/<filename>')
 def serve_image(filename: str) -> Response:
     image_dir = Path(current_app.instance_path) / 'images'
@@ -1,5 +1,5 @@
 from flask_wtf import FlaskForm
-from wtforms import EmailField, PasswordField, SubmitField, StringField
+from wtforms import EmailField, PasswordField, SubmitField, StringField, HiddenField
 from wtforms.validators import DataRequired, Email, Length, EqualTo
 
 
@@ -31,3 +31,10 @@ class signupForm(FlaskForm):
     confirm_password = PasswordField('Confirm Password', validators=[DataRequired(), EqualTo('password', message="Passwords must match")])
     submit = SubmitField('Sign Up')
 
+class checkoutForm(FlaskForm):
+    idempotency_key = HiddenField()
+    submit = SubmitField('Place Order')
+
+class paymentForm(FlaskForm):
+    idempotency_key = HiddenField()
+    submit = SubmitField('Complete Payment')
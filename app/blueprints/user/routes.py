@@ -5,19 +5,28 @@ from flask import (
     redirect,
     url_for,
     flash,
-    session,
-    jsonify
+    jsonify,
+    abort
 )
 
 from flask_login import login_user, logout_user, login_required, current_user
 
 from . import bp
 from . import forms
-from app.models import models
+from app.models import models, get_order_page, ORDERS_PER_PAGE
 from app.database import db
-from app.utils import site_config 
+from app.utils import site_config, passwords
+from app.processor import cart as cart_pricing
+from app.processor import orders, stock
+from app.processor import payments as payment_processors
+from app.utils.idempotency import idempotent
+from app.utils.rate_limit import rate_limit
+from app.utils.identity import invalidate_identities
+from app.utils.sessions import regenerate_session
+from app.utils.exceptions import OutOfStockError, PaymentError
 
-import bcrypt
+import secrets
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
 from typing import Any, Dict, List
 
@@ -25,30 +34,17 @@ from typing import Any, Dict, List
 
 
 @bp.route("/login", methods=["GET","POST"])
+@rate_limit("login")
 def login() -> str | Response:
     form = forms.loginForm()
     if form.validate_on_submit():
         user = models.User.query.filter_by(email=form.email.data).first()
         if user and user.check_password(form.password.data):
             login_user(user)
-            if 'cart' in session:
-                # Convert session cart items to Cart objects
-                for item in session['cart']:
-                    cart_item = models.Cart.query.filter_by(
-                        user_id=user.id,
-                        product_id=item['product_id']
-                    ).first()
-                    if cart_item:
-                        cart_item.quantity += item.get('amount', 1)
-                    else:
-                        cart_item = models.Cart(
-                            user_id=user.id,
-                            product_id=item['product_id'],
-                            quantity=item.get('amount', 1)
-                        )
-                        db.session.add(cart_item)
-                db.session.commit()
-                session.pop('cart', None)
+            cart_pricing.merge_guest_cart(user.id, cart_pricing.guest_lines())
+            cart_pricing.clear_guest_cart()
+            # New session id on sign-in, so an id planted beforehand (session fixation) is useless
+            regenerate_session()
             return redirect(url_for('main.index'))
         flash('Invalid login attempt')
     return render_template(
@@ -60,6 +56,8 @@ def login() -> str | Response:
 
 @bp.route("/logout")
 def logout() -> str:
+    if current_user.is_authenticated:
+        invalidate_identities([current_user.id])
     logout_user()
     return render_template(
         "user/logout.html",
@@ -67,6 +65,7 @@ def logout() -> str:
     )
 
 @bp.route("/signup", methods=["GET", "POST"])
+@rate_limit("signup")
 def signup() -> str | Response:
     form = forms.signupForm()
     if form.validate_on_submit():
@@ -76,7 +75,7 @@ def signup() -> str | Response:
             "surname": form.surname.data,
             "email": form.email.data,
             "phone": form.phone.data,
-            "password": bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+            "password": passwords.hash_password(password)
         }
 
         billing_address = {
@@ -128,65 +127,194 @@ def signup() -> str | Response:
 @login_required
 def profile() -> str:
     addresses = models.Address.query.filter_by(user_id=current_user.id).all()
-    orders = models.Order.query.filter_by(user_id=current_user.id).all()
+    history = get_order_page(current_user.id, page=request.args.get("page", 1, type=int))
     return render_template(
         "user/profile.html",
         site = site_config.get_config("site_config"),
         addresses = addresses,
-        orders = orders
+        orders = history["orders"],
+        history = history,
+    )
+
+@bp.route("/orders")
+@login_required
+def order_history() -> Response:
+    history = get_order_page(
+        current_user.id,
+        page=request.args.get("page", 1, type=int),
+        per_page=request.args.get("per_page", ORDERS_PER_PAGE, type=int),
     )
+    summary = history["summary"]
+    return jsonify({
+        "orders": [orders.order_summary(order) for order in history["orders"]],
+        "page": history["page"],
+        "per_page": history["per_page"],
+        "pages": history["pages"],
+        "total": history["total"],
+        "summary": {
+            "order_count": summary.order_count if summary else 0,
+            "lifetime_spend": summary.lifetime_spend if summary else 0.0,
+            "last_order_id": summary.last_order_id if summary else None,
+            "last_order_at": summary.last_order_at.isoformat() if summary and summary.last_order_at else None,
+        },
+    })
 
 @bp.route("/cart")
 def cart() -> str:
-    cart_products = []
-    subtotal = 0.0
-    
     if current_user.is_authenticated:
-        for cart_item in current_user.cart_items:
-            product = cart_item.product
-            if product:
-                details = {
-                    "product": product,
-                    "amount": cart_item.quantity,
-                    "cart_item_id": cart_item.id
-                }
-                cart_products.append(details)
-                subtotal += product.price * cart_item.quantity
+        quote = cart_pricing.price_user_cart(current_user.id)
     else:
-        if 'cart' in session:
-            for entry in session['cart']:
-                product = models.Product.query.get(entry['product_id'])
-                if product:
-                    amount = entry.get("amount", 1)
-                    details={
-                        "product": product,
-                        "amount": amount,
-                        "product_id": product.id
-                    }
-                    cart_products.append(details)
-                    subtotal += product.price * amount
+        quote = cart_pricing.price_lines(cart_pricing.guest_lines())
     return render_template(
         "user/cart.html",
         site = site_config.get_config("site_config"),
-        products = cart_products,
-        subtotal = subtotal,
+        products = quote["lines"],
+        subtotal = quote["subtotal"],
     )
 
-@bp.route("/checkout")
+@bp.route("/checkout", methods=["GET"])
 @login_required
 def checkout() -> str:
+    quote = cart_pricing.price_user_cart(current_user.id)
+    form = forms.checkoutForm()
+    # One key per rendered page: double submits and retries of this form share it
+    form.idempotency_key.data = secrets.token_urlsafe(24)
     return render_template(
         "user/checkout.html",
         site = site_config.get_config("site_config"),
+        products = quote["lines"],
+        subtotal = quote["subtotal"],
+        checkout_form = form,
+    )
+
+@bp.route("/checkout", methods=["POST"])
+@login_required
+@idempotent()
+def place_order() -> Response:
+    form = forms.checkoutForm()
+    if not form.validate_on_submit():
+        flash("Your checkout session expired, please try again")
+        return redirect(url_for('user.checkout'))
+    quote = cart_pricing.price_user_cart(current_user.id)
+    if not quote["lines"]:
+        flash("Your cart is empty")
+        return redirect(url_for('user.cart'))
+    lines = {line["product_id"]: line["amount"] for line in quote["lines"]}
+    try:
+        reservations = stock.reserve(lines, user_id=current_user.id)
+    except OutOfStockError as e:
+        product = cart_pricing.get_products([e.payload["product_id"]]).get(e.payload["product_id"])
+        flash(f"Not enough stock for {product.name if product else 'an item in your cart'}")
+        return redirect(url_for('user.cart'))
+    # Reserving committed (expiring loaded products); re-price in one query
+    quote = cart_pricing.price_user_cart(current_user.id)
+    if {line["product_id"]: line["amount"] for line in quote["lines"]} != lines:
+        stock.release(reservations)
+        flash("Your cart changed during checkout, please review it")
+        return redirect(url_for('user.cart'))
+    try:
+        order = orders.build_order(current_user.id, quote, reservations=reservations)
+    except Exception:
+        stock.release(reservations)
+        raise
+    flash(f"Order #{order.id} placed")
+    try:
+        payment = payment_processors.start_payment(
+            order,
+            site_config.get_config("site_config").get("currency", "USD"),
+            return_url=url_for('user.payment', order_id=order.id, _external=True),
+            cancel_url=url_for('user.profile', _external=True),
+        )
+    except PaymentError:
+        flash("We couldn't start the payment, your stock is held for a few minutes")
+        return redirect(url_for('user.profile'))
+    if payment and payment.get("approve_url"):
+        return redirect(payment["approve_url"])
+    return redirect(url_for('user.profile'))
+
+def _open_payment(order_id: int) -> models.OrderPayment:
+    order = db.session.get(models.Order, order_id)
+    if order is None or order.user_id != current_user.id:
+        abort(404)
+    payment = next(
+        (row for row in order.get_payments()
+         if row.direction == 'IN' and row.status in payment_processors.OPEN_STATUSES),
+        None,
+    )
+    if payment is None:
+        abort(404)
+    return payment
+
+@bp.route("/orders/<int:order_id>/pay", methods=["GET"])
+@login_required
+def payment(order_id: int) -> str:
+    """Where the processor sends the buyer back after approving the payment."""
+    order_payment = _open_payment(order_id)
+    form = forms.paymentForm()
+    # Keyed on the processor's payment id: every submit for this payment is one capture
+    form.idempotency_key.data = f"capture-{order_payment.payment_id}"
+    return render_template(
+        "user/payment.html",
+        site = site_config.get_config("site_config"),
+        order = order_payment.order,
+        payment_form = form,
     )
 
+@bp.route("/orders/<int:order_id>/pay", methods=["POST"])
+@login_required
+@idempotent()
+def capture_payment(order_id: int) -> Response:
+    form = forms.paymentForm()
+    if not form.validate_on_submit():
+        flash("Your payment session expired, please try again")
+        return redirect(url_for('user.payment', order_id=order_id))
+    order_payment = _open_payment(order_id)
+    try:
+        status = payment_processors.capture_payment(order_payment, request_id=form.idempotency_key.data)
+    except PaymentError as e:
+        flash(f"Payment failed: {e}")
+        return redirect(url_for('user.profile'))
+    if status in payment_processors.PAID_STATUSES:
+        flash(f"Payment for order #{order_id} received")
+    else:
+        flash(f"Payment for order #{order_id} is being processed")
+    return redirect(url_for('user.profile'))
+
+def _quantity(value: Any) -> int | None:
+    """A cart quantity as an int of at least 1, or None. Fractions like 1.5 are rejected, not truncated."""
+    if isinstance(value, bool):
+        return None
+    try:
+        quantity = int(value)
+    except (TypeError, ValueError):
+        return None
+    if isinstance(value, float) and quantity != value:
+        return None
+    return quantity if quantity >= 1 else None
+
+
+def _is_orderable(product_id: int) -> bool:
+    return db.session.scalar(
+        select(models.Product.id)
+        .where(models.Product.id == product_id, models.Product.active.is_(True), models.Product.is_base.is_(False))
+    ) is not None
+
+
 @bp.route('/addcart', methods=['POST'])
+@rate_limit("cart", scope="user")
 def add_to_cart() -> tuple[Response, int]:
     data = request.get_json()
     if not data:
         return jsonify({'error': 'Invalid request'}), 400
-    product_id = data.get('product_id')
-    amount = data.get('amount', 1)
+    try:
+        product_id = int(data.get('product_id'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid product'}), 400
+    amount = _quantity(data.get('amount', 1))
+    if amount is None:
+        return jsonify({'error': 'Quantity must be a whole number of at least 1'}), 400
+    if not _is_orderable(product_id):
+        return jsonify({'error': 'Invalid product'}), 400
     cart_size = 0
     
     if current_user.is_authenticated:
@@ -207,25 +335,25 @@ def add_to_cart() -> tuple[Response, int]:
         db.session.commit()
         cart_size = current_user.cart_items.count()
     else:
-        if 'cart' not in session:
-            session['cart'] = []
-        session['cart'].append({'product_id': product_id, 'amount': amount})
-        session.modified = True  # Ensure session saves
-        cart_size = len(session['cart'])
+        cart_size = cart_pricing.guest_add(product_id, amount)
     
     return jsonify({'message': 'Added to cart', 'cart_size': cart_size}), 201
 
 @bp.route('/updatecart', methods=['POST'])
+@rate_limit("cart", scope="user")
 def update_cart_item() -> tuple[Response, int]:
     data = request.get_json()
     if not data:
         return jsonify({'error': 'Invalid request'}), 400
     
-    product_id = data.get('product_id')
-    quantity = data.get('quantity', 1)
+    try:
+        product_id = int(data.get('product_id'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid product'}), 400
+    quantity = _quantity(data.get('quantity', 1))
     
-    if quantity < 1:
-        return jsonify({'error': 'Quantity must be at least 1'}), 400
+    if quantity is None:
+        return jsonify({'error': 'Quantity must be a whole number of at least 1'}), 400
     
     if current_user.is_authenticated:
         cart_item = models.Cart.query.filter_by(
@@ -239,8 +367,7 @@ def update_cart_item() -> tuple[Response, int]:
         cart_item.quantity = quantity
         db.session.commit()
         
-        # Calculate updated subtotal
-        subtotal = sum(item.product.price * item.quantity for item in current_user.cart_items if item.product)
+        subtotal = cart_pricing.user_cart_subtotal(current_user.id)
         
         return jsonify({
             'message': 'Cart updated',
@@ -248,28 +375,10 @@ def update_cart_item() -> tuple[Response, int]:
             'subtotal': subtotal
         }), 200
     else:
-        if 'cart' not in session:
-            return jsonify({'error': 'Cart not found'}), 404
-        
-        # Find and update item in session cart
-        found = False
-        for item in session['cart']:
-            if item.get('product_id') == product_id:
-                item['amount'] = quantity
-                found = True
-                break
-        
-        if not found:
+        if not cart_pricing.guest_set(product_id, quantity):
             return jsonify({'error': 'Item not found in cart'}), 404
         
-        session.modified = True
-        
-        # Calculate updated subtotal
-        subtotal = 0.0
-        for entry in session['cart']:
-            product = models.Product.query.get(entry['product_id'])
-            if product:
-                subtotal += product.price * entry.get('amount', 1)
+        subtotal = cart_pricing.price_lines(cart_pricing.guest_lines())["subtotal"]
         
         return jsonify({
             'message': 'Cart updated',
@@ -283,7 +392,10 @@ def remove_cart_item() -> tuple[Response, int]:
     if not data:
         return jsonify({'error': 'Invalid request'}), 400
     
-    product_id = data.get('product_id')
+    try:
+        product_id = int(data.get('product_id'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid product'}), 400
     
     if current_user.is_authenticated:
         cart_item = models.Cart.query.filter_by(
@@ -297,27 +409,17 @@ def remove_cart_item() -> tuple[Response, int]:
         db.session.delete(cart_item)
         db.session.commit()
         
-        # Calculate updated subtotal
-        subtotal = sum(item.product.price * item.quantity for item in current_user.cart_items if item.product)
+        subtotal = cart_pricing.user_cart_subtotal(current_user.id)
         
         return jsonify({
             'message': 'Item removed from cart',
             'subtotal': subtotal
         }), 200
     else:
-        if 'cart' not in session:
-            return jsonify({'error': 'Cart not found'}), 404
-        
-        # Remove item from session cart
-        session['cart'] = [item for item in session['cart'] if item.get('product_id') != product_id]
-        session.modified = True
+        if not cart_pricing.guest_remove(product_id):
+            return jsonify({'error': 'Item not found in cart'}), 404
         
-        # Calculate updated subtotal
-        subtotal = 0.0
-        for entry in session['cart']:
-            product = models.Product.query.get(entry['product_id'])
-            if product:
-                subtotal += product.price * entry.get('amount', 1)
+        subtotal = cart_pricing.price_lines(cart_pricing.guest_lines())["subtotal"]
         
         return jsonify({
             'message': 'Item removed from cart',
@@ -0,0 +1,8 @@
+from flask import Blueprint
+from app.blueprints import register_blueprint
+
+bp = Blueprint('webhooks', __name__)
+
+from . import routes
+
+register_blueprint(bp, url_prefix='/webhooks')
@@ -0,0 +1,11 @@
+from flask import Response, jsonify, request
+
+from . import bp
+from app.processor import webhooks
+
+
+@bp.route("/<addon>", methods=["POST"])
+def receive(addon: str) -> tuple[Response, int]:
+    """Verify, dedupe and queue; everything else happens in the consumers."""
+    result, status = webhooks.ingest(addon, request.headers, request.args, request.get_data())
+    return jsonify({"status": result}), status
@@ -25,6 +25,15 @@ class Config:
     SESSION_COOKIE_SECURE = False   # overridden in prod
     PERMANENT_SESSION_LIFETIME = timedelta(minutes=60)
     REMEMBER_COOKIE_DURATION = timedelta(days=14)
+    GUEST_CART_LIFETIME = timedelta(days=14)
+    STOCK_RESERVATION_TTL = timedelta(minutes=15)  # How long checkout may hold stock during payment
+
+    BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))  # Hashes with another cost are upgraded on login
+    PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", 2))  # Concurrent bcrypt operations per process, 0 = inline
+    PASSWORD_BACKLOG = int(os.getenv("PASSWORD_BACKLOG", 32))  # Waiting operations before answering 503
+    RATE_LIMITS_ENABLED = os.getenv("RATE_LIMITS_ENABLED", "true").lower() == "true"  # Limits themselves are site config
+    SITE_URL = os.getenv("SITE_URL", "")  # Canonical base URL, e.g. https://shop.example; only its feeds are cached on disk
+    TRUSTED_PROXIES = int(os.getenv("TRUSTED_PROXIES", 0))  # Reverse proxies whose X-Forwarded-For/-Proto are believed, 0 = none
 
     LOG_LEVEL = os.getenv("LOG_LEVEL", DEFAULT_LOG_LEVEL)
     LOG_FORMAT = os.getenv("LOG_FORMAT", DEFAULT_LOG_FORMAT)
@@ -44,6 +53,7 @@ class Config:
     IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
     REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    SESSION_BACKEND = os.getenv("SESSION_BACKEND", "redis")  # "redis" or "cookie"
 
     @staticmethod
     def init_app(app: Flask) -> None:
@@ -86,6 +96,7 @@ class TestingConfig(Config):
     TESTING = True
     WTF_CSRF_ENABLED = False
     DATABASE_URI = "sqlite:///:memory:"  # in-memory for speed
+    BCRYPT_ROUNDS = 4
     SERVER_NAME = "localhost.localdomain"  # allows url_for in tests
 
 
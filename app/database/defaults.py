@@ -60,6 +60,27 @@ default_list: List[Dict[str, Any]] = [
             "description": "The 'About' page text",
         },
     },
+    {
+        "object_name": "SETUP",
+        "type": "NOT_NULL",
+        "key": "key",
+        "value": "rate_limit_login",
+        "data": {"value": "10/300", "description": "Login attempts allowed per address, as count/seconds (0 for no limit). Behind a reverse proxy set TRUSTED_PROXIES, or all visitors share one address"},
+    },
+    {
+        "object_name": "SETUP",
+        "type": "NOT_NULL",
+        "key": "key",
+        "value": "rate_limit_signup",
+        "data": {"value": "5/3600", "description": "Sign-ups allowed per address, as count/seconds (0 for no limit). Behind a reverse proxy set TRUSTED_PROXIES, or all visitors share one address"},
+    },
+    {
+        "object_name": "SETUP",
+        "type": "NOT_NULL",
+        "key": "key",
+        "value": "rate_limit_cart",
+        "data": {"value": "60/60", "description": "Cart changes allowed per customer (per address for guests), as count/seconds (0 for no limit). Behind a reverse proxy set TRUSTED_PROXIES"},
+    },
     {
         "object_name": "ADDON",
         "type": "NOT_NULL",
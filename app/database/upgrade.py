@@ -0,0 +1,60 @@
+"""
+In-place schema upgrades for existing databases.
+db.create_all() creates missing tables but never alters existing ones, so
+columns and indexes added to the models later are compared against the
+live database here and added with ALTER TABLE ADD COLUMN / CREATE INDEX.
+Nothing is dropped or changed. Run with `flask upgrade-db`; startup only
+warns when the schema is behind.
+"""
+from typing import List, Set, Tuple
+
+from sqlalchemy import Column, Index, inspect, text
+from sqlalchemy.engine import Inspector
+from sqlalchemy.schema import CreateColumn
+
+from . import db
+
+
+def _index_names(inspector: Inspector, table_name: str) -> Set[str]:
+    if db.engine.dialect.name == "sqlite":
+        # SQLite reflection skips expression indexes such as lower(email); read the catalog
+        with db.engine.connect() as connection:
+            return set(connection.scalars(
+                text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table"),
+                {"table": table_name},
+            ))
+    return {index["name"] for index in inspector.get_indexes(table_name)}
+
+
+def pending_changes() -> Tuple[List[Column], List[Index]]:
+    """Model columns and indexes missing from tables that already exist."""
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    columns: List[Column] = []
+    indexes: List[Index] = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue  # create_all() makes new tables whole
+        present = {column["name"] for column in inspector.get_columns(table.name)}
+        columns.extend(column for column in table.columns if column.name not in present)
+        index_names = _index_names(inspector, table.name)
+        indexes.extend(index for index in table.indexes if index.name not in index_names)
+    return columns, indexes
+
+
+def describe(columns: List[Column], indexes: List[Index]) -> List[str]:
+    return [f"column {column.table.name}.{column.name}" for column in columns] + [
+        f"index {index.name} on {index.table.name}" for index in indexes
+    ]
+
+
+def upgrade() -> List[str]:
+    """Add every missing column, then every missing index. Returns what was added."""
+    columns, indexes = pending_changes()
+    with db.engine.begin() as connection:
+        for column in columns:
+            ddl = CreateColumn(column).compile(dialect=connection.dialect)
+            connection.exec_driver_sql(f"ALTER TABLE {column.table.name} ADD COLUMN {ddl}")
+        for index in indexes:
+            index.create(connection)
+    return describe(columns, indexes)
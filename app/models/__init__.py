@@ -1,6 +1,9 @@
 from . import models
+from app.database import db
 from app.utils.logging import get_logger
-from typing import List
+from app.utils.user_directory import get_user_counts
+from typing import Any, Dict, List, Optional
+from sqlalchemy import and_, func, or_, select
 from sqlalchemy.orm import selectinload
 
 log = get_logger(__name__)
@@ -10,3 +13,225 @@ def get_previews(list_type: str = "ALL") -> List[models.Product]:
     if list_type == "ACTIVE":
         query = query.filter_by(active=True)
     return query.options(selectinload(models.Product.images)).all()
+
+
+# Bases sort on their stored variant range, standalone products on their own price
+LISTING_SORTS = {
+    "price_asc": func.coalesce(models.Product.min_price, models.Product.price).asc(),
+    "price_desc": func.coalesce(models.Product.max_price, models.Product.price).desc(),
+    "newest": models.Product.id.desc(),
+}
+
+def get_listing(
+    list_type: str = "ACTIVE",
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    sort: str = "newest",
+) -> List[models.Product]:
+    """
+    Storefront cards: one per base product, filtered and sorted on the stored
+    variant aggregates (indexed min_price/max_price) instead of loading every
+    variant, plus products without variants. A base matches a price filter
+    if any of its variants falls inside it.
+    """
+    is_base = and_(models.Product.is_base.is_(True), models.Product.variant_count > 0)
+    is_standalone = and_(models.Product.is_base.is_(False), models.Product.variant_of_id.is_(None))
+    query = models.Product.query.filter(or_(is_base, is_standalone))
+    if list_type == "ACTIVE":
+        query = query.filter_by(active=True)
+    if min_price is not None:
+        query = query.filter(or_(
+            and_(is_base, models.Product.max_price >= min_price),
+            and_(is_standalone, models.Product.price >= min_price),
+        ))
+    if max_price is not None:
+        query = query.filter(or_(
+            and_(is_base, models.Product.min_price <= max_price),
+            and_(is_standalone, models.Product.price <= max_price),
+        ))
+    order = LISTING_SORTS.get(sort, LISTING_SORTS["newest"])
+    return query.order_by(order).options(selectinload(models.Product.images)).all()
+
+
+def load_variant_trees(base_products: List[models.Product]) -> List[models.Product]:
+    """
+    Batch-load variants (with images) and categories for a list of base products
+    in a constant number of queries, and attach them to the objects so that
+    get_variants() / get_categories() never hit the DB per product.
+    Variants get their sibling list attached as well.
+    """
+    bases = [product for product in base_products if product.is_base]
+    if not bases:
+        return base_products
+
+    variants = (
+        models.Product.query
+        .filter(models.Product.variant_of_id.in_([base.id for base in bases]))
+        .options(selectinload(models.Product.images))
+        .order_by(models.Product.id)
+        .all()
+    )
+    variants_by_base: Dict[int, List[models.Product]] = {base.id: [] for base in bases}
+    for variant in variants:
+        variants_by_base[variant.variant_of_id].append(variant)
+
+    tree = [*bases, *variants]
+    rows = (
+        db.session.query(models.product_category.c.product_id, models.Category)
+        .join(models.Category, models.Category.id == models.product_category.c.category_id)
+        .filter(models.product_category.c.product_id.in_([product.id for product in tree]))
+        .all()
+    )
+    categories_by_product: Dict[int, List[models.Category]] = {product.id: [] for product in tree}
+    for product_id, category in rows:
+        categories_by_product[product_id].append(category)
+
+    for base in bases:
+        siblings = variants_by_base[base.id]
+        base.preload(variants=siblings, categories=categories_by_product[base.id])
+        for variant in siblings:
+            variant.preload(variants=siblings, categories=categories_by_product[variant.id])
+    return base_products
+
+
+def load_order_details(orders: List[models.Order]) -> List[models.Order]:
+    """
+    Batch-load order lines (with their products), payments and shippings for
+    a list of orders in three queries and attach them, so get_products() /
+    get_payments() / get_shipping() don't query per order.
+    """
+    if not orders:
+        return orders
+    order_ids = [order.id for order in orders]
+    products: Dict[int, List[models.OrderProduct]] = {order_id: [] for order_id in order_ids}
+    payments: Dict[int, List[models.OrderPayment]] = {order_id: [] for order_id in order_ids}
+    shippings: Dict[int, List[models.OrderShipping]] = {order_id: [] for order_id in order_ids}
+
+    for line in (
+        models.OrderProduct.query
+        .filter(models.OrderProduct.order_id.in_(order_ids))
+        .options(selectinload(models.OrderProduct.product))
+        .order_by(models.OrderProduct.id)
+    ):
+        products[line.order_id].append(line)
+    for payment in models.OrderPayment.query.filter(models.OrderPayment.order_id.in_(order_ids)).order_by(models.OrderPayment.id):
+        payments[payment.order_id].append(payment)
+    for shipping in models.OrderShipping.query.filter(models.OrderShipping.order_id.in_(order_ids)).order_by(models.OrderShipping.id):
+        shippings[shipping.order_id].append(shipping)
+
+    for order in orders:
+        order.preload(products=products[order.id], payments=payments[order.id], shippings=shippings[order.id])
+    return orders
+
+
+ORDERS_PER_PAGE = 10
+MAX_ORDERS_PER_PAGE = 50
+
+def get_order_page(user_id: int, page: int = 1, per_page: int = ORDERS_PER_PAGE) -> Dict[str, Any]:
+    """
+    One page of a user's orders, newest first, with lines, payments and
+    shippings batch-loaded. The total comes from UserOrderSummary instead
+    of a COUNT over order_table.
+    """
+    page = max(page, 1)
+    per_page = min(max(per_page, 1), MAX_ORDERS_PER_PAGE)
+    summary = db.session.get(models.UserOrderSummary, user_id)
+    orders = db.session.scalars(
+        select(models.Order)
+        .where(models.Order.user_id == user_id)
+        .order_by(models.Order.created_at.desc(), models.Order.id.desc())
+        .limit(per_page)
+        .offset((page - 1) * per_page)
+    ).all()
+    load_order_details(orders)
+    total = summary.order_count if summary else 0
+    return {
+        "orders": orders,
+        "summary": summary,
+        "page": page,
+        "per_page": per_page,
+        "total": total,
+        "pages": max((total + per_page - 1) // per_page, 1),
+    }
+
+
+USERS_PER_PAGE = 50
+MAX_USERS_PER_PAGE = 200
+USER_FIELDS = ("id", "name", "surname", "email", "phone", "role", "created_at")
+
+def _starts_with(column: Any, prefix: str) -> Any:
+    """Case-insensitive prefix match as a range on lower(column), so the lower() index is used on any backend."""
+    lowered = func.lower(column)
+    return and_(lowered >= prefix, lowered < prefix + "\uffff")
+
+def get_user_page(role: str = "CLIENT", search: str = "", page: int = 1, per_page: int = USERS_PER_PAGE) -> Dict[str, Any]:
+    """
+    One page of users with the given role, newest first, optionally narrowed
+    to an email / name / surname prefix. Rows carry USER_FIELDS only.
+    Unfiltered totals come from the cached role counts; searches fetch one
+    extra row to tell whether there is a next page instead of counting.
+    """
+    page = max(page, 1)
+    per_page = min(max(per_page, 1), MAX_USERS_PER_PAGE)
+    search = search.strip().lower()
+    counts = get_user_counts()
+    query = (
+        select(*(getattr(models.User, field) for field in USER_FIELDS))
+        .where(models.User.role == role)
+        .order_by(models.User.id.desc())
+    )
+    if search:
+        query = query.where(or_(
+            _starts_with(models.User.email, search),
+            _starts_with(models.User.name, search),
+            _starts_with(models.User.surname, search),
+        ))
+    users = db.session.execute(query.limit(per_page + 1).offset((page - 1) * per_page)).all()
+    total = None if search else counts.get(role, 0)
+    return {
+        "users": users[:per_page],
+        "counts": counts,
+        "role": role,
+        "search": search,
+        "page": page,
+        "per_page": per_page,
+        "total": total,
+        "pages": None if total is None else max((total + per_page - 1) // per_page, 1),
+        "has_next": len(users) > per_page,
+    }
+
+
+IMAGES_PER_PAGE = 48
+MAX_IMAGES_PER_PAGE = 120
+
+def get_image_page(product_id: Optional[int] = None, orphaned: bool = False, page: int = 1, per_page: int = IMAGES_PER_PAGE) -> Dict[str, Any]:
+    """
+    One page of images, newest first, with their product's name and active
+    flag. Orphaned images belong to a product that is no longer active
+    (dropped by its supplier) or no longer exists. Like get_user_page, one
+    extra row is fetched to tell whether there is a next page.
+    """
+    page = max(page, 1)
+    per_page = min(max(per_page, 1), MAX_IMAGES_PER_PAGE)
+    query = (
+        select(
+            models.Image,
+            models.Product.name.label("product_name"),
+            models.Product.active.label("product_active"),
+        )
+        .outerjoin(models.Product, models.Product.id == models.Image.product_id)
+        .order_by(models.Image.id.desc())
+    )
+    if product_id is not None:
+        query = query.where(models.Image.product_id == product_id)
+    if orphaned:
+        query = query.where(or_(models.Product.id.is_(None), models.Product.active.is_(False)))
+    images = db.session.execute(query.limit(per_page + 1).offset((page - 1) * per_page)).all()
+    return {
+        "images": images[:per_page],
+        "product_id": product_id,
+        "orphaned": orphaned,
+        "page": page,
+        "per_page": per_page,
+        "has_next": len(images) > per_page,
+    }
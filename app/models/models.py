@@ -1,22 +1,22 @@
-from flask import current_app
+from flask import current_app, g, has_app_context
 from flask_login import UserMixin
 from pathlib import Path
 from datetime import datetime
-from typing import Any, Dict, Iterator, KeysView, ValuesView, ItemsView, Optional, List
+from typing import Any, Dict, Iterable, Iterator, KeysView, ValuesView, ItemsView, Optional, List
 import json
 import string
 import keyword
 import importlib.util
 
-import bcrypt
-from sqlalchemy import Column, Integer, String, Float, Boolean, Text, DateTime, ForeignKey, CheckConstraint, UniqueConstraint, func, event
+from sqlalchemy import Column, Integer, String, Float, Boolean, Text, DateTime, ForeignKey, CheckConstraint, UniqueConstraint, Index, case, func, event, insert, select, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import relationship, backref
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.ext.declarative import declared_attr
 
 from app.database import db
 from app.utils.logging import get_logger
-from app.utils import encryption
+from app.utils import catalog, encryption, passwords
 
 log = get_logger(__name__)
 
@@ -73,15 +73,26 @@ class User(UserMixin, db.Model):
     
     __table_args__ = (
         CheckConstraint("role IN ('CLIENT', 'ADMIN')", name='check_user_role'),
+        Index('ix_user_role_id', 'role', 'id'),
+        # Case-insensitive prefix search in the admin user directory
+        Index('ix_user_email_lower', func.lower(email)),
+        Index('ix_user_name_lower', func.lower(name)),
+        Index('ix_user_surname_lower', func.lower(surname)),
     )
     
     def check_password(self, input_password: str) -> bool:
-        return bcrypt.checkpw(input_password.encode('utf-8'), self.password.encode('utf-8'))
+        """Verify, and on success move a hash stored at another bcrypt cost to the current one."""
+        if not passwords.verify_password(input_password, self.password):
+            return False
+        if passwords.needs_rehash(self.password):
+            self.password = passwords.hash_password(input_password)
+            db.session.commit()
+        return True
     
     def update_password(self, old_password: str, new_password: str) -> bool:
-        if not bcrypt.checkpw(old_password.encode(), self.password.encode()):
+        if not passwords.verify_password(old_password, self.password):
             return False
-        self.password = bcrypt.hashpw(new_password.encode(), bcrypt.gensalt()).decode()
+        self.password = passwords.hash_password(new_password)
         db.session.commit()
         return True
     
@@ -151,35 +162,129 @@ class Product(db.Model):
     created_at = Column(DateTime, default=datetime.utcnow, server_default=func.now())
     updated_at = Column(DateTime, onupdate=datetime.utcnow, server_default=func.now())
     
+    # Variant aggregates, only meaningful on base products.
+    # Maintained by refresh_variant_aggregates()
+    min_price = Column(Float, nullable=True, index=True)
+    max_price = Column(Float, nullable=True, index=True)
+    variant_count = Column(Integer, default=0, server_default='0')
+    in_stock_count = Column(Integer, default=0, server_default='0')
+    primary_image_id = Column(Integer, nullable=True)  # No FK: image_table already points back here
+    
     # Relationships
     images = relationship('Image', backref='product', lazy='selectin', cascade='all, delete-orphan', order_by='Image.position')
+    primary_image = relationship('Image', primaryjoin='foreign(Product.primary_image_id) == Image.id', viewonly=True, lazy='selectin')
     categories = relationship('Category', secondary=product_category, backref='products', lazy='dynamic')
     variants = relationship('Product', backref=backref('base_product', remote_side=[id]), lazy='dynamic')
     supplier = relationship('Addon', foreign_keys=[supplier_id], backref='supplied_products')
     payment_processor = relationship('Addon', foreign_keys=[payment_processor_id], backref='processed_products')
     
+    # Filled by models.load_variant_trees() — plain attributes, not mapped
+    _preloaded_variants = None
+    _preloaded_categories = None
+    
+    def preload(self, variants: Optional[List["Product"]] = None, categories: Optional[List["Category"]] = None) -> None:
+        if variants is not None:
+            self._preloaded_variants = variants
+        if categories is not None:
+            self._preloaded_categories = categories
     
     def get_variants(self) -> List["Product"]:
+        if self._preloaded_variants is not None:
+            return self._preloaded_variants
         base_id = self.id if self.is_base else self.variant_of_id
         return Product.query.filter_by(variant_of_id=base_id).all()
     
     def add_category(self, category: "Category") -> None:
         if category not in self.categories:
             self.categories.append(category)
+            self._preloaded_categories = None
             db.session.commit()
     
     def get_categories(self) -> List["Category"]:
+        if self._preloaded_categories is not None:
+            return self._preloaded_categories
         return self.categories.all()
     
     def delete_category(self, category: "Category") -> None:
         if category in self.categories:
             self.categories.remove(category)
+            self._preloaded_categories = None
             db.session.commit()
     
     def get_supplier(self) -> "Addon | None":
         return self.supplier
 
 
+def refresh_variant_aggregates(base_ids: Iterable[int]) -> None:
+    """
+    Recompute price range, variant/in-stock counts and primary image for the
+    given base products from their active variants. Two grouped queries and
+    one bulk UPDATE, regardless of how many bases are passed. The bases are
+    marked for catalog invalidation and everything pending in the session is
+    committed together.
+    """
+    base_ids = {int(base_id) for base_id in base_ids if base_id is not None}
+    if not base_ids:
+        return
+
+    stats = db.session.execute(
+        select(
+            Product.variant_of_id,
+            func.min(Product.price),
+            func.max(Product.price),
+            func.count(Product.id),
+            func.sum(case((Product.stock > 0, 1), else_=0)),
+        )
+        .where(Product.variant_of_id.in_(base_ids), Product.active.is_(True))
+        .group_by(Product.variant_of_id)
+    ).all()
+
+    # First image of the family: the base's own images win, then the lowest variant id
+    family_id = func.coalesce(Product.variant_of_id, Product.id)
+    ranked = (
+        select(
+            family_id.label("base_id"),
+            Image.id.label("image_id"),
+            func.row_number().over(
+                partition_by=family_id,
+                order_by=(Product.is_base.desc(), Product.id, Image.position),
+            ).label("rank"),
+        )
+        .join(Product, Product.id == Image.product_id)
+        .where(
+            (Product.id.in_(base_ids) & Product.is_base.is_(True))
+            | (Product.variant_of_id.in_(base_ids) & Product.active.is_(True))
+        )
+        .subquery()
+    )
+    primary_images = dict(
+        db.session.execute(select(ranked.c.base_id, ranked.c.image_id).where(ranked.c.rank == 1)).all()
+    )
+
+    rows = {
+        base_id: {
+            "id": base_id,
+            "min_price": None,
+            "max_price": None,
+            "variant_count": 0,
+            "in_stock_count": 0,
+            "primary_image_id": primary_images.get(base_id),
+        }
+        for base_id in base_ids
+    }
+    for base_id, min_price, max_price, variant_count, in_stock_count in stats:
+        rows[base_id].update(
+            min_price=min_price,
+            max_price=max_price,
+            variant_count=variant_count,
+            in_stock_count=in_stock_count or 0,
+        )
+    db.session.execute(update(Product), list(rows.values()))
+    catalog.mark_products_changed(base_ids)
+    db.session.commit()
+    log.debug(f"Refreshed variant aggregates for {len(rows)} base products")
+
+
 class Image(db.Model):
     __tablename__ = 'image_table'
     
@@ -191,10 +296,20 @@ class Image(db.Model):
     filename = Column(String, nullable=True)
     supplier_url = Column(String, nullable=True)
     position = Column(Integer, default=0, server_default='0')
+    # Written when the file is stored, so listings never open the files
+    thumbnail = Column(String, nullable=True)
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    byte_size = Column(Integer, nullable=True)
+    
+    __table_args__ = (
+        Index('ix_image_product_id', 'product_id'),
+    )
     
     def delete(self) -> Dict[str, str]:
         filename = self.filename
         file_path = Path(current_app.instance_path) / "images" / filename
+        thumbnail_path = Path(current_app.instance_path) / "images" / self.thumbnail if self.thumbnail else None
         product_id = self.product_id
         
         db.session.delete(self)
@@ -202,6 +317,8 @@ class Image(db.Model):
         
         reorder_images(product_id)
         
+        if thumbnail_path is not None:
+            thumbnail_path.unlink(missing_ok=True)
         try:
             if file_path.is_file():
                 file_path.unlink()
@@ -246,34 +363,60 @@ class Order(db.Model):
     payments = relationship('OrderPayment', backref='order', lazy='dynamic', cascade='all, delete-orphan')
     shippings = relationship('OrderShipping', backref='order', lazy='dynamic', cascade='all, delete-orphan')
     
+    _preloaded_products = None
+    _preloaded_payments = None
+    _preloaded_shippings = None
+    
+    def preload(
+        self,
+        products: Optional[List["OrderProduct"]] = None,
+        payments: Optional[List["OrderPayment"]] = None,
+        shippings: Optional[List["OrderShipping"]] = None,
+    ) -> None:
+        if products is not None:
+            self._preloaded_products = products
+        if payments is not None:
+            self._preloaded_payments = payments
+        if shippings is not None:
+            self._preloaded_shippings = shippings
+    
     def add_product(self, **kwargs: Any) -> "OrderProduct":
         kwargs['order_id'] = self.id
         order_product = OrderProduct(**kwargs)
         db.session.add(order_product)
+        self._preloaded_products = None
         db.session.commit()
         return order_product
     
     def get_products(self) -> List["OrderProduct"]:
+        if self._preloaded_products is not None:
+            return self._preloaded_products
         return self.order_products.all()
     
     def add_payment(self, **kwargs: Any) -> "OrderPayment":
         kwargs['order_id'] = self.id
         payment = OrderPayment(**kwargs)
         db.session.add(payment)
+        self._preloaded_payments = None
         db.session.commit()
         return payment
     
     def get_payments(self) -> List["OrderPayment"]:
+        if self._preloaded_payments is not None:
+            return self._preloaded_payments
         return self.payments.all()
     
     def add_shipping(self, **kwargs: Any) -> "OrderShipping":
         kwargs['order_id'] = self.id
         shipping = OrderShipping(**kwargs)
         db.session.add(shipping)
+        self._preloaded_shippings = None
         db.session.commit()
         return shipping
     
     def get_shipping(self) -> List["OrderShipping"]:
+        if self._preloaded_shippings is not None:
+            return self._preloaded_shippings
         return self.shippings.all()
 
 
@@ -317,6 +460,160 @@ class OrderShipping(db.Model):
     supplier = relationship('Addon', backref='order_shippings')
 
 
+class OutboxMessage(db.Model):
+    """
+    Work for external systems, written in the same transaction as the change
+    that caused it and delivered later by processor.outbox.
+    """
+    __tablename__ = 'outbox_table'
+    
+    id = Column(Integer, primary_key=True)
+    topic = Column(String, nullable=False)
+    order_id = Column(Integer, ForeignKey('order_table.id'), nullable=True, index=True)
+    addon_id = Column(Integer, ForeignKey('addon_table.id'), nullable=False)
+    payload = Column(Text, nullable=False)  # JSON
+    status = Column(String, default='PENDING', server_default='PENDING')
+    attempts = Column(Integer, default=0, server_default='0')
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, server_default=func.now())
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, server_default=func.now())
+    processed_at = Column(DateTime, nullable=True)
+    
+    addon = relationship('Addon', backref='outbox_messages')
+    
+    __table_args__ = (
+        CheckConstraint("status IN ('PENDING', 'SENDING', 'DONE', 'FAILED')", name='check_outbox_status'),
+        Index('ix_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+    
+    def data(self) -> Dict[str, Any]:
+        return json.loads(self.payload)
+
+
+class UserOrderSummary(db.Model):
+    """Per-user order stats, kept up to date by record_order() as orders are placed."""
+    __tablename__ = 'user_order_summary_table'
+    
+    user_id = Column(Integer, ForeignKey('user_table.id'), primary_key=True)
+    order_count = Column(Integer, default=0, server_default='0')
+    lifetime_spend = Column(Float, default=0.0, server_default='0.0')
+    last_order_id = Column(Integer, nullable=True)
+    last_order_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, server_default=func.now(), onupdate=datetime.utcnow)
+    
+    user = relationship('User', backref=backref('order_summary', uselist=False, cascade='all, delete-orphan'))
+
+
+def record_order(user_id: int, order_id: int, total: float, created_at: datetime) -> None:
+    """
+    Fold a new order into the user's summary inside the caller's transaction.
+    An atomic increment when the row exists; the first order inserts it, and a
+    concurrent first order falls back to the increment.
+    """
+    increment = (
+        update(UserOrderSummary)
+        .where(UserOrderSummary.user_id == user_id)
+        .values(
+            order_count=UserOrderSummary.order_count + 1,
+            lifetime_spend=UserOrderSummary.lifetime_spend + total,
+            last_order_id=order_id,
+            last_order_at=created_at,
+            updated_at=datetime.utcnow(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    if db.session.execute(increment).rowcount:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(UserOrderSummary(
+                user_id=user_id,
+                order_count=1,
+                lifetime_spend=total,
+                last_order_id=order_id,
+                last_order_at=created_at,
+            ))
+    except IntegrityError:
+        db.session.execute(increment)
+
+
+def rebuild_order_summaries(user_ids: Optional[Iterable[int]] = None) -> int:
+    """Recompute summaries from order_table (backfill / repair). Returns rows written."""
+    query = select(
+        Order.user_id,
+        func.count(Order.id),
+        func.coalesce(func.sum(Order.total), 0.0),
+        func.max(Order.id),
+        func.max(Order.created_at),
+    ).group_by(Order.user_id)
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        query = query.where(Order.user_id.in_(user_ids))
+        UserOrderSummary.query.filter(UserOrderSummary.user_id.in_(user_ids)).delete(synchronize_session=False)
+    else:
+        UserOrderSummary.query.delete(synchronize_session=False)
+    rows = [
+        {
+            "user_id": user_id,
+            "order_count": order_count,
+            "lifetime_spend": lifetime_spend,
+            "last_order_id": last_order_id,
+            "last_order_at": last_order_at,
+        }
+        for user_id, order_count, lifetime_spend, last_order_id, last_order_at in db.session.execute(query)
+    ]
+    if rows:
+        db.session.execute(insert(UserOrderSummary), rows)
+    db.session.commit()
+    return len(rows)
+
+
+class StockReservation(db.Model):
+    __tablename__ = 'stock_reservation_table'
+    
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, ForeignKey('product_table.id'), nullable=False)
+    user_id = Column(Integer, ForeignKey('user_table.id'), nullable=True)
+    order_id = Column(Integer, ForeignKey('order_table.id'), nullable=True, index=True)
+    quantity = Column(Integer, nullable=False)
+    status = Column(String, default='HELD', server_default='HELD')
+    expires_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, server_default=func.now())
+    
+    product = relationship('Product', backref='reservations')
+    
+    __table_args__ = (
+        CheckConstraint("status IN ('HELD', 'COMMITTED', 'RELEASED')", name='check_reservation_status'),
+        CheckConstraint('quantity > 0', name='check_reservation_quantity'),
+        Index('ix_reservation_status_expires', 'status', 'expires_at'),
+    )
+
+
+class ReconciliationMismatch(db.Model):
+    """
+    One discrepancy found by processor.reconciliation between OrderPayment
+    rows and what the payment processor reports. Rows of a run share run_id.
+    """
+    __tablename__ = 'reconciliation_mismatch_table'
+
+    id = Column(Integer, primary_key=True)
+    run_id = Column(String, nullable=False, index=True)
+    payment_processor_id = Column(Integer, ForeignKey('addon_table.id'), nullable=False)
+    kind = Column(String, nullable=False)
+    order_payment_id = Column(Integer, ForeignKey('order_payments.id'), nullable=True)
+    order_id = Column(Integer, nullable=True)
+    transaction_id = Column(String, nullable=True)  # ID at payment processor
+    expected = Column(String, nullable=True)        # What the processor reports
+    actual = Column(String, nullable=True)          # What we have
+    created_at = Column(DateTime, default=datetime.utcnow, server_default=func.now())
+
+    payment_processor = relationship('Addon', backref='reconciliation_mismatches')
+
+    __table_args__ = (
+        CheckConstraint("kind IN ('MISSING_LOCAL', 'MISSING_REMOTE', 'STATUS', 'AMOUNT')", name='check_mismatch_kind'),
+    )
+
+
 class Category(db.Model):
     __tablename__ = 'category_table'
     
@@ -536,15 +833,16 @@ class ConfigData(db.Model):
 
 
 class Config:
-    def __init__(self, addon_id: Optional[int] = None) -> None:
+    def __init__(self, addon_id: Optional[int] = None, rows: Optional[List[ConfigData]] = None) -> None:
+        """rows: this addon's ConfigData, when already loaded (see get_configs)."""
         self._addon_id = addon_id
         self._cache: Dict[str, ConfigData] = {}
-        self._load()
+        self._load(rows)
     
-    def _load(self) -> None:
-        if self._addon_id is None:
+    def _load(self, configs: Optional[List[ConfigData]] = None) -> None:
+        if configs is None and self._addon_id is None:
             configs = ConfigData.query.filter_by(addon_id=None).all()
-        else:
+        elif configs is None:
             configs = ConfigData.query.filter_by(addon_id=self._addon_id).all()
         if not configs:
             raise ValueError(f"Config data for {'addon_id:' + str(self._addon_id) if self._addon_id else 'site'} not found, check defaults.")
@@ -607,13 +905,35 @@ def get_config(addon_name: Optional[str] = None, addon_id: Optional[int] = None,
     
     if addon_type is not None:
         addons = Addon.query.filter_by(type=addon_type.upper()).all()
-        if not addons:
-            return []
-        return [Config(addon_id=addon.id) for addon in addons]
+        configs = get_configs(addon.id for addon in addons)
+        for addon in addons:
+            if addon.id not in configs:
+                # Same failure as loading them one by one with Config(addon_id=...)
+                raise ValueError(f"Config data for addon_id:{addon.id} not found, check defaults.")
+        return [configs[addon.id] for addon in addons]
     
     return Config()
 
 
+def get_configs(addon_ids: Iterable[int]) -> Dict[int, Config]:
+    """
+    addon id → Config for many addons, from a single ConfigData query.
+    Memoised for the request, so views and the forms they build share the
+    same Config objects. Addons without config rows are left out, for the
+    caller to skip or report; get_config() raises for them instead.
+    """
+    addon_ids = set(addon_ids)
+    memo: Dict[int, Optional[Config]] = g.setdefault("addon_configs", {}) if has_app_context() else {}
+    missing = [addon_id for addon_id in addon_ids if addon_id not in memo]
+    if missing:
+        rows: Dict[int, List[ConfigData]] = {}
+        for config_data in ConfigData.query.filter(ConfigData.addon_id.in_(missing)).order_by(ConfigData.id):
+            rows.setdefault(config_data.addon_id, []).append(config_data)
+        for addon_id in missing:
+            memo[addon_id] = Config(addon_id=addon_id, rows=rows[addon_id]) if addon_id in rows else None
+    return {addon_id: memo[addon_id] for addon_id in addon_ids if memo[addon_id] is not None}
+
+
 def set_configs() -> Dict[str, Config]:
     """Returns all front-end config settings"""
     site_config = Config()
@@ -1,6 +1,13 @@
 from app.models import models
 from .processors import check_products, save_image
 from . import manual
+from . import cart
+from . import orders
+from . import stock
+from . import outbox
+from . import payments
+from . import reconciliation
+from . import webhooks
 
 from app.utils.logging import get_logger
 
@@ -0,0 +1,260 @@
+"""
+Cart pricing shared by the cart page, the update/remove endpoints and checkout.
+Every line is resolved in one query; products already priced during the
+request are reused instead of fetched again.
+
+Guest carts live server-side in a Redis hash (product_id → quantity) keyed by
+an opaque cart id; the session only carries that id.
+"""
+import secrets
+from typing import Any, Dict, Iterable, List, Optional
+
+from flask import current_app, g, has_app_context, session
+from sqlalchemy import func, select
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.orm import selectinload
+
+from app.database import db
+from app.models import models
+from app.utils.extensions import redis_client
+from app.utils.logging import get_logger
+
+log = get_logger(__file__)
+
+GUEST_CART_PREFIX = "oshkelosh:cart:"
+
+
+def _price_cache() -> Dict[int, models.Product]:
+    """Products priced so far in this request, by id."""
+    if not has_app_context():
+        return {}
+    if "cart_prices" not in g:
+        g.cart_prices = {}
+    return g.cart_prices
+
+
+def get_products(product_ids: Iterable[int]) -> Dict[int, models.Product]:
+    """Resolve products with a single IN query, skipping ids already cached this request."""
+    cache = _price_cache()
+    wanted = {int(pid) for pid in product_ids}
+    missing = wanted - cache.keys()
+    if missing:
+        products = db.session.scalars(
+            select(models.Product)
+            .where(models.Product.id.in_(missing))
+            .options(selectinload(models.Product.images))
+        ).all()
+        cache.update({product.id: product for product in products})
+    return {pid: cache[pid] for pid in wanted if pid in cache}
+
+
+def session_lines(entries: Optional[List[Dict[str, Any]]]) -> Dict[int, int]:
+    """
+    Fold a session cart list ({'product_id', 'amount'} dicts) into product_id → amount.
+    The list came from the client, so unreadable entries and amounts below 1 are skipped.
+    """
+    lines: Dict[int, int] = {}
+    for entry in entries or []:
+        try:
+            product_id = int(entry["product_id"])
+            amount = int(entry.get("amount", 1))
+        except (AttributeError, KeyError, TypeError, ValueError):
+            continue
+        if amount < 1:
+            continue
+        lines[product_id] = lines.get(product_id, 0) + amount
+    return lines
+
+
+def _quote(rows: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    lines = []
+    subtotal = 0.0
+    for row in rows:
+        row["line_total"] = row["product"].price * row["amount"]
+        subtotal += row["line_total"]
+        lines.append(row)
+    return {"lines": lines, "subtotal": subtotal}
+
+
+def price_lines(lines: Dict[int, int]) -> Dict[str, Any]:
+    """Price a guest cart given as product_id → amount. Unknown products are dropped."""
+    products = get_products(lines.keys())
+    return _quote(
+        {"product": products[pid], "product_id": pid, "amount": amount}
+        for pid, amount in lines.items()
+        if pid in products
+    )
+
+
+def price_user_cart(user_id: int) -> Dict[str, Any]:
+    """Price a DB cart: cart rows and their products come back from one joined query."""
+    rows = db.session.execute(
+        select(models.Cart, models.Product)
+        .join(models.Product, models.Product.id == models.Cart.product_id)
+        .where(models.Cart.user_id == user_id)
+        .order_by(models.Cart.added_at, models.Cart.id)
+        .options(selectinload(models.Product.images))
+    ).all()
+    _price_cache().update({product.id: product for _, product in rows})
+    return _quote(
+        {"product": product, "product_id": product.id, "amount": item.quantity, "cart_item_id": item.id}
+        for item, product in rows
+    )
+
+
+def user_cart_subtotal(user_id: int) -> float:
+    """Subtotal only, summed in SQL — for endpoints that just report the new total."""
+    subtotal = db.session.execute(
+        select(func.coalesce(func.sum(models.Product.price * models.Cart.quantity), 0.0))
+        .select_from(models.Cart)
+        .join(models.Product, models.Product.id == models.Cart.product_id)
+        .where(models.Cart.user_id == user_id)
+    ).scalar_one()
+    return float(subtotal)
+
+
+def merge_guest_cart(user_id: int, lines: Dict[int, int]) -> int:
+    """
+    Fold guest lines into the user's DB cart as one set-based upsert on
+    unique_user_product_cart (quantities add up). Lines for products that no
+    longer exist or can't be bought (inactive, or a base product) are
+    dropped, as add-to-cart would have refused them. Returns the number of
+    lines merged.
+    """
+    lines = {pid: amount for pid, amount in lines.items() if amount > 0}
+    if not lines:
+        return 0
+    existing = db.session.scalars(
+        select(models.Product.id)
+        .where(models.Product.id.in_(lines.keys()), models.Product.active.is_(True), models.Product.is_base.is_(False))
+    ).all()
+    rows = [{"user_id": user_id, "product_id": pid, "quantity": lines[pid]} for pid in existing]
+    if not rows:
+        return 0
+
+    table = models.Cart.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.product_id],
+            set_={"quantity": table.c.quantity + stmt.excluded.quantity, "updated_at": func.now()},
+        )
+        db.session.execute(stmt, rows)
+    elif dialect in ("mysql", "mariadb"):
+        stmt = mysql.insert(table)
+        stmt = stmt.on_duplicate_key_update(
+            quantity=table.c.quantity + stmt.inserted.quantity,
+            updated_at=func.now(),
+        )
+        db.session.execute(stmt, rows)
+    else:
+        # No native upsert: one read of the affected rows, then update/insert in one flush
+        current = {
+            item.product_id: item
+            for item in models.Cart.query.filter(
+                models.Cart.user_id == user_id,
+                models.Cart.product_id.in_(lines.keys()),
+            )
+        }
+        for row in rows:
+            if row["product_id"] in current:
+                current[row["product_id"]].quantity += row["quantity"]
+            else:
+                db.session.add(models.Cart(**row))
+    db.session.commit()
+    return len(rows)
+
+
+# ----------------------------------------------------------------------
+# Guest cart storage
+# ----------------------------------------------------------------------
+def _guest_key(create: bool = False) -> Optional[str]:
+    cart_id = session.get('cart_id')
+    if cart_id is None and create:
+        cart_id = secrets.token_urlsafe(16)
+        session['cart_id'] = cart_id
+    return f"{GUEST_CART_PREFIX}{cart_id}" if cart_id else None
+
+
+def _guest_ttl() -> int:
+    return int(current_app.config["GUEST_CART_LIFETIME"].total_seconds())
+
+
+def migrate_session_cart() -> None:
+    """Move a legacy cookie cart (list of {'product_id', 'amount'}) into Redis."""
+    if 'cart' not in session:
+        return
+    lines = session_lines(session.pop('cart'))
+    if not lines:
+        return
+    key = _guest_key(create=True)
+    pipe = redis_client.client.pipeline()
+    for product_id, amount in lines.items():
+        pipe.hincrby(key, product_id, amount)
+    pipe.expire(key, _guest_ttl())
+    pipe.execute()
+    log.debug(f"Migrated {len(lines)} cookie cart lines to Redis")
+
+
+def guest_lines() -> Dict[int, int]:
+    """product_id → quantity for the current guest."""
+    migrate_session_cart()
+    key = _guest_key()
+    if key is None:
+        return {}
+    return {int(pid): int(qty) for pid, qty in redis_client.client.hgetall(key).items()}
+
+
+def guest_add(product_id: int, amount: int) -> int:
+    """Atomically add `amount` of a product. Returns the number of distinct lines."""
+    migrate_session_cart()
+    key = _guest_key(create=True)
+    pipe = redis_client.client.pipeline()
+    pipe.hincrby(key, product_id, amount)
+    pipe.expire(key, _guest_ttl())
+    pipe.hlen(key)
+    return int(pipe.execute()[-1])
+
+
+def guest_set(product_id: int, quantity: int) -> bool:
+    """Set a line's quantity. False if the product is not in the cart."""
+    migrate_session_cart()
+    key = _guest_key()
+    if key is None:
+        return False
+    ttl = _guest_ttl()
+
+    def set_if_present(pipe: Any) -> bool:
+        # WATCH/MULTI: a concurrent remove between the check and the write retries instead of resurrecting the line
+        if not pipe.hexists(key, product_id):
+            return False
+        pipe.multi()
+        pipe.hset(key, product_id, quantity)
+        pipe.expire(key, ttl)
+        return True
+
+    return bool(redis_client.client.transaction(set_if_present, key, value_from_callable=True))
+
+
+def guest_remove(product_id: int) -> bool:
+    """Drop a line. False if the product was not in the cart."""
+    migrate_session_cart()
+    key = _guest_key()
+    if key is None:
+        return False
+    return bool(redis_client.client.hdel(key, product_id))
+
+
+def guest_size() -> int:
+    key = _guest_key()
+    return int(redis_client.client.hlen(key)) if key else 0
+
+
+def clear_guest_cart() -> None:
+    key = _guest_key()
+    session.pop('cart_id', None)
+    session.pop('cart', None)
+    if key is not None:
+        redis_client.client.delete(key)
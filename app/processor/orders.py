@@ -0,0 +1,218 @@
+"""
+Order creation from a priced cart.
+The order, all its lines and the initial payment/shipping rows are written in
+one transaction with bulk INSERTs, so a failure never leaves a half-built
+order behind and a large cart costs a fixed number of statements.
+"""
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, insert, select, update
+
+from app.database import db
+from app.models import models, load_order_details
+from app.utils.logging import get_logger
+
+log = get_logger(__file__)
+
+
+def queue_supplier_orders(order_ids: List[int]) -> None:
+    """
+    Queue one SUBMIT_ORDER outbox message per API supplier in each order
+    (manual suppliers ship by hand). Called by payments.settle once the
+    orders are paid, in its transaction; orders that already have messages
+    are skipped, so a repeated settlement doesn't submit them twice.
+    """
+    if not order_ids:
+        return
+    queued = set(db.session.scalars(
+        select(models.OutboxMessage.order_id)
+        .where(models.OutboxMessage.order_id.in_(order_ids), models.OutboxMessage.topic == 'SUBMIT_ORDER')
+    ))
+    order_ids = [order_id for order_id in order_ids if order_id not in queued]
+    if not order_ids:
+        return
+    lines = db.session.execute(
+        select(
+            models.OrderProduct.order_id,
+            models.OrderProduct.product_id,
+            models.OrderProduct.amount,
+            models.OrderProduct.price,
+            models.Product.supplier_id,
+            models.Product.product_id.label("external_id"),
+        )
+        .join(models.Product, models.Product.id == models.OrderProduct.product_id)
+        .where(models.OrderProduct.order_id.in_(order_ids))
+        .order_by(models.OrderProduct.id)
+    ).all()
+
+    # Manual suppliers are stored as type SUPPLIER too; their config carries the "manual" key
+    supplier_ids = set(db.session.scalars(
+        select(models.Addon.id)
+        .where(models.Addon.id.in_({line.supplier_id for line in lines}), models.Addon.type == 'SUPPLIER')
+    ))
+    configs = models.get_configs(supplier_ids)
+    api_suppliers = {
+        supplier_id for supplier_id in supplier_ids
+        if supplier_id in configs and "manual" not in configs[supplier_id]
+    }
+    if not api_suppliers:
+        return
+
+    recipients: Dict[int, Optional[Dict[str, Any]]] = {}
+    for row in db.session.execute(
+        select(models.Order.id, models.User.name, models.User.surname, models.Address)
+        .join(models.User, models.User.id == models.Order.user_id)
+        .outerjoin(models.Address, (models.Address.user_id == models.Order.user_id) & (models.Address.type == 'SHIPPING'))
+        .where(models.Order.id.in_(order_ids))
+        .order_by(models.Order.id, models.Address.id)
+    ):
+        address = row.Address
+        recipients.setdefault(row.id, {
+            "name": f"{row.name} {row.surname}",
+            "street": address.street,
+            "city": address.city,
+            "state": address.state,
+            "postal_code": address.postal_code,
+            "country": address.country,
+        } if address else None)
+
+    items: Dict[Tuple[int, int], List[Dict[str, Any]]] = {}
+    for line in lines:
+        if line.supplier_id in api_suppliers:
+            items.setdefault((line.order_id, line.supplier_id), []).append({
+                "product_id": line.product_id,
+                "external_id": line.external_id,
+                "quantity": line.amount,
+                "price": line.price,
+            })
+    if not items:
+        return
+    db.session.execute(insert(models.OutboxMessage), [
+        {
+            "topic": "SUBMIT_ORDER",
+            "order_id": order_id,
+            "addon_id": supplier_id,
+            "payload": json.dumps({
+                "order_id": order_id,
+                "recipient": recipients.get(order_id),
+                "items": order_items,
+            }),
+        }
+        for (order_id, supplier_id), order_items in sorted(items.items())
+    ])
+
+
+def build_order(
+    user_id: int,
+    quote: Dict[str, Any],
+    shipping: Optional[Dict[int, float]] = None,
+    payment: Optional[Dict[str, Any]] = None,
+    tax: float = 0.0,
+    other: float = 0.0,
+    clear_cart: bool = True,
+    reservations: Optional[List[int]] = None,
+) -> models.Order:
+    """
+    Create an order from a cart quote (see cart.price_user_cart / price_lines).
+
+    shipping maps supplier_id → cost; one OrderShipping row is written for
+    every supplier in the cart (cost 0.0 if not quoted).
+    payment is the payment intent: payment_processor_id and payment_id, with
+    optional status and reference_id (defaults to the order id).
+    With clear_cart the user's DB cart rows are removed in the same transaction.
+    reservations are stock.reserve() ids to link to the new order.
+    Orders for API suppliers are queued in the outbox once payment settles
+    (see queue_supplier_orders) and submitted later by processor.outbox.
+
+    Returns the committed order with lines, payments and shippings attached.
+    """
+    lines = quote["lines"]
+    if not lines:
+        raise ValueError("Cannot create an order from an empty cart")
+    shipping = shipping or {}
+    supplier_ids = sorted({line["product"].supplier_id for line in lines})
+    shipping_cost = sum(shipping.get(supplier_id, 0.0) for supplier_id in supplier_ids)
+
+    try:
+        order = models.Order(
+            user_id=user_id,
+            shipping_cost=shipping_cost,
+            tax=tax,
+            other=other,
+            total=quote["subtotal"] + shipping_cost + tax + other,
+        )
+        db.session.add(order)
+        db.session.flush()
+        order_id = order.id
+
+        db.session.execute(insert(models.OrderProduct), [
+            {
+                "order_id": order_id,
+                "product_id": line["product_id"],
+                "amount": line["amount"],
+                "price": line["product"].price,
+            }
+            for line in lines
+        ])
+        db.session.execute(insert(models.OrderShipping), [
+            {"order_id": order_id, "supplier_id": supplier_id, "cost": shipping.get(supplier_id, 0.0)}
+            for supplier_id in supplier_ids
+        ])
+        if payment:
+            db.session.execute(insert(models.OrderPayment), [{
+                "order_id": order_id,
+                "payment_processor_id": payment["payment_processor_id"],
+                "payment_id": payment["payment_id"],
+                "reference_id": payment.get("reference_id", order_id),
+                "direction": "IN",
+                "status": payment.get("status", "CREATED"),
+            }])
+        models.record_order(user_id, order_id, order.total, order.created_at)
+        if reservations:
+            db.session.execute(
+                update(models.StockReservation)
+                .where(models.StockReservation.id.in_(reservations))
+                .values(order_id=order_id)
+                .execution_options(synchronize_session=False)
+            )
+        if clear_cart:
+            db.session.execute(
+                delete(models.Cart)
+                .where(models.Cart.user_id == user_id, models.Cart.product_id.in_([line["product_id"] for line in lines]))
+            )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        log.error(f"Failed creating order for user {user_id}")
+        raise
+
+    log.debug(f"Created order {order_id} with {len(lines)} lines")
+    return load_order_details([db.session.get(models.Order, order_id)])[0]
+
+
+def order_summary(order: models.Order) -> Dict[str, Any]:
+    """JSON-ready view of an order; expects load_order_details() to have run."""
+    return {
+        "id": order.id,
+        "status": order.status,
+        "total": order.total,
+        "shipping_cost": order.shipping_cost,
+        "tax": order.tax,
+        "created_at": order.created_at.isoformat() if order.created_at else None,
+        "lines": [
+            {
+                "product_id": line.product_id,
+                "name": line.product.name if line.product else None,
+                "amount": line.amount,
+                "price": line.price,
+                "status": line.status,
+            }
+            for line in order.get_products()
+        ],
+        "shipping": [
+            {"supplier_id": shipping.supplier_id, "cost": shipping.cost, "status": shipping.status}
+            for shipping in order.get_shipping()
+        ],
+        "payments": [payment.status for payment in order.get_payments()],
+    }
@@ -0,0 +1,139 @@
+"""
+Outbox dispatcher: delivers OutboxMessage rows written when orders are paid.
+Messages are claimed in batches with a lease (so several dispatchers can run
+and a crashed one's batch is picked up again), sent through the supplier
+addon's rate-limited session, and retried with exponential backoff.
+Results are written back to the outbox and OrderShipping in one commit per batch.
+"""
+import importlib
+import random
+from datetime import datetime, timedelta
+from types import ModuleType
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+from sqlalchemy import bindparam, select, update
+
+from app.database import db
+from app.models import models
+from app.utils.logging import get_logger
+
+log = get_logger(__file__)
+
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 30     # seconds before the first retry, doubled on every attempt
+BACKOFF_CAP = 3600
+LEASE = 300           # seconds a claimed message stays hidden from other dispatchers
+
+# HTTP statuses worth retrying; any other 4xx means the request itself is wrong
+RETRY_STATUSES = {408, 425, 429}
+
+
+def _backoff(attempts: int) -> timedelta:
+    delay = min(BACKOFF_CAP, BACKOFF_BASE * 2 ** (attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+def _is_permanent(error: Exception) -> bool:
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return 400 <= status < 500 and status not in RETRY_STATUSES
+    return isinstance(error, (KeyError, ValueError, TypeError, AttributeError))
+
+
+def _claim(batch_size: int) -> List[models.OutboxMessage]:
+    now = datetime.utcnow()
+    claimable = (
+        models.OutboxMessage.status.in_(['PENDING', 'SENDING']),
+        models.OutboxMessage.next_attempt_at <= now,
+    )
+    candidates = db.session.scalars(
+        select(models.OutboxMessage.id)
+        .where(*claimable)
+        .order_by(models.OutboxMessage.next_attempt_at, models.OutboxMessage.id)
+        .limit(batch_size)
+    ).all()
+    claimed = [
+        message_id for message_id in candidates
+        if db.session.execute(
+            update(models.OutboxMessage)
+            .where(models.OutboxMessage.id == message_id, *claimable)
+            .values(status='SENDING', next_attempt_at=now + timedelta(seconds=LEASE))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+    ]
+    db.session.commit()
+    if not claimed:
+        return []
+    return models.OutboxMessage.query.filter(models.OutboxMessage.id.in_(claimed)).order_by(models.OutboxMessage.id).all()
+
+
+def _load_handler(addon: models.Addon) -> Tuple[Optional[ModuleType], Dict[str, Any]]:
+    try:
+        module = importlib.import_module(f'app.addons.suppliers.{addon.name}')
+    except ImportError as e:
+        log.warning(f"Failed importing supplier addon {addon.name}: {e}")
+        return None, {}
+    return module, models.get_config(addon_id=addon.id).data()
+
+
+def dispatch_pending(batch_size: int = BATCH_SIZE) -> Dict[str, int]:
+    """Send one batch of due messages. Returns counts per outcome."""
+    counts = {"sent": 0, "retry": 0, "failed": 0}
+    messages = _claim(batch_size)
+    if not messages:
+        return counts
+
+    handlers: Dict[int, Tuple[Optional[ModuleType], Dict[str, Any]]] = {}
+    message_rows: List[Dict[str, Any]] = []
+    shipping_rows: List[Dict[str, Any]] = []
+    for message in messages:
+        if message.addon_id not in handlers:
+            handlers[message.addon_id] = _load_handler(message.addon)
+        module, config_data = handlers[message.addon_id]
+        attempts = message.attempts + 1
+        now = datetime.utcnow()
+        try:
+            submit = getattr(module, 'submit_order', None)
+            if message.topic != 'SUBMIT_ORDER' or submit is None:
+                raise ValueError(f"No handler for {message.topic} on addon {message.addon.name}")
+            result = submit(config_data, message.data())
+        except Exception as e:
+            if _is_permanent(e) or attempts >= MAX_ATTEMPTS:
+                log.error(f"Outbox message {message.id} failed after {attempts} attempts: {e}")
+                message_rows.append({"id": message.id, "status": 'FAILED', "attempts": attempts, "last_error": str(e), "processed_at": now})
+                shipping_rows.append({"o_id": message.order_id, "s_id": message.addon_id, "new_status": 'FAILED'})
+                counts["failed"] += 1
+            else:
+                log.warning(f"Outbox message {message.id} attempt {attempts} failed, retrying: {e}")
+                message_rows.append({"id": message.id, "status": 'PENDING', "attempts": attempts, "last_error": str(e), "next_attempt_at": now + _backoff(attempts)})
+                counts["retry"] += 1
+            continue
+        log.info(f"Submitted order {message.order_id} to {message.addon.name}: {result}")
+        message_rows.append({"id": message.id, "status": 'DONE', "attempts": attempts, "last_error": None, "processed_at": now})
+        shipping_rows.append({"o_id": message.order_id, "s_id": message.addon_id, "new_status": 'SUBMITTED'})
+        counts["sent"] += 1
+
+    db.session.execute(update(models.OutboxMessage), message_rows)
+    if shipping_rows:
+        shipping = models.OrderShipping.__table__
+        db.session.execute(
+            update(shipping)
+            .where(shipping.c.order_id == bindparam('o_id'), shipping.c.supplier_id == bindparam('s_id'))
+            .values(status=bindparam('new_status')),
+            shipping_rows,
+        )
+    db.session.commit()
+    return counts
+
+
+def drain(batch_size: int = BATCH_SIZE) -> Dict[str, int]:
+    """Dispatch batches until nothing is due."""
+    totals = {"sent": 0, "retry": 0, "failed": 0}
+    while True:
+        counts = dispatch_pending(batch_size)
+        for key, value in counts.items():
+            totals[key] += value
+        if not any(counts.values()):
+            return totals
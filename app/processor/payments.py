@@ -0,0 +1,291 @@
+"""
+Payment processors.
+Every PAYMENT addon exposes `processor`, a PaymentProcessor subclass; the
+core only talks to processors through this interface and the registry below.
+
+Open OrderPayment rows are polled per processor with one bulk_status call
+per batch instead of one lookup per payment.
+"""
+import importlib
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import ColumnElement, bindparam, case, select, update
+
+from app.database import db
+from app.models import models
+from app.utils.exceptions import PaymentError
+from app.utils.logging import get_logger
+
+log = get_logger(__file__)
+
+OPEN_STATUSES = ('CREATED', 'APPROVED', 'PENDING')
+PAID_STATUSES = ('COMPLETED',)
+FAILED_STATUSES = ('DENIED', 'VOIDED', 'DECLINED', 'FAILED')
+# Payment statuses only move forward: a late APPROVED/PENDING never replaces
+# COMPLETED, and an outcome is only replaced by a refund or reversal
+PAYMENT_STATUS_RANK = {
+    'CREATED': 1, 'APPROVED': 2, 'PENDING': 3,
+    'COMPLETED': 4, 'DENIED': 4, 'VOIDED': 4, 'DECLINED': 4, 'FAILED': 4,
+    'REFUNDED': 5, 'REVERSED': 5,
+}
+
+
+def status_rank(status: Optional[str]) -> int:
+    """Precedence of a payment status; unknown statuses rank lowest."""
+    return PAYMENT_STATUS_RANK.get(status or "", 0)
+
+
+def advances(status_column: Any) -> ColumnElement[bool]:
+    """
+    WHERE clause for bulk payment status UPDATEs: the stored status ranks
+    below the new one, bound per row as b_rank.
+    """
+    return case(PAYMENT_STATUS_RANK, value=status_column, else_=0) < bindparam("b_rank")
+
+
+# Order status a settlement moves to → statuses it may move from. A failed
+# order can still be paid by a later payment; nothing leaves PAID this way.
+SETTLE_FROM = {
+    'PAID': ('PENDING', 'PAYMENT_FAILED'),
+    'PAYMENT_FAILED': ('PENDING',),
+}
+PROCESSOR_TTL = 60   # seconds processor instances (and their config) stay cached in-process
+POLL_BATCH_SIZE = 500
+
+
+class PaymentProcessor(ABC):
+    """
+    Contract for payment addons. Statuses use the OrderPayment vocabulary:
+    CREATED, APPROVED, PENDING, COMPLETED, DENIED, VOIDED, REFUNDED, REVERSED.
+    Processors raise PaymentError for declined or failed operations.
+    """
+
+    def __init__(self, addon_id: int, config: Dict[str, Any]) -> None:
+        self.addon_id = addon_id
+        self.config = config
+
+    @abstractmethod
+    def create(self, order: models.Order, currency: str, return_url: str, cancel_url: str) -> Dict[str, Any]:
+        """Start a payment for the order. Returns payment_id, status and, if the buyer must approve it, approve_url."""
+
+    @abstractmethod
+    def capture(self, payment_id: str, request_id: Optional[str] = None) -> Dict[str, Any]:
+        """Collect an approved payment. Returns status (and capture_id if the processor has one)."""
+
+    @abstractmethod
+    def refund(self, payment_id: str, amount: Optional[float] = None, currency: Optional[str] = None, request_id: Optional[str] = None) -> Dict[str, Any]:
+        """Refund a captured payment, fully or by amount. Returns refund_id and status."""
+
+    @abstractmethod
+    def bulk_status(self, payments: List[Dict[str, Any]]) -> Dict[str, str]:
+        """
+        Current status for many payments at once. Each entry has payment_id,
+        order_id and created_at. Returns payment_id → status for the payments
+        the processor reports on; missing ids are left as they are.
+        """
+
+    @abstractmethod
+    def transactions(self, start: datetime, end: datetime) -> Iterator[Dict[str, Any]]:
+        """
+        Stream the processor's settled transactions between start and end
+        (UTC), fetching page by page. Each has transaction_id, kind (PAYMENT or
+        REFUND), status, amount, currency and whichever of payment_id /
+        order_id the processor knows.
+        """
+
+
+# addon id → (expires, processor)
+_processors: Dict[int, Tuple[float, PaymentProcessor]] = {}
+
+
+def get_processor(addon_id: int) -> PaymentProcessor:
+    cached = _processors.get(addon_id)
+    if cached and cached[0] > time.time():
+        return cached[1]
+    addon = db.session.get(models.Addon, addon_id)
+    if addon is None or addon.type != 'PAYMENT':
+        raise PaymentError(f"No payment processor with id {addon_id}")
+    try:
+        module = importlib.import_module(f"app.addons.payments.{addon.name}")
+        processor_class = getattr(module, "processor")
+    except (ImportError, AttributeError) as e:
+        raise PaymentError(f"Payment addon {addon.name} has no processor: {e}") from e
+    processor = processor_class(addon.id, models.get_config(addon_id=addon.id).data())
+    _processors[addon_id] = (time.time() + PROCESSOR_TTL, processor)
+    return processor
+
+
+def default_processor() -> Optional[PaymentProcessor]:
+    """The active payment addon used for checkout, if any."""
+    addon = models.Addon.query.filter_by(type='PAYMENT', active=True).order_by(models.Addon.id).first()
+    return get_processor(addon.id) if addon else None
+
+
+# ----------------------------------------------------------------------
+# Order effects of payment outcomes
+# ----------------------------------------------------------------------
+def settle(order_statuses: Dict[int, str]) -> None:
+    """
+    Apply payment outcomes to orders: paid orders keep their reserved stock
+    and become PAID, and their supplier orders are queued in the outbox in
+    the same transaction; failed ones give the stock back and become
+    PAYMENT_FAILED. Only orders in a state that allows the move change (see
+    SETTLE_FROM), so a late or repeated result can't undo a settled or
+    cancelled order; stock follows the orders that actually changed.
+    """
+    from . import orders, stock
+
+    changed: Dict[str, List[int]] = {}
+    for status, outcomes in (('PAID', PAID_STATUSES), ('PAYMENT_FAILED', FAILED_STATUSES)):
+        order_ids = [order_id for order_id, outcome in order_statuses.items() if outcome in outcomes]
+        if not order_ids:
+            continue
+        allowed = models.Order.status.in_(SETTLE_FROM[status])
+        changed[status] = list(db.session.scalars(
+            select(models.Order.id).where(models.Order.id.in_(order_ids), allowed).with_for_update()
+        ))
+        if changed[status]:
+            db.session.execute(
+                update(models.Order)
+                .where(models.Order.id.in_(changed[status]), allowed)
+                .values(status=status)
+                .execution_options(synchronize_session=False)
+            )
+        ignored = set(order_ids) - set(changed[status])
+        if ignored:
+            log.info(f"Not moving orders {sorted(ignored)} to {status}: already settled or cancelled")
+    paid, failed = changed.get('PAID', []), changed.get('PAYMENT_FAILED', [])
+    if not paid and not failed:
+        db.session.commit()
+        return
+    reservations = db.session.execute(
+        select(models.StockReservation.id, models.StockReservation.order_id)
+        .where(models.StockReservation.order_id.in_(paid + failed))
+    ).all()
+    orders.queue_supplier_orders(paid)
+    db.session.commit()
+    stock.commit_reservations([rid for rid, order_id in reservations if order_id in paid])
+    stock.release([rid for rid, order_id in reservations if order_id in failed])
+
+
+def start_payment(order: models.Order, currency: str, return_url: str, cancel_url: str) -> Optional[Dict[str, Any]]:
+    """Create the payment with the default processor and record it. None if no processor is set up."""
+    processor = default_processor()
+    if processor is None:
+        return None
+    try:
+        result = processor.create(order, currency, return_url, cancel_url)
+    except PaymentError:
+        raise
+    except Exception as e:
+        log.error(f"Failed creating payment for order {order.id}: {e}")
+        raise PaymentError() from e
+    order.add_payment(
+        payment_processor_id=processor.addon_id,
+        payment_id=result["payment_id"],
+        reference_id=order.id,
+        direction='IN',
+        status=result["status"],
+    )
+    return result
+
+
+def capture_payment(payment: models.OrderPayment, request_id: Optional[str] = None) -> str:
+    """Capture a recorded payment and settle its order. Returns the new status."""
+    try:
+        result = get_processor(payment.payment_processor_id).capture(payment.payment_id, request_id=request_id)
+    except PaymentError:
+        raise
+    except Exception as e:
+        log.error(f"Failed capturing payment {payment.payment_id}: {e}")
+        raise PaymentError() from e
+    payment.status = result["status"]
+    order_id = payment.order_id
+    db.session.commit()
+    settle({order_id: result["status"]})
+    return result["status"]
+
+
+def refund_payment(payment: models.OrderPayment, amount: Optional[float] = None, currency: Optional[str] = None) -> models.OrderPayment:
+    """Refund a captured payment and record it as an outgoing OrderPayment."""
+    result = get_processor(payment.payment_processor_id).refund(payment.payment_id, amount=amount, currency=currency)
+    order = db.session.get(models.Order, payment.order_id)
+    return order.add_payment(
+        payment_processor_id=payment.payment_processor_id,
+        payment_id=result["refund_id"],
+        reference_id=payment.id,
+        direction='OUT',
+        status=result["status"],
+    )
+
+
+# ----------------------------------------------------------------------
+# Batched status polling
+# ----------------------------------------------------------------------
+def poll_open_payments(batch_size: int = POLL_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Refresh every open incoming payment: one bulk_status call per processor
+    per batch, one executemany UPDATE and commit per batch. Returns counts.
+    """
+    counts = {"checked": 0, "changed": 0}
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(
+                models.OrderPayment.id,
+                models.OrderPayment.payment_processor_id,
+                models.OrderPayment.payment_id,
+                models.OrderPayment.order_id,
+                models.OrderPayment.status,
+                models.Order.created_at,
+            )
+            .join(models.Order, models.Order.id == models.OrderPayment.order_id)
+            .where(
+                models.OrderPayment.direction == 'IN',
+                models.OrderPayment.status.in_(OPEN_STATUSES),
+                models.OrderPayment.id > last_id,
+            )
+            .order_by(models.OrderPayment.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return counts
+        last_id = rows[-1].id
+        counts["checked"] += len(rows)
+
+        by_processor: Dict[int, List[Any]] = {}
+        for row in rows:
+            by_processor.setdefault(row.payment_processor_id, []).append(row)
+
+        changes: List[Dict[str, Any]] = []
+        order_statuses: Dict[int, str] = {}
+        for processor_id, group in by_processor.items():
+            try:
+                statuses = get_processor(processor_id).bulk_status([
+                    {"payment_id": row.payment_id, "order_id": row.order_id, "created_at": row.created_at or datetime.utcnow()}
+                    for row in group
+                ])
+            except Exception as e:
+                log.error(f"Status poll failed for payment processor {processor_id}: {e}")
+                continue
+            for row in group:
+                status = statuses.get(row.payment_id)
+                if status and status_rank(status) > status_rank(row.status):
+                    changes.append({"b_id": row.id, "b_status": status, "b_rank": status_rank(status)})
+                    order_statuses[row.order_id] = status
+
+        if changes:
+            payments = models.OrderPayment.__table__
+            db.session.execute(
+                # A webhook may have moved the payment on since it was read
+                update(payments)
+                .where(payments.c.id == bindparam("b_id"), advances(payments.c.status))
+                .values(status=bindparam("b_status")),
+                changes,
+            )
+            db.session.commit()
+            settle(order_statuses)
+            counts["changed"] += len(changes)
@@ -64,6 +64,8 @@ def check_products(product_data: List[Dict[str, Any]], supplier_id: int, addon_s
             if str(product.product_id) not in ids_in_data:
                 product.active = False
         db.session.commit()
+
+        models.refresh_variant_aggregates(product.id for product in db_products if product.is_base)
     except Exception as e:
         log.error(f"Exception during check_products: {e}")
         db.session.rollback()
@@ -85,8 +87,8 @@ def check_images(image_list: List[Dict[str, Any]], product_id: int) -> None:
                 db.session.add(db_image)
                 db.session.flush()  # Get the ID
                 base_name = f"productimage_{db_image.product_id}_{db_image.id}"
-                filename = download_image(db_image.supplier_url, base_name)
-                db_image.filename = filename
+                for key, value in download_image(db_image.supplier_url, base_name).items():
+                    setattr(db_image, key, value)
                 db_image.position = len(product_image_list) + 1
                 db.session.commit()
 
@@ -98,7 +100,69 @@ def check_images(image_list: List[Dict[str, Any]], product_id: int) -> None:
 
 # ALLOWED_EXTENSIONS will be accessed via current_app.config.get() when needed
 
-def download_image(url: str, base_filename: str) -> str:
+IMAGE_MAX_SIZE = 1000
+THUMBNAIL_SIZE = 240
+THUMBNAIL_PREFIX = "thumb_"
+
+
+def _save_kwargs(ext: str) -> Dict[str, Any]:
+    """Format-specific options (compression/quality)."""
+    if ext in {'jpg', 'jpeg'}:
+        return {'quality': 85, 'optimize': True}  # Balanced compression
+    if ext == 'png':
+        return {'optimize': True, 'compress_level': 6}  # Moderate compression
+    if ext == 'webp':
+        return {'quality': 80}  # Lossy compression
+    if ext == 'gif':
+        return {'optimize': True}
+    return {}
+
+
+def _pil_format(ext: str) -> str:
+    return "JPEG" if ext in {'jpg', 'jpeg'} else ext.upper()
+
+
+def _save(img: PilImage.Image, path: pathlib.Path, ext: str) -> None:
+    if _pil_format(ext) == "JPEG" and img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    img.save(path, format=_pil_format(ext), **_save_kwargs(ext))
+
+
+def _save_thumbnail(img: PilImage.Image, save_dir: pathlib.Path, filename: str) -> str:
+    thumbnail = f"{THUMBNAIL_PREFIX}{filename}"
+    thumb = img.copy()
+    thumb.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), PilImage.Resampling.LANCZOS)
+    _save(thumb, save_dir / thumbnail, filename.rsplit('.', 1)[-1].lower())
+    return thumbnail
+
+
+def store_image(img: PilImage.Image, filename: str) -> Dict[str, Any]:
+    """
+    Save img under instance/images as filename, resized to fit within
+    IMAGE_MAX_SIZE, plus a THUMBNAIL_SIZE thumbnail for listings. Returns the
+    Image metadata columns: filename, thumbnail, width, height, byte_size.
+    """
+    save_dir = pathlib.Path(current_app.instance_path) / "images"
+    save_dir.mkdir(parents=True, exist_ok=True)
+
+    # Resize to fit within IMAGE_MAX_SIZE x IMAGE_MAX_SIZE while preserving aspect ratio
+    if img.width > IMAGE_MAX_SIZE or img.height > IMAGE_MAX_SIZE:
+        ratio = min(IMAGE_MAX_SIZE / img.width, IMAGE_MAX_SIZE / img.height)
+        img = img.resize((int(img.width * ratio), int(img.height * ratio)), PilImage.Resampling.LANCZOS)
+    file_path = save_dir / filename
+    _save(img, file_path, filename.rsplit('.', 1)[-1].lower())
+
+    return {
+        "filename": filename,
+        "thumbnail": _save_thumbnail(img, save_dir, filename),
+        "width": img.width,
+        "height": img.height,
+        "byte_size": file_path.stat().st_size,
+    }
+
+
+def download_image(url: str, base_filename: str) -> Dict[str, Any]:
+    """Download a supplier image and store it (see store_image). Returns the stored image's metadata."""
     save_dir = pathlib.Path(current_app.instance_path) / "images"
     save_dir.mkdir(parents=True, exist_ok=True)
 
@@ -129,38 +193,15 @@ def download_image(url: str, base_filename: str) -> str:
                 if chunk:
                     file.write(chunk)
     try:
-        img = PilImage.open(str(save_path))
-        
-        # Resize to fit within 1000x1000 while preserving aspect ratio
-        max_size = 1000
-        if img.width > max_size or img.height > max_size:
-            ratio = min(max_size / img.width, max_size / img.height)
-            new_size = (int(img.width * ratio), int(img.height * ratio))
-            img = img.resize(new_size, PilImage.Resampling.LANCZOS)  # High-quality resampling
-        
-        # Format-specific options (compression/quality)
-        save_kwargs = {}
-        if ext in {'jpg', 'jpeg'}:
-            save_kwargs['quality'] = 85  # Balanced compression
-            save_kwargs['optimize'] = True
-        elif ext == 'png':
-            save_kwargs['optimize'] = True
-            save_kwargs['compress_level'] = 6  # Moderate compression
-        elif ext == 'webp':
-            save_kwargs['quality'] = 80  # Lossy compression
-        elif ext == 'gif':
-            save_kwargs['optimize'] = True
-        
-        img.save(str(save_path), **save_kwargs)  # Infer format from extension
-        
+        with PilImage.open(str(save_path)) as img:
+            img.load()
+        return store_image(img, filename)
     except Exception as e:
         os.remove(str(save_path))  # Clean up on failure
         raise ValueError(f"Image processing failed: {str(e)}") from e
-    
-    return filename
 
-def save_image(filename: str, file: FileStorage) -> None:
-    save_path = pathlib.Path(current_app.instance_path) / "images"
+def save_image(filename: str, file: FileStorage) -> Dict[str, Any]:
+    """Store an uploaded image as filename plus the upload's extension. Returns the stored image's metadata."""
     original_filename = secure_filename(file.filename)
     ext = os.path.splitext(original_filename)[1].lower().lstrip('.')
     
@@ -169,42 +210,46 @@ def save_image(filename: str, file: FileStorage) -> None:
     if not ext or ext not in allowed_extensions:
         raise ValueError(f"Invalid file extension: {ext}. Allowed: {', '.join(allowed_extensions)}")
     
-    # Build full filename and path
-    full_filename = f"{filename}.{ext}"
-    save_path = pathlib.Path(current_app.instance_path) / "images"
-    save_path.mkdir(parents=True, exist_ok=True)  # Ensure directory exists
-    file_path = save_path / full_filename
-    
-    # Process image with PIL
     try:
         img = PilImage.open(file.stream)
-        
-        # Resize to fit within 1000x1000 while preserving aspect ratio
-        max_size = 1000
-        if img.width > max_size or img.height > max_size:
-            ratio = min(max_size / img.width, max_size / img.height)
-            new_size = (int(img.width * ratio), int(img.height * ratio))
-            img = img.resize(new_size, PilImage.Resampling.LANCZOS)  # High-quality resampling
-        
-        # Save with format-specific options (compression/quality)
-        save_kwargs = {}
-        if ext in {'jpg', 'jpeg'}:
-            save_kwargs['quality'] = 85  # Balanced compression
-            save_kwargs['optimize'] = True
-        elif ext == 'png':
-            save_kwargs['optimize'] = True
-            save_kwargs['compress_level'] = 6  # Moderate compression
-        elif ext == 'webp':
-            save_kwargs['quality'] = 80  # Lossy compression
-        elif ext == 'gif':
-            save_kwargs['optimize'] = True
-        
-        img.save(file_path, format=ext.upper(), **save_kwargs)
-        
+        return store_image(img, f"{filename}.{ext}")
     except Exception as e:
         raise ValueError(f"Image processing failed: {str(e)}") from e
 
 
+def backfill_image_metadata(batch_size: int = 100) -> Dict[str, int]:
+    """
+    Give images stored before thumbnails existed a thumbnail and their
+    width / height / byte_size, reading each file once. Returns counts.
+    """
+    image_dir = pathlib.Path(current_app.instance_path) / "images"
+    counts = {"updated": 0, "missing": 0}
+    last_id = 0
+    while True:
+        images = (
+            models.Image.query
+            .filter(models.Image.thumbnail.is_(None), models.Image.filename.isnot(None), models.Image.id > last_id)
+            .order_by(models.Image.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not images:
+            return counts
+        last_id = images[-1].id
+        for image in images:
+            path = image_dir / image.filename
+            if not path.is_file():
+                counts["missing"] += 1
+                continue
+            with PilImage.open(path) as img:
+                img.load()
+            image.thumbnail = _save_thumbnail(img, image_dir, image.filename)
+            image.width, image.height = img.width, img.height
+            image.byte_size = path.stat().st_size
+            counts["updated"] += 1
+        db.session.commit()
+
+
 def download_addon_from_url(url: str) -> pathlib.Path:
     """Download ZIP file from URL to temporary directory."""
     temp_dir = pathlib.Path(tempfile.mkdtemp())
@@ -0,0 +1,186 @@
+"""
+Payment reconciliation.
+Streams a processor's transactions for a date window and checks each one
+against our OrderPayment rows, writing every discrepancy to
+reconciliation_mismatch_table.
+
+Local payments for the window are loaded once into a hash index of small
+dicts; transactions are matched as they arrive and never accumulated, and
+mismatches are written in batches. Memory follows our own order volume for
+the window, not the number of transactions the processor returns.
+"""
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import insert, or_, select
+
+from app.database import db
+from app.models import models
+from app.utils.logging import get_logger
+from . import payments
+
+log = get_logger(__file__)
+
+MATCH_MARGIN = timedelta(days=3)   # a capture can land this long after its order was placed
+SETTLE_LAG = timedelta(hours=6)    # how far behind the processor's transaction list may run
+FLUSH_SIZE = 500                   # mismatches per insert, unmatched transactions per lookup
+AMOUNT_TOLERANCE = 0.005
+# Local statuses that agree with what the processor settled
+SETTLED_AS = {
+    "COMPLETED": {"COMPLETED", "REFUNDED", "REVERSED"},
+}
+
+PaymentIndex = Tuple[Dict[str, Dict[str, Any]], Dict[int, Dict[str, Any]]]
+
+
+def _entries(*criteria: Any) -> Iterable[Dict[str, Any]]:
+    query = (
+        select(
+            models.OrderPayment.id,
+            models.OrderPayment.order_id,
+            models.OrderPayment.payment_id,
+            models.OrderPayment.status,
+            models.OrderPayment.direction,
+            models.Order.total,
+            models.Order.created_at,
+        )
+        .join(models.Order, models.Order.id == models.OrderPayment.order_id)
+        .where(*criteria)
+        .execution_options(yield_per=1000)
+    )
+    for row in db.session.execute(query):
+        yield {
+            "id": row.id,
+            "order_id": row.order_id,
+            "payment_id": row.payment_id,
+            "status": row.status,
+            "direction": row.direction,
+            "total": row.total,
+            "created_at": row.created_at,
+            "seen": False,
+        }
+
+
+def _build_index(entries: Iterable[Dict[str, Any]]) -> PaymentIndex:
+    """payment_id → entry for every payment, order_id → entry for incoming ones."""
+    by_payment_id: Dict[str, Dict[str, Any]] = {}
+    by_order_id: Dict[int, Dict[str, Any]] = {}
+    for entry in entries:
+        by_payment_id[entry["payment_id"]] = entry
+        if entry["direction"] == 'IN':
+            by_order_id[entry["order_id"]] = entry
+    return by_payment_id, by_order_id
+
+
+def _match(transaction: Dict[str, Any], index: PaymentIndex) -> Optional[Dict[str, Any]]:
+    by_payment_id, by_order_id = index
+    if transaction.get("payment_id") and transaction["payment_id"] in by_payment_id:
+        return by_payment_id[transaction["payment_id"]]
+    if transaction["kind"] == "PAYMENT" and transaction.get("order_id") in by_order_id:
+        return by_order_id[transaction["order_id"]]
+    return None
+
+
+def _mismatch(run_id: str, addon_id: int, kind: str, entry: Optional[Dict[str, Any]], transaction: Optional[Dict[str, Any]], expected: Any, actual: Any) -> Dict[str, Any]:
+    return {
+        "run_id": run_id,
+        "payment_processor_id": addon_id,
+        "kind": kind,
+        "order_payment_id": entry["id"] if entry else None,
+        "order_id": entry["order_id"] if entry else (transaction or {}).get("order_id"),
+        "transaction_id": (transaction or {}).get("transaction_id"),
+        "expected": None if expected is None else str(expected),
+        "actual": None if actual is None else str(actual),
+        "created_at": datetime.utcnow(),
+    }
+
+
+def _compare(entry: Dict[str, Any], transaction: Dict[str, Any], run_id: str, addon_id: int) -> List[Dict[str, Any]]:
+    entry["seen"] = True
+    found = []
+    remote = transaction["status"]
+    if entry["status"] not in SETTLED_AS.get(remote, {remote}):
+        found.append(_mismatch(run_id, addon_id, "STATUS", entry, transaction, remote, entry["status"]))
+    if transaction["kind"] == "PAYMENT" and abs((entry["total"] or 0.0) - transaction["amount"]) > AMOUNT_TOLERANCE:
+        found.append(_mismatch(run_id, addon_id, "AMOUNT", entry, transaction, f"{transaction['amount']:.2f}", f"{entry['total'] or 0.0:.2f}"))
+    return found
+
+
+def _resolve(unmatched: List[Dict[str, Any]], run_id: str, addon_id: int) -> List[Dict[str, Any]]:
+    """Look up transactions that fell outside the window's index (old orders, late refunds) in one query."""
+    payment_ids = [t["payment_id"] for t in unmatched if t.get("payment_id")]
+    order_ids = [t["order_id"] for t in unmatched if t.get("order_id") is not None]
+    index = _build_index(_entries(
+        models.OrderPayment.payment_processor_id == addon_id,
+        or_(
+            models.OrderPayment.payment_id.in_(payment_ids),
+            (models.OrderPayment.order_id.in_(order_ids)) & (models.OrderPayment.direction == 'IN'),
+        ),
+    )) if payment_ids or order_ids else ({}, {})
+    found = []
+    for transaction in unmatched:
+        entry = _match(transaction, index)
+        if entry is None:
+            found.append(_mismatch(run_id, addon_id, "MISSING_LOCAL", None, transaction, transaction["status"], None))
+        else:
+            found.extend(_compare(entry, transaction, run_id, addon_id))
+    return found
+
+
+def _flush(rows: List[Dict[str, Any]]) -> int:
+    written = len(rows)
+    if rows:
+        db.session.execute(insert(models.ReconciliationMismatch), rows)
+        db.session.commit()
+        rows.clear()
+    return written
+
+
+def reconcile(addon_id: int, start: datetime, end: datetime) -> Dict[str, Any]:
+    """
+    Check one processor's transactions between start and end (UTC) against
+    OrderPayment. Returns the run id and counts; the mismatches themselves
+    are in ReconciliationMismatch under that run id.
+    """
+    run_id = uuid.uuid4().hex
+    processor = payments.get_processor(addon_id)
+    index = _build_index(_entries(
+        models.OrderPayment.payment_processor_id == addon_id,
+        models.Order.created_at >= start - MATCH_MARGIN,
+        models.Order.created_at < end,
+    ))
+    counts = {"run_id": run_id, "transactions": 0, "matched": 0, "mismatches": 0}
+    pending: List[Dict[str, Any]] = []
+    unmatched: List[Dict[str, Any]] = []
+
+    for transaction in processor.transactions(start, end):
+        counts["transactions"] += 1
+        entry = _match(transaction, index)
+        if entry is None:
+            unmatched.append(transaction)
+            if len(unmatched) >= FLUSH_SIZE:
+                pending.extend(_resolve(unmatched, run_id, addon_id))
+                unmatched.clear()
+        else:
+            counts["matched"] += 1
+            pending.extend(_compare(entry, transaction, run_id, addon_id))
+        if len(pending) >= FLUSH_SIZE:
+            counts["mismatches"] += _flush(pending)
+    pending.extend(_resolve(unmatched, run_id, addon_id))
+
+    # Paid for here but never seen at the processor. Orders placed shortly
+    # before `end` may not be listed yet, so they are left for the next run.
+    by_payment_id, _ = index
+    for entry in by_payment_id.values():
+        if (
+            not entry["seen"]
+            and entry["direction"] == 'IN'
+            and entry["status"] in SETTLED_AS["COMPLETED"]
+            and entry["created_at"] is not None
+            and start <= entry["created_at"] < end - SETTLE_LAG
+        ):
+            pending.append(_mismatch(run_id, addon_id, "MISSING_REMOTE", entry, None, None, entry["status"]))
+    counts["mismatches"] += _flush(pending)
+    log.info(f"Reconciliation {run_id} for processor {addon_id}: {counts}")
+    return counts
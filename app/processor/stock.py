@@ -0,0 +1,234 @@
+"""
+Stock reservations for checkout.
+Stock is taken with a conditional `UPDATE … SET stock = stock - :n WHERE
+stock >= :n`, so concurrent checkouts can never drive it below zero, and is
+held in a StockReservation until the payment commits it or it expires.
+Expired holds are put back by release_expired(), which also runs before
+every reservation for the products involved; a payment that lands after
+that takes the stock again or backorders the order.
+
+Only products we keep stock for are reserved: supplier-synced products
+(product_id set) are made on demand.
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+
+from flask import current_app
+from sqlalchemy import bindparam, select, update
+
+from app.database import db
+from app.models import models
+from app.utils import catalog
+from app.utils.exceptions import OutOfStockError
+from app.utils.logging import get_logger
+
+log = get_logger(__file__)
+
+
+def _stock_changed(deltas: Dict[int, int]) -> None:
+    """
+    Refresh cached views of products whose stock moved by product_id → delta.
+    Only products that went in or out of stock change what the storefront and
+    feeds show, so only those refresh family aggregates and bump the catalog
+    version behind every ETag; other reservations just drop the product views.
+    """
+    deltas = {product_id: delta for product_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    rows = db.session.execute(
+        select(models.Product.id, models.Product.stock, models.Product.variant_of_id)
+        .where(models.Product.id.in_(deltas.keys()))
+    ).all()
+    # A base's view lists its variants' stock, so it goes with them
+    moved: Set[int] = set()
+    flipped: Set[int] = set()
+    base_ids: Set[int] = set()
+    for product_id, stock, base_id in rows:
+        family = {product_id, base_id} - {None}
+        if (stock > 0) != (stock - deltas[product_id] > 0):
+            flipped.update(family)
+            if base_id is not None:
+                base_ids.add(base_id)
+        else:
+            moved.update(family)
+    catalog.mark_stock_changed(moved)
+    catalog.mark_products_changed(flipped)
+    if base_ids:
+        # Commits the marks together with the refreshed aggregates
+        models.refresh_variant_aggregates(base_ids)
+    else:
+        db.session.commit()
+
+
+def reserve(lines: Dict[int, int], user_id: Optional[int] = None) -> List[int]:
+    """
+    Take stock for product_id → quantity and hold it for STOCK_RESERVATION_TTL.
+    All or nothing: raises OutOfStockError (with the product_id) and leaves
+    stock untouched if any line can't be covered. Returns reservation ids.
+    """
+    lines = {int(pid): int(quantity) for pid, quantity in lines.items() if int(quantity) > 0}
+    tracked = sorted(db.session.scalars(
+        select(models.Product.id).where(models.Product.id.in_(lines.keys()), models.Product.product_id.is_(None))
+    ))
+    if not tracked:
+        return []
+    release_expired(product_ids=tracked)
+
+    expires_at = datetime.utcnow() + current_app.config["STOCK_RESERVATION_TTL"]
+    try:
+        # Fixed id order so two carts never wait on each other's rows in opposite order
+        for product_id in tracked:
+            result = db.session.execute(
+                update(models.Product)
+                .where(models.Product.id == product_id, models.Product.stock >= lines[product_id])
+                .values(stock=models.Product.stock - lines[product_id])
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount != 1:
+                raise OutOfStockError(product_id=product_id, requested=lines[product_id])
+        reservations = [
+            models.StockReservation(product_id=product_id, user_id=user_id, quantity=lines[product_id], expires_at=expires_at)
+            for product_id in tracked
+        ]
+        db.session.add_all(reservations)
+        db.session.flush()
+        reservation_ids = [reservation.id for reservation in reservations]
+    except Exception:
+        db.session.rollback()
+        raise
+    _stock_changed({product_id: -lines[product_id] for product_id in tracked})
+    return reservation_ids
+
+
+def commit_reservations(reservation_ids: Iterable[int]) -> int:
+    """
+    Make held stock permanent (payment went through). Holds that expired
+    first already gave their stock back, so it is taken again with the same
+    conditional UPDATE as reserve(); lines it can no longer cover are marked
+    BACKORDERED, with their order, for the shop to restock or refund.
+    Returns how many reservations ended up committed.
+    """
+    reservation_ids = list(reservation_ids)
+    if not reservation_ids:
+        return 0
+    committed = db.session.execute(
+        update(models.StockReservation)
+        .where(models.StockReservation.id.in_(reservation_ids), models.StockReservation.status == 'HELD')
+        .values(status='COMMITTED')
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    lapsed = db.session.execute(
+        select(
+            models.StockReservation.id,
+            models.StockReservation.product_id,
+            models.StockReservation.order_id,
+            models.StockReservation.quantity,
+        )
+        .where(models.StockReservation.id.in_(reservation_ids), models.StockReservation.status == 'RELEASED')
+        .order_by(models.StockReservation.product_id)
+    ).all()
+    retaken: Dict[int, int] = {}
+    short: List[Dict[str, int]] = []
+    for reservation_id, product_id, order_id, quantity in lapsed:
+        # Claim the reservation first so a concurrent commit can't take the stock twice
+        claimed = db.session.execute(
+            update(models.StockReservation)
+            .where(models.StockReservation.id == reservation_id, models.StockReservation.status == 'RELEASED')
+            .values(status='COMMITTED')
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not claimed:
+            continue
+        taken = db.session.execute(
+            update(models.Product)
+            .where(models.Product.id == product_id, models.Product.stock >= quantity)
+            .values(stock=models.Product.stock - quantity)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if taken:
+            retaken[product_id] = retaken.get(product_id, 0) - quantity
+            committed += 1
+            continue
+        db.session.execute(
+            update(models.StockReservation)
+            .where(models.StockReservation.id == reservation_id)
+            .values(status='RELEASED')
+            .execution_options(synchronize_session=False)
+        )
+        if order_id is not None:
+            short.append({"b_order_id": order_id, "b_product_id": product_id})
+
+    if short:
+        order_products = models.OrderProduct.__table__
+        db.session.execute(
+            update(order_products)
+            .where(order_products.c.order_id == bindparam("b_order_id"), order_products.c.product_id == bindparam("b_product_id"))
+            .values(status='BACKORDERED'),
+            short,
+        )
+        db.session.execute(
+            update(models.Order)
+            .where(models.Order.id.in_({line["b_order_id"] for line in short}))
+            .values(status='BACKORDERED')
+            .execution_options(synchronize_session=False)
+        )
+        log.error(f"Paid orders {sorted({line['b_order_id'] for line in short})} are short of stock and were marked BACKORDERED")
+    if retaken:
+        log.warning(f"Took stock again for {len(retaken)} products whose reservations expired before payment")
+        _stock_changed(retaken)
+    else:
+        db.session.commit()
+    return committed
+
+
+def _release(*criteria: object) -> int:
+    held = db.session.execute(
+        select(models.StockReservation.id, models.StockReservation.product_id, models.StockReservation.quantity)
+        .where(models.StockReservation.status == 'HELD', *criteria)
+        .with_for_update(skip_locked=True)
+    ).all()
+    restored: Dict[int, int] = {}
+    released = 0
+    for reservation_id, product_id, quantity in held:
+        # Conditional flip: whoever moves HELD → RELEASED first gives the stock back, exactly once
+        flipped = db.session.execute(
+            update(models.StockReservation)
+            .where(models.StockReservation.id == reservation_id, models.StockReservation.status == 'HELD')
+            .values(status='RELEASED')
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if flipped:
+            released += 1
+            restored[product_id] = restored.get(product_id, 0) + quantity
+    for product_id, quantity in restored.items():
+        db.session.execute(
+            update(models.Product)
+            .where(models.Product.id == product_id)
+            .values(stock=models.Product.stock + quantity)
+            .execution_options(synchronize_session=False)
+        )
+    if restored:
+        _stock_changed(restored)
+    else:
+        db.session.commit()
+    return released
+
+
+def release(reservation_ids: Iterable[int]) -> int:
+    """Give held stock back (checkout failed or was abandoned)."""
+    reservation_ids = list(reservation_ids)
+    if not reservation_ids:
+        return 0
+    return _release(models.StockReservation.id.in_(reservation_ids))
+
+
+def release_expired(product_ids: Optional[Iterable[int]] = None, now: Optional[datetime] = None) -> int:
+    """Release holds past their expiry, optionally only for some products. Returns the count."""
+    criteria = [models.StockReservation.expires_at < (now or datetime.utcnow())]
+    if product_ids is not None:
+        criteria.append(models.StockReservation.product_id.in_(list(product_ids)))
+    released = _release(*criteria)
+    if released:
+        log.info(f"Released {released} expired stock reservations")
+    return released
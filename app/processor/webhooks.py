@@ -0,0 +1,225 @@
+"""
+Webhook ingestion and consumption.
+The endpoint only verifies, deduplicates and appends the raw event to a Redis
+stream, so senders get their 200 within milliseconds. Consumers read the
+stream in batches through a consumer group and apply the resulting status
+changes to Order, OrderPayment and OrderShipping with one commit per batch.
+
+Addons opt in by exposing verify_webhook(config, headers, args, body),
+webhook_event_id(event) and webhook_updates(event). Each update is a dict
+with a target (ORDER, ORDER_PAYMENT or ORDER_SHIPPING), the keys identifying
+the row (order_id / payment_id) and the new status.
+"""
+import importlib
+import json
+import os
+import socket
+import time
+from types import ModuleType
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+import redis
+from sqlalchemy import bindparam, select, update
+
+from app.database import db
+from app.models import models
+from app.utils.extensions import redis_client
+from app.utils.logging import get_logger
+from . import payments as payment_processors
+
+log = get_logger(__file__)
+
+STREAM_KEY = "oshkelosh:webhooks"
+DEAD_LETTER_KEY = "oshkelosh:webhooks:dead"
+SEEN_PREFIX = "oshkelosh:webhook:seen:"
+CONSUMER_GROUP = "oshkelosh-webhooks"
+SEEN_TTL = 7 * 24 * 3600
+STREAM_MAXLEN = 100_000
+HANDLER_TTL = 60        # seconds addon modules/config stay cached in-process
+CLAIM_IDLE_MS = 60_000  # events a dead consumer left unacked are taken over after this
+
+ADDON_PACKAGES = {"SUPPLIER": "suppliers", "PAYMENT": "payments", "MESSAGING": "messaging"}
+
+# addon name → (expires, (addon_id, module, config data) or None)
+_handlers: Dict[str, Tuple[float, Optional[Tuple[int, ModuleType, Dict[str, Any]]]]] = {}
+
+
+def addon_handler(name: str) -> Optional[Tuple[int, ModuleType, Dict[str, Any]]]:
+    """Addon id, module and config for a webhook-capable addon, cached so ingestion skips the DB."""
+    cached = _handlers.get(name)
+    if cached and cached[0] > time.time():
+        return cached[1]
+    handler = None
+    addon = models.Addon.query.filter_by(name=name, active=True).first()
+    if addon is not None and addon.type in ADDON_PACKAGES:
+        try:
+            module = importlib.import_module(f"app.addons.{ADDON_PACKAGES[addon.type]}.{addon.name}")
+        except ImportError as e:
+            log.warning(f"Failed importing addon {addon.name}: {e}")
+        else:
+            if all(hasattr(module, attr) for attr in ("verify_webhook", "webhook_event_id", "webhook_updates")):
+                handler = (addon.id, module, models.get_config(addon_id=addon.id).data())
+    _handlers[name] = (time.time() + HANDLER_TTL, handler)
+    return handler
+
+
+def ingest(addon_name: str, headers: Mapping[str, str], args: Mapping[str, str], body: bytes) -> Tuple[str, int]:
+    """
+    Fast path for the webhook endpoint. Returns (result, HTTP status):
+    'queued'/'duplicate' 200, 'unknown' 404, 'invalid' 400/401, 'unavailable' 503.
+    """
+    handler = addon_handler(addon_name)
+    if handler is None:
+        return "unknown", 404
+    _, module, config_data = handler
+    if not module.verify_webhook(config_data, headers, args, body):
+        return "invalid", 401
+    try:
+        event_id = module.webhook_event_id(json.loads(body))
+    except (ValueError, KeyError, TypeError):
+        return "invalid", 400
+
+    client = redis_client.client
+    seen_key = f"{SEEN_PREFIX}{addon_name}:{event_id}"
+    try:
+        if not client.set(seen_key, 1, nx=True, ex=SEEN_TTL):
+            return "duplicate", 200
+        client.xadd(STREAM_KEY, {"addon": addon_name, "event_id": event_id, "body": body}, maxlen=STREAM_MAXLEN, approximate=True)
+    except redis.RedisError as e:
+        log.error(f"Failed queueing webhook {event_id} from {addon_name}: {e}")
+        try:
+            client.delete(seen_key)  # let the sender's retry through
+        except redis.RedisError:
+            pass
+        return "unavailable", 503
+    return "queued", 200
+
+
+# ----------------------------------------------------------------------
+# Consumers
+# ----------------------------------------------------------------------
+def _ensure_group() -> None:
+    try:
+        redis_client.client.xgroup_create(STREAM_KEY, CONSUMER_GROUP, id="0", mkstream=True)
+    except redis.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def _read(consumer: str, batch_size: int, block_ms: Optional[int]) -> List[Tuple[bytes, Dict[bytes, bytes]]]:
+    client = redis_client.client
+    # Take over events a crashed consumer read but never acknowledged
+    _, claimed, *_ = client.xautoclaim(STREAM_KEY, CONSUMER_GROUP, consumer, CLAIM_IDLE_MS, count=batch_size)
+    if claimed:
+        return [entry for entry in claimed if entry[1]]
+    # block_ms None leaves BLOCK out (return at once); BLOCK 0 would wait forever
+    response = client.xreadgroup(CONSUMER_GROUP, consumer, {STREAM_KEY: ">"}, count=batch_size, block=block_ms)
+    return response[0][1] if response else []
+
+
+def _apply(updates: List[Dict[str, Any]]) -> None:
+    # Later events for the same row win; collapse them before writing. Events
+    # arrive out of order, so a payment status only replaces a lower-ranked one.
+    latest: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+    for change in updates:
+        if change["target"] == "ORDER":
+            latest[("ORDER", change["order_id"])] = change
+        elif change["target"] == "ORDER_PAYMENT":
+            key = ("ORDER_PAYMENT", change["addon_id"], change["payment_id"])
+            rank = payment_processors.status_rank(change["status"])
+            if key not in latest or rank >= latest[key]["rank"]:
+                latest[key] = {**change, "rank": rank}
+        elif change["target"] == "ORDER_SHIPPING":
+            latest[("ORDER_SHIPPING", change["addon_id"], change["order_id"])] = change
+
+    orders = models.Order.__table__
+    payments = models.OrderPayment.__table__
+    shippings = models.OrderShipping.__table__
+    statements = {
+        "ORDER": update(orders)
+            .where(orders.c.id == bindparam("b_order_id"))
+            .values(status=bindparam("b_status")),
+        "ORDER_PAYMENT": update(payments)
+            .where(
+                payments.c.payment_processor_id == bindparam("b_addon_id"),
+                payments.c.payment_id == bindparam("b_payment_id"),
+                payment_processors.advances(payments.c.status),
+            )
+            .values(status=bindparam("b_status")),
+        "ORDER_SHIPPING": update(shippings)
+            .where(shippings.c.supplier_id == bindparam("b_addon_id"), shippings.c.order_id == bindparam("b_order_id"))
+            .values(status=bindparam("b_status")),
+    }
+    for target, statement in statements.items():
+        rows = [
+            {f"b_{key}": value for key, value in change.items() if key != "target"}
+            for change in latest.values()
+            if change["target"] == target
+        ]
+        if rows:
+            db.session.execute(statement, rows)
+    db.session.commit()
+
+    # Paid or failed payments settle their orders (stock, order status), going
+    # by the status that was stored rather than the event, which may have been stale
+    touched = {
+        (change["addon_id"], change["payment_id"])
+        for change in latest.values()
+        if change["target"] == "ORDER_PAYMENT"
+    }
+    if touched:
+        rows = db.session.execute(
+            select(payments.c.order_id, payments.c.payment_processor_id, payments.c.payment_id, payments.c.status)
+            .where(payments.c.payment_id.in_([payment_id for _, payment_id in touched]))
+        ).all()
+        payment_processors.settle({
+            order_id: status
+            for order_id, addon_id, payment_id, status in rows
+            if (addon_id, payment_id) in touched
+        })
+
+
+def consume_batch(consumer: str, batch_size: int = 100, block_ms: Optional[int] = 5000) -> int:
+    """
+    Read up to batch_size events, apply them in one transaction and ack.
+    Waits up to block_ms for new events; None returns at once. Returns events handled.
+    """
+    _ensure_group()
+    entries = _read(consumer, batch_size, block_ms)
+    if not entries:
+        return 0
+
+    client = redis_client.client
+    updates: List[Dict[str, Any]] = []
+    dead: List[Tuple[bytes, Dict[bytes, bytes]]] = []
+    for entry_id, fields in entries:
+        addon_name = fields[b"addon"].decode()
+        handler = addon_handler(addon_name)
+        try:
+            if handler is None:
+                raise LookupError(f"addon {addon_name} no longer handles webhooks")
+            addon_id, module, _ = handler
+            for change in module.webhook_updates(json.loads(fields[b"body"])):
+                change.setdefault("addon_id", addon_id)
+                updates.append(change)
+        except Exception as e:
+            log.error(f"Unprocessable webhook event {fields.get(b'event_id')} from {addon_name}: {e}")
+            dead.append((entry_id, fields))
+
+    try:
+        _apply(updates)
+    except Exception:
+        db.session.rollback()
+        raise  # left unacked; retried by this or another consumer after CLAIM_IDLE_MS
+
+    pipe = client.pipeline()
+    for entry_id, fields in dead:
+        pipe.xadd(DEAD_LETTER_KEY, fields, maxlen=STREAM_MAXLEN, approximate=True)
+    pipe.xack(STREAM_KEY, CONSUMER_GROUP, *[entry_id for entry_id, _ in entries])
+    pipe.execute()
+    log.debug(f"Applied {len(updates)} status updates from {len(entries)} webhook events")
+    return len(entries)
+
+
+def default_consumer_name() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
@@ -0,0 +1,269 @@
+"""
+Catalog read models, cached in Redis.
+The product page is served from a single denormalised document per product,
+rebuilt from the DB on a miss and dropped whenever a commit touches the
+product, one of its variants, its images or its reviews.
+Every such commit also bumps the catalog version used for HTTP validators,
+except stock movements that leave a product in (or out of) stock.
+"""
+import json
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+import redis
+from flask import g, has_app_context
+from sqlalchemy import event, func, or_
+from sqlalchemy.orm import Session
+
+from app.database import db
+from .extensions import redis_client
+from .logging import get_logger
+
+log = get_logger(__name__)
+
+PRODUCT_PREFIX = "oshkelosh:product:"
+FAMILY_PREFIX = "oshkelosh:product_family:"
+PRODUCT_TTL = 24 * 60 * 60
+CATALOG_VERSION_KEY = "oshkelosh:catalog:version"
+
+_DIRTY_KEY = "catalog_dirty_products"
+_STOCK_KEY = "catalog_stock_products"
+_CHANGED_KEY = "catalog_changed"
+
+
+def _product_key(product_id: int) -> str:
+    return f"{PRODUCT_PREFIX}{product_id}"
+
+
+def _family_key(base_id: int) -> str:
+    return f"{FAMILY_PREFIX}{base_id}"
+
+
+def build_product_view(product_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Assemble the product page document straight from the DB.
+    The whole variant family (variants, their images, categories) comes in
+    through models.load_variant_trees() in a constant number of queries.
+    """
+    from app.models import models, load_variant_trees
+
+    product = models.Product.query.get(product_id)
+    if not product:
+        return None
+
+    base_id = product.id if product.is_base else product.variant_of_id
+    base = product if product.is_base else (models.Product.query.get(base_id) if base_id is not None else None)
+    if base is not None:
+        # The identity map makes `product` one of the instances filled in here
+        load_variant_trees([base])
+    variants = product.get_variants() if base is not None else []
+    categories = product.get_categories()
+
+    review_count, review_average = (
+        db.session.query(func.count(models.Review.id), func.avg(models.Review.rating))
+        .filter(models.Review.product_id == product.id)
+        .one()
+    )
+
+    return {
+        "id": product.id,
+        "name": product.name,
+        "description": product.description,
+        "price": product.price,
+        "stock": product.stock,
+        "active": product.active,
+        "is_base": product.is_base,
+        "base_id": base_id,
+        "supplier_id": product.supplier_id,
+        "images": [
+            {
+                "id": image.id,
+                "filename": image.filename,
+                "title": image.title,
+                "alt_text": image.alt_text,
+                "position": image.position,
+            }
+            for image in product.images
+        ],
+        "variants": [
+            {
+                "id": variant.id,
+                "name": variant.name,
+                "price": variant.price,
+                "stock": variant.stock,
+                "active": variant.active,
+                "image": variant.images[0].filename if variant.images else None,
+            }
+            for variant in variants
+        ],
+        "categories": [{"id": category.id, "name": category.name} for category in categories],
+        "reviews": {
+            "count": review_count,
+            "average": round(float(review_average), 2) if review_average is not None else None,
+        },
+    }
+
+
+def get_product(product_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Fast read path for the product page — one Redis GET on a hit.
+    Falls back to build_product_view() on a miss and caches the result.
+    """
+    raw = redis_client.client.get(_product_key(product_id))
+    if raw is not None:
+        try:
+            return json.loads(raw)
+        except json.JSONDecodeError:
+            log.warning("Corrupted product cache for %s — rebuilding", product_id)
+
+    view = build_product_view(product_id)
+    if view is None:
+        return None
+
+    pipe = redis_client.client.pipeline()
+    pipe.set(_product_key(product_id), json.dumps(view, separators=(",", ":")), ex=PRODUCT_TTL)
+    if view["base_id"] is not None:
+        # Remember which cached views belong to this base, so a change to any
+        # variant can drop its siblings' documents too.
+        pipe.sadd(_family_key(view["base_id"]), product_id)
+        pipe.expire(_family_key(view["base_id"]), PRODUCT_TTL)
+    pipe.execute()
+    return view
+
+
+def invalidate_products(product_ids: Iterable[int]) -> None:
+    """Drop cached views for the given products and every member of their families."""
+    ids = {int(pid) for pid in product_ids if pid is not None}
+    if not ids:
+        return
+
+    client = redis_client.client
+    pipe = client.pipeline()
+    for pid in ids:
+        pipe.smembers(_family_key(pid))
+    families = pipe.execute()
+
+    keys = {_product_key(pid) for pid in ids}
+    for pid, members in zip(ids, families):
+        keys.update(_product_key(int(m)) for m in members)
+        if members:
+            keys.add(_family_key(pid))
+    client.delete(*keys)
+    log.debug("Invalidated %d cached product views", len(keys))
+
+
+def catalog_version() -> Tuple[int, datetime]:
+    """
+    Current catalog version and the time it last changed.
+    Read once per request; both feed the ETag/Last-Modified validators.
+    """
+    if has_app_context() and "catalog_version" in g:
+        return g.catalog_version
+    version, changed_at = redis_client.client.hmget(CATALOG_VERSION_KEY, "version", "changed_at")
+    result = (
+        int(version or 0),
+        datetime.fromtimestamp(float(changed_at or 0), tz=timezone.utc).replace(microsecond=0),
+    )
+    if has_app_context():
+        g.catalog_version = result
+    return result
+
+
+def bump_catalog_version() -> int:
+    """Mark the catalog as changed. Returns the new version."""
+    pipe = redis_client.client.pipeline()
+    pipe.hincrby(CATALOG_VERSION_KEY, "version", 1)
+    pipe.hset(CATALOG_VERSION_KEY, "changed_at", time.time())
+    version, _ = pipe.execute()
+    if has_app_context():
+        g.pop("catalog_version", None)
+    return int(version)
+
+
+def products_last_modified(*criteria: Any) -> Optional[datetime]:
+    """Latest updated_at over the products matching `criteria`, as an aware UTC datetime."""
+    from app.models import models
+
+    latest = db.session.query(func.max(models.Product.updated_at)).filter(*criteria).scalar()
+    if latest is None:
+        return None
+    return latest.replace(tzinfo=timezone.utc, microsecond=0)
+
+
+def family_last_modified(product_id: int) -> Optional[datetime]:
+    """Latest updated_at across a product, its base and its sibling variants."""
+    from app.models import models
+
+    base_id = (
+        db.session.query(func.coalesce(models.Product.variant_of_id, models.Product.id))
+        .filter(models.Product.id == product_id)
+        .scalar()
+    )
+    if base_id is None:
+        return None
+    return products_last_modified(
+        or_(models.Product.id == base_id, models.Product.variant_of_id == base_id)
+    )
+
+
+def mark_products_changed(product_ids: Iterable[int]) -> None:
+    """
+    Queue products for invalidation on the next commit of the current session.
+    For Core/bulk UPDATEs, which the flush hook below never sees; include the
+    base ids of changed variants.
+    """
+    db.session.info.setdefault(_DIRTY_KEY, set()).update(int(pid) for pid in product_ids if pid is not None)
+
+
+def mark_stock_changed(product_ids: Iterable[int]) -> None:
+    """
+    Like mark_products_changed, for stock levels that moved without the
+    product going in or out of stock: the cached views are dropped on commit
+    but the catalog version stays, so listings and feeds keep their ETags.
+    """
+    db.session.info.setdefault(_STOCK_KEY, set()).update(int(pid) for pid in product_ids if pid is not None)
+
+
+# ----------------------------------------------------------------------
+# Change tracking — collect touched products on flush, act after commit
+# ----------------------------------------------------------------------
+@event.listens_for(Session, "after_flush")
+def _collect_dirty_products(session: Session, flush_context: Any) -> None:
+    from app.models import models
+
+    dirty: Set[int] = session.info.setdefault(_DIRTY_KEY, set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, models.Category):
+            session.info[_CHANGED_KEY] = True
+        elif isinstance(obj, models.Product):
+            dirty.add(obj.id)
+            if obj.variant_of_id is not None:
+                dirty.add(obj.variant_of_id)
+        elif isinstance(obj, (models.Image, models.Review)):
+            dirty.add(obj.product_id)
+    dirty.discard(None)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session) -> None:
+    dirty = session.info.pop(_DIRTY_KEY, None)
+    stock = session.info.pop(_STOCK_KEY, None)
+    changed = session.info.pop(_CHANGED_KEY, False)
+    if not dirty and not stock and not changed:
+        return
+    try:
+        if dirty or stock:
+            invalidate_products((dirty or set()) | (stock or set()))
+        if dirty or changed:
+            bump_catalog_version()
+    except redis.RedisError as e:
+        # The commit already happened; a stale page for PRODUCT_TTL beats a 500.
+        log.warning("Failed invalidating product cache for %s: %s", sorted((dirty or set()) | (stock or set())), e)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(_DIRTY_KEY, None)
+    session.info.pop(_STOCK_KEY, None)
+    session.info.pop(_CHANGED_KEY, None)
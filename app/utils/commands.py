@@ -0,0 +1,120 @@
+"""
+Maintenance commands, run with `flask <command>` (e.g. from cron).
+"""
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import Flask
+
+from .logging import get_logger
+
+log = get_logger(__name__)
+
+
+def register_commands(app: Flask) -> None:
+    @app.cli.command("upgrade-db")
+    def upgrade_db() -> None:
+        """Add model columns and indexes missing from an existing database, then backfill them."""
+        from app.database import db, upgrade
+        from app.models import models
+
+        added = upgrade.upgrade()
+        for change in added:
+            click.echo(f"Added {change}")
+        if not added:
+            click.echo("Schema is up to date")
+            return
+        if any(change.startswith("column product_table.") for change in added):
+            base_ids = db.session.scalars(db.select(models.Product.id).where(models.Product.is_base.is_(True))).all()
+            models.refresh_variant_aggregates(base_ids)
+            click.echo(f"Refreshed variant aggregates for {len(base_ids)} base products")
+        if any(change.startswith("column image_table.") for change in added):
+            click.echo("Run `flask backfill-image-metadata` to fill in image sizes and thumbnails")
+
+    @app.cli.command("release-reservations")
+    def release_reservations() -> None:
+        """Give back stock held by checkouts whose reservation expired."""
+        from app.processor import stock
+
+        released = stock.release_expired()
+        click.echo(f"Released {released} expired reservations")
+
+    @app.cli.command("rebuild-order-summaries")
+    def rebuild_order_summaries() -> None:
+        """Recompute every user's order count, lifetime spend and last order."""
+        from app.models import models
+
+        rows = models.rebuild_order_summaries()
+        click.echo(f"Rebuilt {rows} order summaries")
+
+    @app.cli.command("dispatch-outbox")
+    @click.option("--batch-size", default=50, show_default=True)
+    @click.option("--loop", is_flag=True, help="Keep polling instead of exiting when drained.")
+    @click.option("--interval", default=5.0, show_default=True, help="Seconds between polls with --loop.")
+    def dispatch_outbox(batch_size: int, loop: bool, interval: float) -> None:
+        """Submit queued supplier orders."""
+        from app.processor import outbox
+
+        while True:
+            counts = outbox.drain(batch_size)
+            if any(counts.values()):
+                click.echo(f"Outbox: {counts['sent']} sent, {counts['retry']} to retry, {counts['failed']} failed")
+            if not loop:
+                break
+            time.sleep(interval)
+
+    @app.cli.command("consume-webhooks")
+    @click.option("--consumer", default=None, help="Consumer name within the group (default: host-pid).")
+    @click.option("--batch-size", default=100, show_default=True)
+    @click.option("--once", is_flag=True, help="Handle one batch and exit.")
+    def consume_webhooks(consumer: str | None, batch_size: int, once: bool) -> None:
+        """Apply queued webhook events to orders, payments and shipping."""
+        from app.processor import webhooks
+
+        consumer = consumer or webhooks.default_consumer_name()
+        while True:
+            handled = webhooks.consume_batch(consumer, batch_size, block_ms=None if once else 5000)
+            if handled:
+                click.echo(f"Webhooks: {handled} events applied")
+            if once:
+                break
+
+    @app.cli.command("poll-payments")
+    @click.option("--batch-size", default=500, show_default=True)
+    def poll_payments(batch_size: int) -> None:
+        """Refresh open payments from their processors, one bulk lookup per processor per batch."""
+        from app.processor import payments
+
+        counts = payments.poll_open_payments(batch_size)
+        click.echo(f"Payments: {counts['checked']} checked, {counts['changed']} changed")
+
+    @app.cli.command("reconcile-payments")
+    @click.option("--processor", "name", default=None, help="Payment addon name (default: every active one).")
+    @click.option("--start", type=click.DateTime(), default=None, help="UTC start of the window (default: --days before --end).")
+    @click.option("--end", type=click.DateTime(), default=None, help="UTC end of the window (default: now).")
+    @click.option("--days", default=1, show_default=True)
+    def reconcile_payments(name: str | None, start: datetime | None, end: datetime | None, days: int) -> None:
+        """Check processor transactions against recorded payments and report mismatches."""
+        from app.models import models
+        from app.processor import reconciliation
+
+        end = end or datetime.utcnow()
+        start = start or end - timedelta(days=days)
+        query = models.Addon.query.filter_by(type='PAYMENT')
+        query = query.filter_by(name=name) if name else query.filter_by(active=True)
+        for addon in query.all():
+            counts = reconciliation.reconcile(addon.id, start, end)
+            click.echo(
+                f"{addon.name}: {counts['transactions']} transactions, {counts['mismatches']} mismatches "
+                f"(run {counts['run_id']})"
+            )
+
+    @app.cli.command("backfill-image-metadata")
+    @click.option("--batch-size", default=100, show_default=True)
+    def backfill_image_metadata(batch_size: int) -> None:
+        """Create thumbnails and record size/dimensions for images stored before they existed."""
+        from app.processor.processors import backfill_image_metadata as backfill
+
+        counts = backfill(batch_size=batch_size)
+        click.echo(f"Images: {counts['updated']} updated, {counts['missing']} files missing")
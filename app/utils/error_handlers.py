@@ -26,8 +26,10 @@ def register_error_handlers(app: Flask) -> None:
     @app.errorhandler(OshkeloshError)
     def handle_oshkelosh_error(error: OshkeloshError) -> tuple[Response, int]:
         log.warning("OshkeloshError: %s | payload=%s", error, error.payload)
-        response = {"error": error.message, "details": error.payload}
-        return jsonify(response), error.status_code
+        response = jsonify({"error": error.message, "details": error.payload})
+        if "retry_after" in error.payload:
+            response.headers["Retry-After"] = str(error.payload["retry_after"])
+        return response, error.status_code
 
     @app.errorhandler(AuthorizationError)
     def handle_auth_error(error: AuthorizationError) -> Response:
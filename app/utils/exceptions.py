@@ -30,6 +30,18 @@ class PaymentError(OshkeloshError):
     status_code = 402
     message = "Payment failed"
 
+class OutOfStockError(OshkeloshError):
+    status_code = 409
+    message = "Not enough stock"
+
+class RateLimitError(OshkeloshError):
+    status_code = 429
+    message = "Too many requests, please slow down"
+
+class ServiceBusyError(OshkeloshError):
+    status_code = 503
+    message = "The server is busy, please try again shortly"
+
 class SupplierSyncError(OshkeloshError):
     status_code = 502
     message = "Failed to sync with supplier"
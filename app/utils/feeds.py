@@ -0,0 +1,205 @@
+"""
+Streaming sitemap and product feeds.
+Output is produced row by row from a yield_per cursor, streamed to the client
+and teed to disk; later requests for the same catalog version are served
+straight from the file. Links carry the requested host, which the client
+controls, so only the canonical SITE_URL (or SERVER_NAME) host is cached
+when one is configured; otherwise the cache is capped at FEED_CACHE_FILES.
+"""
+import csv
+import hashlib
+import io
+import os
+import tempfile
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from flask import current_app, request, send_file, stream_with_context, url_for, Response
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from app.database import db
+
+from .catalog import catalog_version
+from .logging import get_logger
+from . import site_config
+
+if TYPE_CHECKING:
+    from app.models import models
+
+log = get_logger(__name__)
+
+YIELD_PER = 500
+FEED_CACHE_FILES = 12  # files kept when any host may be cached: every feed for a few hosts
+
+
+def _feed_products() -> Iterator["models.Product"]:
+    """Every active, purchasable product (variants and standalone), paged from the DB."""
+    from app.models import models
+
+    query = (
+        select(models.Product)
+        .where(models.Product.is_base.is_(False), models.Product.active.is_(True))
+        .order_by(models.Product.id)
+        .options(selectinload(models.Product.images))
+        .execution_options(yield_per=YIELD_PER)
+    )
+    yield from db.session.scalars(query)
+
+
+def iter_sitemap() -> Iterator[str]:
+    from app.models import models
+
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    for endpoint in ("main.index", "main.about"):
+        yield f"<url><loc>{escape(url_for(endpoint, _external=True))}</loc></url>\n"
+    category_ids = db.session.scalars(
+        select(models.Category.id).order_by(models.Category.id).execution_options(yield_per=YIELD_PER)
+    )
+    for category_id in category_ids:
+        yield f"<url><loc>{escape(url_for('main.category', category_id=category_id, _external=True))}</loc></url>\n"
+    for product in _feed_products():
+        lastmod = (product.updated_at or product.created_at)
+        yield (
+            f"<url><loc>{escape(url_for('main.product', product_id=product.id, _external=True))}</loc>"
+            + (f"<lastmod>{lastmod.date().isoformat()}</lastmod>" if lastmod else "")
+            + "</url>\n"
+        )
+    yield "</urlset>\n"
+
+
+def _merchant_item(product: "models.Product", currency: str) -> Dict[str, str]:
+    image = product.images[0] if product.images else None
+    return {
+        "id": str(product.id),
+        "item_group_id": str(product.variant_of_id) if product.variant_of_id else "",
+        "title": product.name,
+        "description": product.description or "",
+        "link": url_for("main.product", product_id=product.id, _external=True),
+        "image_link": url_for("main.serve_image", filename=image.filename, _external=True) if image and image.filename else "",
+        "price": f"{product.price:.2f} {currency}",
+        # Supplier-synced products (product_id set) are made on demand
+        "availability": "in_stock" if product.stock > 0 or product.product_id else "out_of_stock",
+        "condition": "new",
+    }
+
+
+def iter_merchant_xml() -> Iterator[str]:
+    site = site_config.get_config("site_config")
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<rss version="2.0" xmlns:g="http://base.google.com/ns/1.0"><channel>\n'
+    yield f"<title>{escape(site['site_name'])}</title><link>{escape(url_for('main.index', _external=True))}</link>\n"
+    for product in _feed_products():
+        item = _merchant_item(product, site["currency"])
+        yield "<item>" + "".join(f"<g:{key}>{escape(value)}</g:{key}>" for key, value in item.items() if value) + "</item>\n"
+    yield "</channel></rss>\n"
+
+
+MERCHANT_COLUMNS = ["id", "item_group_id", "title", "description", "link", "image_link", "price", "availability", "condition"]
+
+def iter_merchant_csv() -> Iterator[str]:
+    site = site_config.get_config("site_config")
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=MERCHANT_COLUMNS)
+
+    def drain() -> str:
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+
+    writer.writeheader()
+    yield drain()
+    for product in _feed_products():
+        writer.writerow(_merchant_item(product, site["currency"]))
+        yield drain()
+
+
+# name → (generator, mimetype)
+FEEDS: Dict[str, Tuple[Callable[[], Iterator[str]], str]] = {
+    "sitemap.xml": (iter_sitemap, "application/xml"),
+    "products.xml": (iter_merchant_xml, "application/xml"),
+    "products.csv": (iter_merchant_csv, "text/csv"),
+}
+
+
+def feed_dir() -> Path:
+    path = Path(current_app.instance_path) / "feeds"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def canonical_url() -> Optional[str]:
+    """The storefront's configured base URL, from SITE_URL or SERVER_NAME."""
+    config = current_app.config
+    if config.get("SITE_URL"):
+        return config["SITE_URL"].rstrip("/") + "/"
+    if config.get("SERVER_NAME"):
+        return f"{config['PREFERRED_URL_SCHEME']}://{config['SERVER_NAME']}/"
+    return None
+
+
+def cached_feed_path(name: str) -> Optional[Path]:
+    """
+    Disk cache location for `name` at the current catalog version and host,
+    or None when this host's feed is not cached (not the canonical host).
+    """
+    canonical = canonical_url()
+    if canonical is not None and request.host_url != canonical:
+        return None
+    version, _ = catalog_version()
+    host = hashlib.sha1(request.host_url.encode("utf-8")).hexdigest()[:8]
+    stem, ext = name.rsplit(".", 1)
+    return feed_dir() / f"{stem}-{version}-{host}.{ext}"
+
+
+def _tee_to_disk(chunks: Iterator[str], path: Path) -> Iterator[bytes]:
+    """Yield encoded chunks while writing them to a temp file; publish it only if complete."""
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    completed = False
+    try:
+        with os.fdopen(fd, "wb") as file:
+            for chunk in chunks:
+                data = chunk.encode("utf-8")
+                file.write(data)
+                yield data
+        os.replace(tmp_name, path)
+        completed = True
+        _prune_old_versions(path)
+        log.info("Feed cached to %s", path.name)
+    finally:
+        if not completed and os.path.exists(tmp_name):
+            os.remove(tmp_name)
+
+
+def _prune_old_versions(current: Path) -> None:
+    stem = current.name.split("-", 1)[0]
+    host_ext = current.name.rsplit("-", 1)[1]
+    for old in current.parent.glob(f"{stem}-*-{host_ext}"):
+        if old != current:
+            old.unlink(missing_ok=True)
+    # Bound the cache however many hosts ask: oldest files beyond the cap go
+    cached = sorted(
+        (path for path in current.parent.iterdir() if path.is_file() and not path.name.startswith(".")),
+        key=lambda path: path.stat().st_mtime,
+        reverse=True,
+    )
+    for old in cached[FEED_CACHE_FILES:]:
+        if old != current:
+            old.unlink(missing_ok=True)
+
+
+def feed_response(name: str) -> Response:
+    generator, mimetype = FEEDS[name]
+    path = cached_feed_path(name)
+    if path is None:
+        chunks = (chunk.encode("utf-8") for chunk in generator())
+        return current_app.response_class(stream_with_context(chunks), mimetype=mimetype)
+    if path.is_file():
+        return send_file(path, mimetype=mimetype, conditional=False, etag=False)
+    return current_app.response_class(
+        stream_with_context(_tee_to_disk(generator(), path)),
+        mimetype=mimetype,
+    )
@@ -0,0 +1,85 @@
+"""
+HTTP conditional GET for catalog-backed responses.
+Validators are derived from the catalog version and the newest row involved,
+so a revalidation is answered with 304 before the view renders anything.
+"""
+import hashlib
+from datetime import datetime
+from functools import wraps
+from typing import Any, Callable, Optional
+
+from flask import request, make_response, Response
+from flask_login import current_user
+
+from .catalog import catalog_version
+from .logging import get_logger
+
+log = get_logger(__name__)
+
+LastModifiedFunc = Callable[..., Optional[datetime]]
+
+
+def compute_validators(last_modified: Optional[datetime] = None, *extra: Any) -> tuple[str, datetime]:
+    """
+    ETag + Last-Modified for the current request.
+    The ETag covers the catalog version, the newest row, the URL and who is
+    looking (storefront pages greet logged-in users by name).
+    """
+    version, changed_at = catalog_version()
+    modified = max(changed_at, last_modified) if last_modified else changed_at
+    viewer = current_user.get_id() if current_user.is_authenticated else "anon"
+    seed = "|".join(str(part) for part in (version, modified.timestamp(), request.full_path, viewer, *extra))
+    return hashlib.sha1(seed.encode("utf-8")).hexdigest(), modified
+
+
+def is_not_modified(etag: str, modified: datetime) -> bool:
+    """RFC 9110: If-None-Match wins; If-Modified-Since is only consulted without it."""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since:
+        return modified <= request.if_modified_since
+    return False
+
+
+def apply_cache_headers(response: Response, etag: str, modified: datetime, max_age: int) -> Response:
+    response.set_etag(etag, weak=True)
+    response.last_modified = modified
+    if current_user.is_authenticated:
+        # Personalised header bar — keep it out of shared caches
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    else:
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+        response.cache_control.must_revalidate = True
+    response.vary.add("Cookie")
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def conditional(last_modified: Optional[LastModifiedFunc] = None, max_age: int = 60) -> Callable[..., Any]:
+    """
+    View decorator. `last_modified` gets the view's URL kwargs and returns the
+    newest updated_at of the rows the response is built from.
+
+        @bp.route('/product/<int:product_id>')
+        @conditional(lambda product_id: catalog.family_last_modified(product_id))
+        def product(product_id): ...
+    """
+    def decorator(f: Callable[..., Any]) -> Callable[..., Any]:
+        @wraps(f)
+        def decorated_view(*args: Any, **kwargs: Any) -> Any:
+            if request.method not in ("GET", "HEAD"):
+                return f(*args, **kwargs)
+
+            etag, modified = compute_validators(last_modified(**kwargs) if last_modified else None)
+            if is_not_modified(etag, modified):
+                response = make_response("", 304)
+                return apply_cache_headers(response, etag, modified, max_age)
+
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            return apply_cache_headers(response, etag, modified, max_age)
+        return decorated_view
+    return decorator
@@ -0,0 +1,115 @@
+"""
+Idempotency keys for non-repeatable POST endpoints (checkout, payment capture).
+The first request with a key runs the view under a short Redis lock and the
+response is stored for IDEMPOTENCY_TTL; repeats with the same key get the
+stored response back without touching the DB or the payment processor.
+"""
+import hashlib
+import json
+from functools import wraps
+from typing import Any, Callable, Optional
+
+from flask import Response, current_app, jsonify, request
+from flask_login import current_user
+
+from .extensions import redis_client
+from .logging import get_logger
+
+log = get_logger(__name__)
+
+IDEMPOTENCY_PREFIX = "oshkelosh:idempotency:"
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_FIELD = "idempotency_key"
+IDEMPOTENCY_TTL = 24 * 3600
+LOCK_TTL = 30
+MAX_KEY_LENGTH = 255
+
+# Headers worth replaying; everything else is regenerated per response
+REPLAY_HEADERS = ("Content-Type", "Location")
+
+
+def request_key() -> Optional[str]:
+    return request.headers.get(IDEMPOTENCY_HEADER) or request.form.get(IDEMPOTENCY_FIELD)
+
+
+def _redis_key(key: str) -> str:
+    """Keys are scoped to the caller and endpoint, so clients can't collide or probe each other."""
+    owner = current_user.get_id() if current_user.is_authenticated else "anonymous"
+    digest = hashlib.sha256(f"{owner}:{request.endpoint}:{key}".encode("utf-8")).hexdigest()
+    return f"{IDEMPOTENCY_PREFIX}{digest}"
+
+
+def _fingerprint() -> str:
+    return hashlib.sha256(request.method.encode() + request.path.encode() + request.get_data()).hexdigest()
+
+
+def _replay(stored: dict) -> Response:
+    headers = json.loads(stored[b"headers"])
+    headers["Idempotent-Replayed"] = "true"
+    return Response(stored[b"body"], status=int(stored[b"status"]), headers=headers)
+
+
+def _error(message: str, status: int) -> tuple[Response, int]:
+    return jsonify({"error": message}), status
+
+
+def idempotent(ttl: int = IDEMPOTENCY_TTL, lock_ttl: int = LOCK_TTL, required: bool = True) -> Callable:
+    """
+    Decorator for POST views. The key comes from the Idempotency-Key header or
+    an `idempotency_key` form field.
+    - same key, same request, finished  → stored response
+    - same key, still running           → 409 with Retry-After
+    - same key, different request body  → 422
+    Server errors (5xx and exceptions) are not stored, so the client may retry.
+    lock_ttl should exceed the view's worst-case run time.
+    """
+    def decorator(view: Callable[..., Any]) -> Callable[..., Any]:
+        @wraps(view)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            fingerprint = _fingerprint()  # before request.form consumes the body
+            key = request_key()
+            if not key:
+                if required:
+                    return _error("Missing idempotency key", 400)
+                return view(*args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return _error("Idempotency key too long", 400)
+
+            client = redis_client.client
+            response_key = _redis_key(key)
+            lock_key = f"{response_key}:lock"
+
+            stored = client.hgetall(response_key)
+            if not stored:
+                if not client.set(lock_key, fingerprint, nx=True, ex=lock_ttl):
+                    stored = client.hgetall(response_key)  # finished between the two calls
+                    if not stored:
+                        response, status = _error("A request with this idempotency key is in progress", 409)
+                        response.headers["Retry-After"] = "1"
+                        return response, status
+            if stored:
+                if stored[b"fingerprint"].decode() != fingerprint:
+                    return _error("Idempotency key reused with a different request", 422)
+                return _replay(stored)
+
+            try:
+                response = current_app.make_response(view(*args, **kwargs))
+            except Exception:
+                client.delete(lock_key)
+                raise
+
+            pipe = client.pipeline()
+            if response.status_code < 500 and not response.is_streamed:
+                headers = {name: response.headers[name] for name in REPLAY_HEADERS if name in response.headers}
+                pipe.hset(response_key, mapping={
+                    "status": response.status_code,
+                    "headers": json.dumps(headers),
+                    "body": response.get_data(),
+                    "fingerprint": fingerprint,
+                })
+                pipe.expire(response_key, ttl)
+            pipe.delete(lock_key)
+            pipe.execute()
+            return response
+        return wrapper
+    return decorator
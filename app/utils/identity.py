@@ -0,0 +1,151 @@
+"""
+Cached identity for the login manager's user_loader.
+Every authenticated request needs the current user's id, role and display
+name; they are kept in Redis for a short TTL and memoised per request, so
+page views skip the user_table lookup. Anything else on current_user loads
+the full row on first use.
+
+Entries are dropped after any commit that changes a user's role, password
+or name, and on logout.
+"""
+import json
+from typing import Any, Dict, Iterable, Optional, Set
+
+import redis
+from flask import g, has_app_context
+from flask_login import UserMixin
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.database import db
+from .extensions import redis_client
+from .logging import get_logger
+
+log = get_logger(__name__)
+
+IDENTITY_PREFIX = "oshkelosh:identity:"
+IDENTITY_TTL = 120
+IDENTITY_FIELDS = ("id", "role", "name", "surname")
+# The cached fields, plus password so a password change drops the entry too
+WATCHED_FIELDS = ("role", "name", "surname", "password")
+
+_DIRTY_KEY = "identity_dirty_users"
+
+
+def _identity_key(user_id: int) -> str:
+    return f"{IDENTITY_PREFIX}{user_id}"
+
+
+class CachedUser(UserMixin):
+    """
+    Stand-in for User as current_user. The cached fields are plain values;
+    any other attribute (email, cart_items, ...) comes from the full row,
+    loaded once on first access.
+    """
+
+    def __init__(self, data: Dict[str, Any], user: Optional[Any] = None) -> None:
+        self._data = data
+        self._user = user
+
+    @property
+    def user(self) -> Any:
+        if self._user is None:
+            from app.models import models
+            self._user = db.session.get(models.User, self._data["id"])
+        return self._user
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name in self._data:
+            return self._data[name]
+        user = self.user
+        if user is None:
+            raise AttributeError(name)
+        return getattr(user, name)
+
+    def __repr__(self) -> str:
+        return f"<CachedUser {self._data.get('id')} {self._data.get('role')}>"
+
+
+def load_identity(user_id: int) -> Optional[CachedUser]:
+    """Identity for user_id: request memo, then Redis, then the DB (refilling Redis)."""
+    memo = g.setdefault("identities", {}) if has_app_context() else {}
+    if user_id in memo:
+        return memo[user_id]
+
+    client = redis_client.client
+    raw = None
+    try:
+        raw = client.get(_identity_key(user_id))
+    except redis.RedisError as e:
+        log.warning("Identity cache unavailable, loading user %s from the DB: %s", user_id, e)
+
+    identity = None
+    if raw is not None:
+        try:
+            identity = CachedUser(json.loads(raw))
+        except json.JSONDecodeError:
+            log.warning("Corrupted identity cache for user %s — reloading", user_id)
+    if identity is None:
+        from app.models import models
+        user = db.session.get(models.User, user_id)
+        if user is None:
+            return None
+        data = {field: getattr(user, field) for field in IDENTITY_FIELDS}
+        try:
+            client.set(_identity_key(user_id), json.dumps(data), ex=IDENTITY_TTL)
+        except redis.RedisError:
+            pass
+        identity = CachedUser(data, user)
+    memo[user_id] = identity
+    return identity
+
+
+def invalidate_identities(user_ids: Iterable[int]) -> None:
+    """
+    Drop cached identities. A Redis failure is logged, not raised: callers run
+    after a commit or on logout, and the entries expire within IDENTITY_TTL.
+    """
+    user_ids = [user_id for user_id in user_ids if user_id is not None]
+    keys = [_identity_key(user_id) for user_id in user_ids]
+    if has_app_context():
+        memo = g.get("identities", {})
+        for user_id in user_ids:
+            memo.pop(user_id, None)
+    if not keys:
+        return
+    try:
+        redis_client.client.delete(*keys)
+    except redis.RedisError as e:
+        log.warning("Failed invalidating identity cache for %s: %s", sorted(user_ids), e)
+
+
+# ----------------------------------------------------------------------
+# Change tracking — collect touched users on flush, act after commit
+# ----------------------------------------------------------------------
+@event.listens_for(Session, "after_flush")
+def _collect_dirty_users(session: Session, flush_context: Any) -> None:
+    from app.models import models
+
+    dirty: Set[int] = session.info.setdefault(_DIRTY_KEY, set())
+    for obj in session.dirty:
+        if isinstance(obj, models.User):
+            state = inspect(obj)
+            if any(state.attrs[field].history.has_changes() for field in WATCHED_FIELDS):
+                dirty.add(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, models.User):
+            dirty.add(obj.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session) -> None:
+    dirty = session.info.pop(_DIRTY_KEY, None)
+    if dirty:
+        invalidate_identities(dirty)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(_DIRTY_KEY, None)
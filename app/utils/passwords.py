@@ -0,0 +1,77 @@
+"""
+Password hashing.
+The bcrypt cost comes from BCRYPT_ROUNDS. Hashes stored with a different
+cost still verify and are rewritten at the current cost on the next
+successful login, so raising (or lowering) the cost needs no migration.
+
+Hashing runs on a small per-process executor (PASSWORD_WORKERS threads;
+bcrypt releases the GIL while it works). At most PASSWORD_BACKLOG
+operations may be waiting for it; beyond that the request is answered
+with a 503 straight away, so a burst of logins cannot tie up every request
+thread while the rest of the site waits.
+"""
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, Tuple
+
+import bcrypt
+from flask import current_app
+
+from .exceptions import ServiceBusyError
+from .logging import get_logger
+
+log = get_logger(__name__)
+
+BUSY_RETRY_AFTER = 2  # seconds, sent with the 503 when the backlog is full
+_COST_PATTERN = re.compile(r"^\$2[abxy]?\$(\d{2})\$")
+
+_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+_slots: Optional[threading.BoundedSemaphore] = None
+
+
+def _pool() -> Tuple[ThreadPoolExecutor, threading.BoundedSemaphore]:
+    global _executor, _slots
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                workers = current_app.config["PASSWORD_WORKERS"]
+                _slots = threading.BoundedSemaphore(workers + current_app.config["PASSWORD_BACKLOG"])
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+    return _executor, _slots
+
+
+def _run(fn: Callable[..., Any], *args: Any) -> Any:
+    if current_app.config["PASSWORD_WORKERS"] <= 0:
+        return fn(*args)
+    executor, slots = _pool()
+    if not slots.acquire(blocking=False):
+        log.warning("Password hashing backlog is full, turning the request away")
+        raise ServiceBusyError(retry_after=BUSY_RETRY_AFTER)
+    try:
+        return executor.submit(fn, *args).result()
+    finally:
+        slots.release()
+
+
+def hash_password(password: str) -> str:
+    rounds = current_app.config["BCRYPT_ROUNDS"]
+    return _run(lambda: bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=rounds)).decode("utf-8"))
+
+
+def verify_password(password: str, hashed: str) -> bool:
+    try:
+        return _run(bcrypt.checkpw, password.encode("utf-8"), hashed.encode("utf-8"))
+    except ValueError:
+        log.warning("Stored password hash is not a valid bcrypt hash")
+        return False
+
+
+def hash_cost(hashed: str) -> Optional[int]:
+    match = _COST_PATTERN.match(hashed or "")
+    return int(match.group(1)) if match else None
+
+
+def needs_rehash(hashed: str) -> bool:
+    return hash_cost(hashed) != current_app.config["BCRYPT_ROUNDS"]
@@ -0,0 +1,102 @@
+"""
+Sliding-window rate limits for abuse-prone endpoints (login, signup, cart).
+Each caller gets a Redis sorted set of request timestamps per limit; a
+request is let through while fewer than `count` fall inside the last
+`seconds`. Limits are site config entries (`rate_limit_<name>`, written as
+"count/seconds", empty or 0 to switch one off), so they can be tuned from
+the admin config page.
+
+The check is a single pipelined round trip and runs before the view, so a
+rejected request never reaches the DB or bcrypt. If Redis is unreachable
+requests are let through. RATE_LIMITS_ENABLED switches all limits off
+(benchmarks, tests). Addresses are request.remote_addr: behind a reverse
+proxy set TRUSTED_PROXIES so it is the client's, not the proxy's.
+"""
+import time
+import uuid
+from functools import wraps
+from typing import Any, Callable, Optional, Tuple
+
+import redis
+from flask import current_app, request
+from flask_login import current_user
+
+from . import site_config
+from .exceptions import RateLimitError
+from .extensions import redis_client
+from .logging import get_logger
+
+log = get_logger(__name__)
+
+RATE_LIMIT_PREFIX = "oshkelosh:ratelimit:"
+
+
+def parse_limit(value: Any) -> Optional[Tuple[int, int]]:
+    """"10/60" → (10, 60). None when the limit is off or unreadable."""
+    try:
+        count, seconds = str(value or "").split("/")
+        count, seconds = int(count), int(seconds)
+    except ValueError:
+        return None
+    return (count, seconds) if count > 0 and seconds > 0 else None
+
+
+def get_limit(name: str) -> Optional[Tuple[int, int]]:
+    value = (site_config.get_config("site_config") or {}).get(f"rate_limit_{name}")
+    limit = parse_limit(value)
+    if value and limit is None:
+        log.warning("Ignoring unreadable rate limit %s=%r, expected count/seconds", name, value)
+    return limit
+
+
+def _caller(scope: str) -> str:
+    if scope == "user" and current_user.is_authenticated:
+        return f"user:{current_user.get_id()}"
+    return f"ip:{request.remote_addr or 'unknown'}"
+
+
+def hit(name: str, caller: str, count: int, seconds: int) -> int:
+    """
+    Record one request for caller against the limit. Returns 0 if it is
+    allowed, otherwise the seconds until the oldest request in the window
+    expires. Rejected requests are not counted.
+    """
+    key = f"{RATE_LIMIT_PREFIX}{name}:{caller}"
+    now = time.time()
+    member = f"{now:.6f}:{uuid.uuid4().hex[:8]}"
+    pipe = redis_client.client.pipeline()
+    pipe.zremrangebyscore(key, 0, now - seconds)
+    pipe.zadd(key, {member: now})
+    pipe.zcard(key)
+    pipe.zrange(key, 0, 0, withscores=True)
+    pipe.expire(key, seconds)
+    _, _, in_window, oldest, _ = pipe.execute()
+    if in_window <= count:
+        return 0
+    redis_client.client.zrem(key, member)
+    oldest_at = oldest[0][1] if oldest else now
+    return max(1, int(oldest_at + seconds - now + 1))
+
+
+def rate_limit(name: str, scope: str = "ip", methods: Tuple[str, ...] = ("POST",)) -> Callable:
+    """
+    Decorator applying the `rate_limit_<name>` site config limit to a view.
+    scope "ip" counts per client address; "user" counts per signed-in user
+    and per address for guests. Only requests with one of `methods` count.
+    Over the limit, RateLimitError (429 with Retry-After) is raised.
+    """
+    def decorator(view: Callable[..., Any]) -> Callable[..., Any]:
+        @wraps(view)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if request.method in methods and current_app.config["RATE_LIMITS_ENABLED"]:
+                try:
+                    limit = get_limit(name)
+                    retry_after = hit(name, _caller(scope), *limit) if limit else 0
+                except redis.RedisError as e:
+                    log.warning("Rate limiter unavailable, letting %s through: %s", request.endpoint, e)
+                    retry_after = 0
+                if retry_after:
+                    raise RateLimitError(retry_after=retry_after)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
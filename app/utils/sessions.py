@@ -0,0 +1,201 @@
+"""
+Server-side sessions stored in Redis.
+The cookie only carries an opaque session id; the payload is stored in
+Redis as tagged JSON (Flask's own session format, never pickle, so a write
+to Redis can't turn into code execution) with a sliding expiry of
+PERMANENT_SESSION_LIFETIME.
+Payloads are loaded on first access, so a request that never reads the
+session (or carries no session cookie) never talks to Redis.
+A signed cookie left over from the cookie backend is read once, copied
+into a new Redis session and replaced by its id, so switching backends
+keeps users signed in and their cookie carts.
+regenerate_session() moves the payload to a fresh id when privileges
+change (login), so an id planted before sign-in is worthless afterwards.
+"""
+import secrets
+from datetime import timedelta
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from flask import Flask, Request, Response, current_app, session
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSessionInterface, SessionInterface, SessionMixin
+
+from .extensions import RedisClient
+from .logging import get_logger
+
+log = get_logger(__name__)
+
+SESSION_PREFIX = "oshkelosh:session:"
+SID_LENGTH = 43  # secrets.token_urlsafe(32)
+
+
+class RedisSession(SessionMixin):
+    """Mapping that fetches its payload from Redis the first time it is touched."""
+
+    def __init__(
+        self,
+        sid: Optional[str],
+        fetch: Callable[[str], Optional[Dict[str, Any]]],
+        data: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.sid = sid
+        self.new = sid is None
+        self.modified = data is not None  # Data handed in (legacy cookie) still has to be stored
+        self._fetch = fetch
+        self._data = data
+
+    @property
+    def loaded(self) -> bool:
+        return self._data is not None
+
+    def _load(self) -> Dict[str, Any]:
+        if self._data is None:
+            data = self._fetch(self.sid) if self.sid else None
+            if data is None:
+                # Unknown or expired id: never adopt a client-chosen sid
+                self.sid = None
+                self.new = True
+                data = {}
+            self._data = data
+        return self._data
+
+    def __getitem__(self, key: str) -> Any:
+        return self._load()[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._load()[key] = value
+        self.modified = True
+
+    def __delitem__(self, key: str) -> None:
+        del self._load()[key]
+        self.modified = True
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._load())
+
+    def __len__(self) -> int:
+        return len(self._load())
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._load()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self._load().get(key, default)
+
+    def clear(self) -> None:
+        self._load().clear()
+        self.modified = True
+
+    def payload(self) -> Dict[str, Any]:
+        return dict(self._load())
+
+
+class RedisSessionInterface(SessionInterface):
+    """
+    Drop-in replacement for Flask's signed-cookie sessions, with the same
+    tagged JSON serializer for the payload.
+    """
+
+    serializer = TaggedJSONSerializer()
+    legacy = SecureCookieSessionInterface()
+
+    def __init__(self, redis: RedisClient, prefix: str = SESSION_PREFIX) -> None:
+        self.redis = redis
+        self.prefix = prefix
+
+    def _key(self, sid: str) -> str:
+        return f"{self.prefix}{sid}"
+
+    def _fetch(self, sid: str) -> Optional[Dict[str, Any]]:
+        raw = self.redis.client.get(self._key(sid))
+        if raw is None:
+            return None
+        try:
+            return self.serializer.loads(raw)
+        except Exception as e:
+            log.warning("Discarding unreadable session payload: %s", e)
+            return None
+
+    def regenerate(self, session: RedisSession) -> None:
+        """Delete the session's Redis entry and give its payload a new id, set on the response."""
+        session._load()
+        if session.sid is not None:
+            self.redis.client.delete(self._key(session.sid))
+        session.sid = secrets.token_urlsafe(32)
+        session.new = True
+        session.modified = True
+
+    @staticmethod
+    def _lifetime(app: Flask) -> timedelta:
+        return app.permanent_session_lifetime
+
+    def open_session(self, app: Flask, request: Request) -> RedisSession:
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid is None or len(sid) == SID_LENGTH:
+            return RedisSession(sid, self._fetch)
+        # Not one of our ids: a signed cookie from the cookie backend, or garbage
+        legacy = self.legacy.open_session(app, request)
+        if legacy:
+            log.debug("Moving a signed cookie session into Redis")
+            return RedisSession(None, self._fetch, dict(legacy))
+        return RedisSession(None, self._fetch)
+
+    def save_session(self, app: Flask, session: RedisSession, response: Response) -> None:  # type: ignore[override]
+        if not session.loaded:
+            return  # Never touched: no Redis round trip, cookie left alone
+
+        response.vary.add("Cookie")
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        ttl = int(self._lifetime(app).total_seconds())
+
+        if not session:
+            if session.sid is not None and session.modified:
+                self.redis.client.delete(self._key(session.sid))
+                response.delete_cookie(
+                    name,
+                    domain=domain,
+                    path=path,
+                    secure=self.get_cookie_secure(app),
+                    samesite=self.get_cookie_samesite(app),
+                    httponly=self.get_cookie_httponly(app),
+                )
+            return
+
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+            session.modified = True
+
+        if session.modified:
+            data = self.serializer.dumps(session.payload())
+            self.redis.client.set(self._key(session.sid), data, ex=ttl)
+        else:
+            # Sliding expiry: every request that reads the session extends it
+            self.redis.client.expire(self._key(session.sid), ttl)
+
+        if not self.should_set_cookie(app, session):
+            return
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+            partitioned=self.get_cookie_partitioned(app),
+        )
+
+
+def regenerate_session() -> None:
+    """
+    Issue a new id for the current session, keeping its contents. Signed
+    cookie sessions (SESSION_BACKEND other than redis) carry no server-side
+    id, so there is nothing to rotate.
+    """
+    interface = current_app.session_interface
+    current = session._get_current_object()  # type: ignore[attr-defined]
+    if isinstance(interface, RedisSessionInterface) and isinstance(current, RedisSession):
+        interface.regenerate(current)
@@ -62,7 +62,11 @@ def get_config(key: str, default: Any = None) -> Any:
 def invalidate_config_cache(key: str | None = None) -> None:
     """
     Call from admin routes after config changes.
+    Rendered pages embed site/style config, so this also bumps the catalog version.
     """
+    from .catalog import bump_catalog_version
+    bump_catalog_version()
+
     if key:
         redis_client.client.delete(f"{CONFIG_PREFIX}{key}")
         log.info("Invalidated Redis config key: %s", key)
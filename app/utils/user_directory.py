@@ -0,0 +1,82 @@
+"""
+User counts per role for the admin user directory, cached in Redis.
+The directory pages through user_table on indexed columns; its tab totals
+come from this cached aggregate instead of a COUNT per page view. The entry
+is dropped after any commit that adds or removes a user or changes a role.
+"""
+import json
+from typing import Any, Dict
+
+import redis
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from app.database import db
+from .extensions import redis_client
+from .logging import get_logger
+
+log = get_logger(__name__)
+
+USER_COUNTS_KEY = "oshkelosh:user_counts"
+USER_COUNTS_TTL = 10 * 60
+ROLES = ("CLIENT", "ADMIN")
+
+_CHANGED_KEY = "user_counts_changed"
+
+
+def get_user_counts() -> Dict[str, int]:
+    """role → number of users, from Redis or one GROUP BY on a miss."""
+    client = redis_client.client
+    try:
+        raw = client.get(USER_COUNTS_KEY)
+        if raw is not None:
+            return json.loads(raw)
+    except (redis.RedisError, json.JSONDecodeError) as e:
+        log.warning("User counts cache unavailable, counting in the DB: %s", e)
+
+    from app.models import models
+    counts = dict.fromkeys(ROLES, 0)
+    counts.update(db.session.execute(
+        select(models.User.role, func.count(models.User.id)).group_by(models.User.role)
+    ).all())
+    try:
+        client.set(USER_COUNTS_KEY, json.dumps(counts), ex=USER_COUNTS_TTL)
+    except redis.RedisError:
+        pass
+    return counts
+
+
+def invalidate_user_counts() -> None:
+    redis_client.client.delete(USER_COUNTS_KEY)
+
+
+# ----------------------------------------------------------------------
+# Change tracking — note user inserts, deletes and role changes on flush
+# ----------------------------------------------------------------------
+@event.listens_for(Session, "after_flush")
+def _collect_user_changes(session: Session, flush_context: Any) -> None:
+    from app.models import models
+
+    if session.info.get(_CHANGED_KEY):
+        return
+    if any(isinstance(obj, models.User) for obj in (*session.new, *session.deleted)) or any(
+        isinstance(obj, models.User) and inspect(obj).attrs.role.history.has_changes()
+        for obj in session.dirty
+    ):
+        session.info[_CHANGED_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session) -> None:
+    if not session.info.pop(_CHANGED_KEY, False):
+        return
+    try:
+        invalidate_user_counts()
+    except redis.RedisError as e:
+        # The commit already happened; the counts expire within USER_COUNTS_TTL anyway.
+        log.warning("Failed invalidating user counts: %s", e)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(_CHANGED_KEY, None)
@@ -0,0 +1,150 @@
+"""
+Checkout throughput: concurrent workers turning carts into orders.
+
+Compares processor.orders.build_order (one transaction, bulk inserts) with
+the per-row Order.add_product/add_payment/add_shipping path (one commit per row).
+
+Runs against the configured DATABASE_URL / REDIS_URL — point them at a
+scratch database. Rows created by the run are removed afterwards.
+
+    python bench/checkout_throughput.py --workers 8 --orders 50 --lines 30
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.database import db
+from app.models import models
+from app.processor import cart as cart_pricing, orders
+
+PREFIX = "bench-checkout"
+
+
+def seed(lines: int, workers: int) -> Dict[str, List[int]]:
+    supplier = models.Addon.query.filter_by(type="SUPPLIER").first()
+    processor = models.Addon.query.filter_by(type="PAYMENT").first() or supplier
+    products = [
+        models.Product(name=f"{PREFIX} {i}", supplier_id=supplier.id, price=10.0 + i, stock=10**6)
+        for i in range(lines)
+    ]
+    users = [
+        models.User(name="Bench", surname=str(i), email=f"{PREFIX}-{i}@example.com", password="x")
+        for i in range(workers)
+    ]
+    db.session.add_all(products + users)
+    db.session.commit()
+    return {
+        "products": [product.id for product in products],
+        "users": [user.id for user in users],
+        "processor": [processor.id],
+    }
+
+
+def cleanup(ids: Dict[str, List[int]]) -> None:
+    order_ids = [order_id for (order_id,) in db.session.query(models.Order.id).filter(models.Order.user_id.in_(ids["users"]))]
+    for model in (models.OrderProduct, models.OrderPayment, models.OrderShipping):
+        model.query.filter(model.order_id.in_(order_ids)).delete(synchronize_session=False)
+    models.Order.query.filter(models.Order.id.in_(order_ids)).delete(synchronize_session=False)
+    models.Cart.query.filter(models.Cart.user_id.in_(ids["users"])).delete(synchronize_session=False)
+    models.User.query.filter(models.User.id.in_(ids["users"])).delete(synchronize_session=False)
+    models.Product.query.filter(models.Product.id.in_(ids["products"])).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def checkout_bulk(user_id: int, processor_id: int, n: int) -> None:
+    quote = cart_pricing.price_user_cart(user_id)
+    orders.build_order(
+        user_id,
+        quote,
+        payment={"payment_processor_id": processor_id, "payment_id": f"{PREFIX}-{user_id}-{n}"},
+    )
+
+
+def checkout_per_row(user_id: int, processor_id: int, n: int) -> None:
+    quote = cart_pricing.price_user_cart(user_id)
+    order = models.Order(user_id=user_id, total=quote["subtotal"])
+    db.session.add(order)
+    db.session.commit()
+    for line in quote["lines"]:
+        order.add_product(product_id=line["product_id"], amount=line["amount"], price=line["product"].price)
+    for supplier_id in {line["product"].supplier_id for line in quote["lines"]}:
+        order.add_shipping(supplier_id=supplier_id)
+    order.add_payment(
+        payment_processor_id=processor_id,
+        payment_id=f"{PREFIX}-{user_id}-{n}",
+        reference_id=order.id,
+        direction="IN",
+    )
+    models.Cart.query.filter_by(user_id=user_id).delete()
+    db.session.commit()
+
+
+def run(app, name: str, checkout: Callable[[int, int, int], None], ids: Dict[str, List[int]], per_worker: int) -> None:
+    latencies: List[float] = []
+    errors: List[Exception] = []
+    lock = threading.Lock()
+    cart = {product_id: 1 for product_id in ids["products"]}
+
+    def worker(user_id: int) -> None:
+        with app.app_context():
+            for n in range(per_worker):
+                cart_pricing.merge_guest_cart(user_id, cart)
+                start = time.perf_counter()
+                try:
+                    checkout(user_id, ids["processor"][0], n)
+                except Exception as e:
+                    db.session.rollback()
+                    with lock:
+                        errors.append(e)
+                    continue
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=worker, args=(user_id,)) for user_id in ids["users"]]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    if not latencies:
+        print(f"{name:>10}: no successful checkouts ({len(errors)} errors, first: {errors[0] if errors else '-'})")
+        return
+    latencies.sort()
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(
+        f"{name:>10}: {len(latencies) / elapsed:8.1f} orders/s  "
+        f"p50 {statistics.median(latencies) * 1000:7.1f} ms  p95 {p95 * 1000:7.1f} ms  "
+        f"errors {len(errors)}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--orders", type=int, default=50, help="orders per worker")
+    parser.add_argument("--lines", type=int, default=30, help="cart lines per order")
+    args = parser.parse_args()
+
+    app = create_app(os.getenv("FLASK_ENV"))
+    with app.app_context():
+        ids = seed(args.lines, args.workers)
+    try:
+        print(f"{args.workers} workers × {args.orders} orders × {args.lines} lines")
+        run(app, "per-row", checkout_per_row, ids, args.orders)
+        run(app, "bulk", checkout_bulk, ids, args.orders)
+    finally:
+        with app.app_context():
+            cleanup(ids)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+"""
+Local stand-in for the PayPal and Printful REST APIs, for benchmarks and
+manual testing without credentials or network access.
+
+    python bench/fake_api.py --port 8089 --latency 40 --error-rate 0.05
+    PAYPAL_API_BASE=http://127.0.0.1:8089 PRINTFUL_API_BASE=http://127.0.0.1:8089 flask run
+
+PayPal: OAuth client-credentials tokens (with a configurable expires_in),
+order create/get/capture, capture refunds and Transaction Search, honouring
+PayPal-Request-Id for POST idempotency. GET /checkoutnow?token=<order id>
+approves an order and sends the buyer to its return_url.
+
+Printful: /oauth/scopes, a generated store/products catalog with offset
+paging, product details whose preview files point at generated PNGs under
+/preview, and order creation with external_id dedupe. Calls per token are
+limited like Printful's (429 with Retry-After past the limit).
+
+Every API call gets the configured latency and share of injected 503s.
+GET /__stats returns call counts per endpoint.
+"""
+import argparse
+import base64
+import io
+import math
+import random
+import secrets
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+from flask import Flask, Response, jsonify, redirect, request
+from PIL import Image as PilImage
+
+PRINTFUL_PAGE_SIZE = 20
+PRINTFUL_MAX_PAGE_SIZE = 100
+RATE_PERIOD = 60.0
+
+
+def create_fake_api(
+    latency: float = 0.0,
+    error_rate: float = 0.0,
+    token_ttl: int = 32400,
+    products: int = 25,
+    variants: int = 4,
+    rate_limit: int = 120,
+) -> Flask:
+    """
+    latency in seconds; error_rate is the share of API calls answered with 503.
+    products × variants sizes the Printful catalog; rate_limit is Printful
+    calls per minute per token (0 for unlimited).
+    """
+    api = Flask(__name__)
+    lock = threading.Lock()
+    stats: Counter = Counter()
+    tokens: Dict[str, float] = {}
+    orders: Dict[str, Dict[str, Any]] = {}
+    captures: Dict[str, str] = {}                  # capture id → order id
+    replies: Dict[str, Tuple[Dict[str, Any], int]] = {}  # PayPal-Request-Id → response
+    transactions: List[Dict[str, Any]] = []
+
+    def chaos(name: str) -> Response | None:
+        with lock:
+            stats[name] += 1
+        if latency:
+            time.sleep(latency * random.uniform(0.5, 1.5))
+        if error_rate and random.random() < error_rate:
+            with lock:
+                stats["injected_503"] += 1
+            return jsonify(name="SERVICE_UNAVAILABLE"), 503
+        return None
+
+    def authorized() -> bool:
+        auth = request.headers.get("Authorization", "")
+        token = auth.removeprefix("Bearer ")
+        with lock:
+            return auth.startswith("Bearer ") and tokens.get(token, 0) > time.time()
+
+    def record(event_code: str, order: Dict[str, Any], transaction_id: str) -> None:
+        unit = order["purchase_units"][0]
+        transactions.append({"transaction_info": {
+            "transaction_id": transaction_id,
+            "transaction_event_code": event_code,
+            "transaction_status": "S",
+            "transaction_updated_date": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S+0000"),
+            "transaction_amount": {"currency_code": unit["amount"]["currency_code"], "value": unit["amount"]["value"]},
+            "custom_field": unit.get("custom_id"),
+        }})
+
+    def replay_or(handler):
+        """Same PayPal-Request-Id → same answer, as PayPal does for POSTs."""
+        request_id = request.headers.get("PayPal-Request-Id")
+        with lock:
+            if request_id and request_id in replies:
+                body, status = replies[request_id]
+                return jsonify(body), status
+        body, status = handler()
+        if request_id and status < 500:
+            with lock:
+                replies[request_id] = (body, status)
+        return jsonify(body), status
+
+    @api.post("/v1/oauth2/token")
+    def token():
+        if (error := chaos("token")) is not None:
+            return error
+        auth = request.headers.get("Authorization", "")
+        try:
+            client_id, _ = base64.b64decode(auth.removeprefix("Basic ")).decode().split(":", 1)
+        except ValueError:
+            return jsonify(error="invalid_client"), 401
+        access_token = secrets.token_urlsafe(24)
+        with lock:
+            tokens[access_token] = time.time() + token_ttl
+        return jsonify(access_token=access_token, token_type="Bearer", app_id=client_id, expires_in=token_ttl)
+
+    @api.post("/v2/checkout/orders")
+    def create_order():
+        if (error := chaos("create_order")) is not None:
+            return error
+        if not authorized():
+            return jsonify(name="AUTHENTICATION_FAILURE"), 401
+
+        def handler():
+            order_id = secrets.token_hex(8).upper()
+            order = {
+                "id": order_id,
+                "status": "CREATED",
+                "intent": "CAPTURE",
+                "purchase_units": request.json["purchase_units"],
+                "links": [{"rel": "approve", "href": f"{request.host_url}checkoutnow?token={order_id}", "method": "GET"}],
+                "_return_url": (request.json.get("application_context") or {}).get("return_url"),
+            }
+            with lock:
+                orders[order_id] = order
+            return order, 201
+        return replay_or(handler)
+
+    @api.get("/v2/checkout/orders/<order_id>")
+    def get_order(order_id: str):
+        if (error := chaos("get_order")) is not None:
+            return error
+        if not authorized():
+            return jsonify(name="AUTHENTICATION_FAILURE"), 401
+        with lock:
+            order = orders.get(order_id)
+        if order is None:
+            return jsonify(name="RESOURCE_NOT_FOUND"), 404
+        return jsonify(order)
+
+    @api.post("/v2/checkout/orders/<order_id>/capture")
+    def capture_order(order_id: str):
+        if (error := chaos("capture")) is not None:
+            return error
+        if not authorized():
+            return jsonify(name="AUTHENTICATION_FAILURE"), 401
+
+        def handler():
+            with lock:
+                order = orders.get(order_id)
+                if order is None:
+                    return {"name": "RESOURCE_NOT_FOUND"}, 404
+                if order["status"] == "COMPLETED":
+                    return {"name": "UNPROCESSABLE_ENTITY", "details": [{"issue": "ORDER_ALREADY_CAPTURED"}]}, 422
+                capture_id = secrets.token_hex(8).upper()
+                captures[capture_id] = order_id
+                unit = order["purchase_units"][0]
+                unit["payments"] = {"captures": [{"id": capture_id, "status": "COMPLETED", "amount": unit["amount"]}]}
+                order["status"] = "COMPLETED"
+                record("T0006", order, capture_id)
+                return order, 201
+        return replay_or(handler)
+
+    @api.post("/v2/payments/captures/<capture_id>/refund")
+    def refund(capture_id: str):
+        if (error := chaos("refund")) is not None:
+            return error
+        if not authorized():
+            return jsonify(name="AUTHENTICATION_FAILURE"), 401
+
+        def handler():
+            with lock:
+                order_id = captures.get(capture_id)
+                if order_id is None:
+                    return {"name": "RESOURCE_NOT_FOUND"}, 404
+                orders[order_id]["purchase_units"][0]["payments"]["captures"][0]["status"] = "REFUNDED"
+                refund_id = secrets.token_hex(8).upper()
+                record("T1107", orders[order_id], refund_id)
+            return {"id": refund_id, "status": "COMPLETED"}, 201
+        return replay_or(handler)
+
+    @api.get("/checkoutnow")
+    def approve():
+        with lock:
+            order = orders.get(request.args.get("token", ""))
+            if order is None:
+                return jsonify(name="RESOURCE_NOT_FOUND"), 404
+            if order["status"] == "CREATED":
+                order["status"] = "APPROVED"
+        if order["_return_url"]:
+            return redirect(f"{order['_return_url']}?token={order['id']}&PayerID=FAKEPAYER")
+        return jsonify(order)
+
+    @api.get("/v1/reporting/transactions")
+    def search_transactions():
+        if (error := chaos("search")) is not None:
+            return error
+        if not authorized():
+            return jsonify(name="AUTHENTICATION_FAILURE"), 401
+        page_size = min(int(request.args.get("page_size", 100)), 500)
+        page = int(request.args.get("page", 1))
+        start, end = request.args["start_date"][:19], request.args["end_date"][:19]
+        with lock:
+            found = [
+                t for t in transactions
+                if start <= t["transaction_info"]["transaction_updated_date"][:19] <= end
+            ]
+        total_pages = max((len(found) + page_size - 1) // page_size, 1)
+        return jsonify(
+            transaction_details=found[(page - 1) * page_size:page * page_size],
+            page=page,
+            total_items=len(found),
+            total_pages=total_pages,
+        )
+
+    # ------------------------------------------------------------------
+    # Printful
+    # ------------------------------------------------------------------
+    calls: Dict[str, deque] = {}                   # token → recent call times
+    printful_orders: Dict[str, Dict[str, Any]] = {}  # external_id → order
+    previews: Dict[int, bytes] = {}
+
+    def printful_gate(name: str) -> Tuple[Response, int] | None:
+        if (error := chaos(name)) is not None:
+            return error
+        auth = request.headers.get("Authorization", "")
+        if not auth.startswith("Bearer ") or not auth.removeprefix("Bearer ").strip():
+            return jsonify(code=401, result="Unauthorized", error={"reason": "Unauthorized", "message": "Missing token"}), 401
+        if not rate_limit:
+            return None
+        now = time.time()
+        with lock:
+            window = calls.setdefault(auth, deque())
+            while window and window[0] <= now - RATE_PERIOD:
+                window.popleft()
+            if len(window) >= rate_limit:
+                stats["rate_limited"] += 1
+                retry_after = math.ceil(window[0] + RATE_PERIOD - now)
+                response = jsonify(code=429, result="Too Many Requests", error={"reason": "TooManyRequests", "message": f"Try again after {retry_after} seconds"})
+                response.headers["Retry-After"] = str(retry_after)
+                return response, 429
+            window.append(now)
+        return None
+
+    def sync_product(index: int) -> Dict[str, Any]:
+        return {
+            "id": 1000 + index,
+            "external_id": f"fake-{index}",
+            "name": f"Fake product {index}",
+            "variants": variants,
+            "synced": variants,
+            "thumbnail_url": f"{request.host_url}preview/{(1000 + index) * 100}.png",
+        }
+
+    @api.get("/oauth/scopes")
+    def printful_scopes():
+        if (error := printful_gate("printful_scopes")) is not None:
+            return error
+        return jsonify(code=200, result={"scopes": [{"scope": "stores_list"}, {"scope": "orders"}, {"scope": "sync_products"}]})
+
+    @api.get("/store/products")
+    def printful_products():
+        if (error := printful_gate("printful_products")) is not None:
+            return error
+        offset = max(int(request.args.get("offset", 0)), 0)
+        limit = min(max(int(request.args.get("limit", PRINTFUL_PAGE_SIZE)), 1), PRINTFUL_MAX_PAGE_SIZE)
+        page = [sync_product(index) for index in range(offset, min(offset + limit, products))]
+        return jsonify(code=200, result=page, paging={"total": products, "offset": offset, "limit": limit})
+
+    @api.get("/store/products/<int:product_id>")
+    def printful_product(product_id: int):
+        if (error := printful_gate("printful_product")) is not None:
+            return error
+        index = product_id - 1000
+        if not 0 <= index < products:
+            return jsonify(code=404, result="Not found", error={"reason": "NotFound", "message": "Product not found"}), 404
+        sync_variants = []
+        for n in range(variants):
+            variant_id = product_id * 100 + n
+            sync_variants.append({
+                "id": variant_id,
+                "external_id": f"fake-{index}-{n}",
+                "sync_product_id": product_id,
+                "name": f"Fake product {index} / Size {n}",
+                "synced": True,
+                "retail_price": f"{15 + index % 10 + n:.2f}",
+                "currency": "USD",
+                "availability_status": "active",
+                "product": {"variant_id": variant_id, "product_id": product_id, "name": f"Fake blank {index}"},
+                "files": [
+                    {"id": variant_id * 10, "type": "default", "status": "ok", "preview_url": None},
+                    {"id": variant_id * 10 + 1, "type": "preview", "status": "ok", "preview_url": f"{request.host_url}preview/{variant_id}.png"},
+                ],
+            })
+        return jsonify(code=200, result={"sync_product": sync_product(index), "sync_variants": sync_variants})
+
+    @api.get("/preview/<int:file_id>.png")
+    def printful_preview(file_id: int):
+        if (error := chaos("printful_preview")) is not None:
+            return error
+        with lock:
+            body = previews.get(file_id % 8)
+        if body is None:
+            buffer = io.BytesIO()
+            PilImage.new("RGB", (600, 600), color=((file_id * 37) % 256, (file_id * 91) % 256, (file_id * 53) % 256)).save(buffer, "PNG")
+            body = buffer.getvalue()
+            with lock:
+                previews[file_id % 8] = body
+        return Response(body, mimetype="image/png")
+
+    @api.post("/orders")
+    def printful_order():
+        if (error := printful_gate("printful_order")) is not None:
+            return error
+        body = request.get_json(silent=True) or {}
+        external_id = body.get("external_id")
+        with lock:
+            if external_id and external_id in printful_orders:
+                return jsonify(code=400, result="Bad request", error={"reason": "BadRequest", "message": "Order with this External ID already exists"}), 400
+            order = {"id": random.randint(10**7, 10**8), "external_id": external_id, "status": "pending" if request.args.get("confirm") in ("1", "true") else "draft", "recipient": body.get("recipient"), "items": body.get("items", [])}
+            if external_id:
+                printful_orders[external_id] = order
+        return jsonify(code=200, result=order)
+
+    @api.get("/orders/<order_ref>")
+    def printful_get_order(order_ref: str):
+        if (error := printful_gate("printful_get_order")) is not None:
+            return error
+        with lock:
+            if order_ref.startswith("@"):
+                order = printful_orders.get(order_ref[1:])
+            else:
+                order = next((order for order in printful_orders.values() if str(order["id"]) == order_ref), None)
+        if order is None:
+            return jsonify(code=404, result="Not found", error={"reason": "NotFound", "message": "Order not found"}), 404
+        return jsonify(code=200, result=order)
+
+    @api.get("/__stats")
+    def get_stats():
+        with lock:
+            return jsonify(dict(stats))
+
+    return api
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="mean added latency in ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of calls answered with 503")
+    parser.add_argument("--token-ttl", type=int, default=32400, help="expires_in for issued PayPal tokens")
+    parser.add_argument("--products", type=int, default=25, help="Printful catalog size")
+    parser.add_argument("--variants", type=int, default=4, help="variants per Printful product")
+    parser.add_argument("--rate-limit", type=int, default=120, help="Printful calls per minute per token, 0 for unlimited")
+    args = parser.parse_args()
+    api = create_fake_api(
+        latency=args.latency / 1000,
+        error_rate=args.error_rate,
+        token_ttl=args.token_ttl,
+        products=args.products,
+        variants=args.variants,
+        rate_limit=args.rate_limit,
+    )
+    api.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+End-to-end load harness: supplier sync and checkout against the local API
+stand-ins (bench/fake_api.py), reporting throughput and latency percentiles.
+
+Starts the stand-in in-process and points the Printful and PayPal addons at
+it, then
+  1. runs processor.sync_products() — catalog paging, product details and
+     preview image downloads through the Printful rate-limited session;
+  2. runs concurrent shoppers through the real routes: log in, add to cart,
+     check out, approve at the stand-in, capture.
+
+Runs against the configured DATABASE_URL / REDIS_URL — point them at a
+scratch database. Synced products stay (re-syncs match them); the shoppers
+and their orders are removed afterwards.
+
+    python bench/load_harness.py --products 50 --variants 4 --shoppers 8 --checkouts 10 --latency 40 --error-rate 0.02
+"""
+import argparse
+import os
+import random
+import re
+import statistics
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PREFIX = "bench-load"
+PASSWORD = "bench-password"
+KEY_PATTERN = re.compile(r'name="idempotency_key" type="hidden" value="([^"]+)"')
+
+
+def percentiles(values: List[float]) -> str:
+    if not values:
+        return "no samples"
+    values = sorted(values)
+
+    def at(q: float) -> float:
+        return values[min(len(values) - 1, int(len(values) * q))] * 1000
+
+    return f"p50 {statistics.median(values) * 1000:7.1f} ms  p95 {at(0.95):7.1f} ms  p99 {at(0.99):7.1f} ms  max {values[-1] * 1000:7.1f} ms"
+
+
+def run_sync(app, base_url: str) -> None:
+    import requests
+    from app.addons.suppliers.printful import functions as printful
+    from app.models import models
+    from app.processor import sync_products
+
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    statuses: Counter = Counter()
+
+    def record(response, *args, **kwargs):
+        path = response.request.path_url
+        kind = "preview" if path.startswith("/preview") else "details" if re.match(r"/store/products/\d+", path) else "catalog"
+        latencies[kind].append(response.elapsed.total_seconds())
+        statuses[response.status_code] += 1
+
+    printful.session.hooks["response"].append(record)
+    try:
+        with app.app_context():
+            start = time.perf_counter()
+            sync_products()
+            elapsed = time.perf_counter() - start
+            synced = models.Product.query.filter(models.Product.product_id.isnot(None), models.Product.active.is_(True)).count()
+    finally:
+        printful.session.hooks["response"].remove(record)
+
+    stats = requests.get(f"{base_url}/__stats").json()
+    requests_made = sum(statuses.values())
+    print(f"sync: {synced} products in {elapsed:.2f}s ({synced / elapsed:.1f} products/s, {requests_made / elapsed:.1f} requests/s)")
+    print(f"      responses {dict(statuses)}  server 429s {stats.get('rate_limited', 0)}  injected 503s {stats.get('injected_503', 0)}")
+    for kind in ("catalog", "details", "preview"):
+        print(f"      {kind:>8}: {len(latencies[kind]):5d} requests  {percentiles(latencies[kind])}")
+
+
+def seed_shoppers(count: int) -> List[Dict[str, str]]:
+    from app.database import db
+    from app.models import models
+    from app.utils.passwords import hash_password
+
+    password = hash_password(PASSWORD)
+    users = [
+        models.User(name="Bench", surname=str(i), email=f"{PREFIX}-{i}@example.com", password=password)
+        for i in range(count)
+    ]
+    db.session.add_all(users)
+    db.session.commit()
+    return [{"id": user.id, "email": user.email} for user in users]
+
+
+def cleanup(user_ids: List[int]) -> None:
+    from app.database import db
+    from app.models import models
+
+    order_ids = [order_id for (order_id,) in db.session.query(models.Order.id).filter(models.Order.user_id.in_(user_ids))]
+    for model in (models.OrderProduct, models.OrderPayment, models.OrderShipping, models.OutboxMessage):
+        model.query.filter(model.order_id.in_(order_ids)).delete(synchronize_session=False)
+    models.Order.query.filter(models.Order.id.in_(order_ids)).delete(synchronize_session=False)
+    for model in (models.Cart, models.UserOrderSummary, models.StockReservation):
+        model.query.filter(model.user_id.in_(user_ids)).delete(synchronize_session=False)
+    models.User.query.filter(models.User.id.in_(user_ids)).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def run_checkout(app, shoppers: List[Dict[str, str]], checkouts: int, product_ids: List[int]) -> None:
+    import requests
+
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Counter = Counter()
+    lock = threading.Lock()
+    approvals = requests.Session()
+
+    def timed(step: str, call):
+        start = time.perf_counter()
+        result = call()
+        with lock:
+            latencies[step].append(time.perf_counter() - start)
+        return result
+
+    def shopper(account: Dict[str, str]) -> None:
+        client = app.test_client()
+        response = timed("login", lambda: client.post("/user/login", data={"email": account["email"], "password": PASSWORD}))
+        if response.status_code != 302:
+            with lock:
+                errors[f"login {response.status_code}"] += 1
+            return
+        for _ in range(checkouts):
+            flow_start = time.perf_counter()
+            try:
+                for product_id in random.sample(product_ids, min(3, len(product_ids))):
+                    timed("add to cart", lambda: client.post("/user/addcart", json={"product_id": product_id, "amount": 1}))
+                page = timed("checkout page", lambda: client.get("/user/checkout"))
+                key = KEY_PATTERN.search(page.get_data(as_text=True)).group(1)
+                placed = timed("place order", lambda: client.post("/user/checkout", data={"idempotency_key": key}))
+                location = placed.headers.get("Location", "")
+                if not location.startswith("http"):
+                    raise RuntimeError(f"no approval redirect ({placed.status_code} {location})")
+                approved = timed("approve", lambda: approvals.get(location, allow_redirects=False, timeout=30))
+                return_path = re.sub(r"^https?://[^/]+", "", approved.headers["Location"])
+                page = timed("payment page", lambda: client.get(return_path))
+                key = KEY_PATTERN.search(page.get_data(as_text=True)).group(1)
+                captured = timed("capture", lambda: client.post(return_path.split("?")[0], data={"idempotency_key": key}))
+                if captured.status_code != 302:
+                    raise RuntimeError(f"capture answered {captured.status_code}")
+            except Exception as e:
+                with lock:
+                    errors[type(e).__name__] += 1
+                continue
+            with lock:
+                latencies["full checkout"].append(time.perf_counter() - flow_start)
+
+    threads = [threading.Thread(target=shopper, args=(account,)) for account in shoppers]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    done = len(latencies["full checkout"])
+    print(f"checkout: {done} paid orders in {elapsed:.2f}s ({done / elapsed:.1f} orders/s)  errors {dict(errors) or 0}")
+    for step in ("login", "add to cart", "checkout page", "place order", "approve", "payment page", "capture", "full checkout"):
+        print(f"      {step:>13}: {len(latencies[step]):5d}  {percentiles(latencies[step])}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=20.0, help="stand-in latency in ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of stand-in calls answered with 503")
+    parser.add_argument("--products", type=int, default=25, help="Printful catalog size")
+    parser.add_argument("--variants", type=int, default=4)
+    parser.add_argument("--rate-limit", type=int, default=120, help="stand-in Printful calls per minute, 0 for unlimited")
+    parser.add_argument("--client-rate-limit", type=int, default=120, help="calls per minute the Printful session allows itself")
+    parser.add_argument("--shoppers", type=int, default=8)
+    parser.add_argument("--checkouts", type=int, default=10, help="checkouts per shopper")
+    parser.add_argument("--skip-sync", action="store_true")
+    parser.add_argument("--skip-checkout", action="store_true")
+    args = parser.parse_args()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    # Read by the addons at import / client creation, so set before importing the app
+    os.environ["PAYPAL_API_BASE"] = base_url
+    os.environ["PRINTFUL_API_BASE"] = base_url
+    os.environ["PRINTFUL_RATE_LIMIT"] = str(args.client_rate_limit)
+
+    from werkzeug.serving import make_server
+    from app import create_app
+    from app.models import models
+    from bench.fake_api import create_fake_api
+
+    api = create_fake_api(
+        latency=args.latency / 1000,
+        error_rate=args.error_rate,
+        products=args.products,
+        variants=args.variants,
+        rate_limit=args.rate_limit,
+    )
+    server = make_server("127.0.0.1", args.port, api, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    app = create_app(os.getenv("FLASK_ENV"))
+    app.config["WTF_CSRF_ENABLED"] = False  # the harness posts forms directly
+    app.config["RATE_LIMITS_ENABLED"] = False  # every simulated client shares one address
+    print(f"stand-in at {base_url}: {args.latency:.0f} ms latency, {args.error_rate:.0%} injected 503s, {args.rate_limit or 'no'} Printful calls/min")
+    try:
+        if not args.skip_sync:
+            run_sync(app, base_url)
+        if args.skip_checkout:
+            return
+        with app.app_context():
+            paypal = models.Addon.query.filter_by(name="paypal", type="PAYMENT").first()
+            if paypal is None:
+                models.Addon.new(name="paypal", type="PAYMENT", description="PayPal", active=True)
+            elif not paypal.active:
+                print("paypal addon is installed but inactive; activate it to benchmark checkout")
+                return
+            product_ids = [
+                product_id for (product_id,) in models.Product.query
+                .filter(models.Product.is_base.is_(False), models.Product.active.is_(True), models.Product.price > 0)
+                .with_entities(models.Product.id)
+            ]
+            if not product_ids:
+                print("no products to buy; run without --skip-sync first")
+                return
+            shoppers = seed_shoppers(args.shoppers)
+        try:
+            print(f"{args.shoppers} shoppers × {args.checkouts} checkouts")
+            run_checkout(app, shoppers, args.checkouts, product_ids)
+        finally:
+            with app.app_context():
+                cleanup([account["id"] for account in shoppers])
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
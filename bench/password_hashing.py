@@ -0,0 +1,132 @@
+"""
+Login throughput per bcrypt cost, and what a login burst does to the rest
+of the site.
+
+For each cost, seeds users hashed at that cost and sends concurrent logins
+through the real /user/login route while a probe keeps requesting a cheap
+page (the login form). Each cost runs twice: hashing inline on the request
+threads (PASSWORD_WORKERS=0, the old behaviour) and on the bounded
+executor. Logins turned away with a 503 count as busy.
+
+Runs against the configured DATABASE_URL / REDIS_URL — point them at a
+scratch database. The seeded users are removed afterwards.
+
+    python bench/password_hashing.py --costs 10,12,13 --threads 16 --logins 10 --workers 2 --backlog 32
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bcrypt
+
+from app import create_app
+from app.database import db
+from app.models import models
+
+PREFIX = "bench-password"
+PASSWORD = "bench-password"
+
+
+def percentiles(values: List[float]) -> str:
+    if not values:
+        return "no samples"
+    values = sorted(values)
+    p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+    return f"p50 {statistics.median(values) * 1000:7.1f} ms  p95 {p95 * 1000:7.1f} ms"
+
+
+def seed(count: int, cost: int) -> List[Dict[str, str]]:
+    password = bcrypt.hashpw(PASSWORD.encode("utf-8"), bcrypt.gensalt(rounds=cost)).decode("utf-8")
+    users = [
+        models.User(name="Bench", surname=str(i), email=f"{PREFIX}-{cost}-{i}@example.com", password=password)
+        for i in range(count)
+    ]
+    db.session.add_all(users)
+    db.session.commit()
+    return [{"id": user.id, "email": user.email} for user in users]
+
+
+def cleanup(user_ids: List[int]) -> None:
+    models.Cart.query.filter(models.Cart.user_id.in_(user_ids)).delete(synchronize_session=False)
+    models.User.query.filter(models.User.id.in_(user_ids)).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def run(app, accounts: List[Dict[str, str]], logins: int) -> None:
+    login_latencies: List[float] = []
+    probe_latencies: List[float] = []
+    statuses: Counter = Counter()
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def shopper(account: Dict[str, str]) -> None:
+        for _ in range(logins):
+            client = app.test_client()
+            start = time.perf_counter()
+            response = client.post("/user/login", data={"email": account["email"], "password": PASSWORD})
+            with lock:
+                login_latencies.append(time.perf_counter() - start)
+                statuses[response.status_code] += 1
+
+    def probe() -> None:
+        client = app.test_client()
+        while not done.is_set():
+            start = time.perf_counter()
+            client.get("/user/login")
+            probe_latencies.append(time.perf_counter() - start)
+            time.sleep(0.01)
+
+    prober = threading.Thread(target=probe)
+    threads = [threading.Thread(target=shopper, args=(account,)) for account in accounts]
+    prober.start()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    prober.join()
+
+    logged_in = statuses.get(302, 0)
+    print(f"    {logged_in / elapsed:7.1f} logins/s  busy {statuses.get(503, 0):4d}  other {sum(statuses.values()) - logged_in - statuses.get(503, 0):4d}")
+    print(f"      login: {percentiles(login_latencies)}")
+    print(f"      probe: {percentiles(probe_latencies)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--costs", default="10,12", help="comma separated bcrypt costs")
+    parser.add_argument("--threads", type=int, default=16, help="concurrent request threads logging in")
+    parser.add_argument("--logins", type=int, default=10, help="logins per thread")
+    parser.add_argument("--workers", type=int, default=2, help="PASSWORD_WORKERS for the executor runs")
+    parser.add_argument("--backlog", type=int, default=32, help="PASSWORD_BACKLOG for the executor runs")
+    args = parser.parse_args()
+
+    app = create_app(os.getenv("FLASK_ENV"))
+    app.config["WTF_CSRF_ENABLED"] = False  # the benchmark posts the form directly
+    app.config["RATE_LIMITS_ENABLED"] = False  # every simulated client shares one address
+    app.config["PASSWORD_BACKLOG"] = args.backlog
+    with app.app_context():
+        for cost in [int(cost) for cost in args.costs.split(",")]:
+            app.config["BCRYPT_ROUNDS"] = cost
+            accounts = seed(args.threads, cost)
+            try:
+                print(f"cost {cost}: {args.threads} threads × {args.logins} logins")
+                for label, workers in (("inline", 0), (f"executor ({args.workers} workers)", args.workers)):
+                    print(f"  {label}")
+                    app.config["PASSWORD_WORKERS"] = workers
+                    run(app, accounts, args.logins)
+            finally:
+                cleanup([account["id"] for account in accounts])
+
+
+if __name__ == "__main__":
+    main()
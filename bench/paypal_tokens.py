@@ -0,0 +1,89 @@
+"""
+PayPal client under concurrency: many workers, one token fetch.
+
+Starts bench/fake_api.py in-process, then runs workers that each build their
+own PaypalClient (as separate processes would) and call the API. With the
+shared Redis token cache, the stand-in should see a single token request.
+
+Uses the configured REDIS_URL.
+
+    python bench/paypal_tokens.py --workers 16 --calls 50 --latency 20 --error-rate 0.05
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from werkzeug.serving import make_server
+
+from app import create_app
+from app.addons.payments.paypal.functions import PaypalClient
+from bench.fake_api import create_fake_api
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--calls", type=int, default=50, help="API calls per worker")
+    parser.add_argument("--latency", type=float, default=20.0, help="stand-in latency in ms")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=8089)
+    args = parser.parse_args()
+
+    server = make_server("127.0.0.1", args.port, create_fake_api(args.latency / 1000, args.error_rate), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    app = create_app(os.getenv("FLASK_ENV"))
+    latencies: List[float] = []
+    errors: List[Exception] = []
+    lock = threading.Lock()
+
+    def worker(n: int) -> None:
+        with app.app_context():
+            client = PaypalClient("bench-client", "bench-secret", base_url=base_url)
+            for i in range(args.calls):
+                start = time.perf_counter()
+                try:
+                    order = client.create_order(10.0, "USD", reference_id=f"{n}-{i}")
+                    client.get_order(order["id"])
+                except Exception as e:
+                    with lock:
+                        errors.append(e)
+                    continue
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+
+    with app.app_context():
+        # Start cold: no shared token yet
+        client = PaypalClient("bench-client", "bench-secret", base_url=base_url)
+        client.cache.delete(client._token_key)
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    stats = requests.get(f"{base_url}/__stats").json()
+    server.shutdown()
+
+    latencies.sort()
+    print(f"{args.workers} workers × {args.calls} calls, {args.latency:.0f} ms stand-in latency, {args.error_rate:.0%} injected 503s")
+    print(f"token requests: {stats.get('token', 0)}  (one per worker without the shared cache: {args.workers})")
+    if latencies:
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(
+            f"{len(latencies) / elapsed:.1f} round trips/s  p50 {statistics.median(latencies) * 1000:.1f} ms  "
+            f"p95 {p95 * 1000:.1f} ms  errors {len(errors)}  injected 503s {stats.get('injected_503', 0)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Stock contention: many workers racing for the last units of one product.
+
+Runs processor.stock.reserve against a naive read-modify-write decrement and
+reports sales vs. available stock. Oversells must be zero for `reserve`.
+
+Runs against the configured DATABASE_URL / REDIS_URL — point them at a
+scratch database. Rows created by the run are removed afterwards.
+
+    python bench/stock_contention.py --workers 32 --attempts 20 --stock 100
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from typing import Callable, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.database import db
+from app.models import models
+from app.processor import stock
+from app.utils.exceptions import OutOfStockError
+
+PREFIX = "bench-stock"
+
+
+def seed(units: int) -> int:
+    supplier = models.Addon.query.filter_by(type="SUPPLIER").first()
+    product = models.Product(name=PREFIX, supplier_id=supplier.id, price=1.0, stock=units)
+    db.session.add(product)
+    db.session.commit()
+    return product.id
+
+
+def cleanup(product_id: int) -> None:
+    models.StockReservation.query.filter_by(product_id=product_id).delete()
+    models.Product.query.filter_by(id=product_id).delete()
+    db.session.commit()
+
+
+def buy_reserve(product_id: int) -> bool:
+    try:
+        return bool(stock.reserve({product_id: 1}))
+    except OutOfStockError:
+        return False
+
+
+def buy_naive(product_id: int) -> bool:
+    product = db.session.get(models.Product, product_id, populate_existing=True)
+    if product.stock < 1:
+        db.session.rollback()
+        return False
+    time.sleep(0)  # yield, as real request handling would between read and write
+    product.stock = product.stock - 1
+    db.session.commit()
+    return True
+
+
+def run(app, name: str, buy: Callable[[int], bool], units: int, workers: int, attempts: int) -> None:
+    with app.app_context():
+        product_id = seed(units)
+    sold: List[int] = []
+    errors: List[Exception] = []
+    lock = threading.Lock()
+
+    def worker() -> None:
+        with app.app_context():
+            for _ in range(attempts):
+                try:
+                    ok = buy(product_id)
+                except Exception as e:
+                    db.session.rollback()
+                    with lock:
+                        errors.append(e)
+                    continue
+                if ok:
+                    with lock:
+                        sold.append(1)
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        remaining = db.session.get(models.Product, product_id).stock
+        cleanup(product_id)
+    oversold = max(0, len(sold) - units)
+    print(
+        f"{name:>8}: {workers * attempts / elapsed:8.1f} attempts/s  sold {len(sold):5d}/{units}  "
+        f"stock left {remaining:5d}  oversold {oversold}  errors {len(errors)}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--attempts", type=int, default=20, help="purchase attempts per worker")
+    parser.add_argument("--stock", type=int, default=100)
+    args = parser.parse_args()
+
+    app = create_app(os.getenv("FLASK_ENV"))
+    print(f"{args.workers} workers × {args.attempts} attempts for {args.stock} units")
+    run(app, "naive", buy_naive, args.stock, args.workers, args.attempts)
+    run(app, "reserve", buy_reserve, args.stock, args.workers, args.attempts)
+
+
+if __name__ == "__main__":
+    main()
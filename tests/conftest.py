@@ -0,0 +1,91 @@
+"""
+Shared fixtures. External APIs are served by the stand-in from
+bench/fake_api.py on a local port; Redis is fakeredis; the app runs on a
+throwaway SQLite file.
+"""
+import os
+import sys
+import threading
+from typing import Any, Callable, Dict, Iterator
+
+import fakeredis
+import pytest
+import redis
+import requests
+from cryptography.fernet import Fernet
+from werkzeug.serving import make_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+from fake_api import create_fake_api  # noqa: E402
+
+
+class StandIn:
+    """A running fake API: its base URL, per-endpoint call counts and the requests it saw."""
+
+    def __init__(self, app: Any) -> None:
+        self.seen: list = []
+        self.fail_next: Dict[str, int] = {}   # path → how many upcoming calls get a 503
+        self._app = app
+        self._server = make_server("127.0.0.1", 0, self._wsgi, threaded=True)
+        self.url = f"http://127.0.0.1:{self._server.server_port}"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def _wsgi(self, environ: Dict[str, Any], start_response: Callable) -> Any:
+        path = environ["PATH_INFO"]
+        self.seen.append((environ["REQUEST_METHOD"], path, environ.get("HTTP_PAYPAL_REQUEST_ID")))
+        if self.fail_next.get(path):
+            self.fail_next[path] -= 1
+            start_response("503 SERVICE UNAVAILABLE", [("Content-Type", "application/json")])
+            return [b'{"name": "SERVICE_UNAVAILABLE"}']
+        return self._app(environ, start_response)
+
+    def stats(self) -> Dict[str, int]:
+        return requests.get(f"{self.url}/__stats", timeout=5).json()
+
+    def close(self) -> None:
+        self._server.shutdown()
+
+
+@pytest.fixture
+def stand_in_factory() -> Iterator[Callable[..., StandIn]]:
+    servers = []
+
+    def start(**options: Any) -> StandIn:
+        server = StandIn(create_fake_api(**options))
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+@pytest.fixture
+def stand_in(stand_in_factory: Callable[..., StandIn]) -> StandIn:
+    return stand_in_factory()
+
+
+@pytest.fixture
+def fake_redis() -> fakeredis.FakeRedis:
+    return fakeredis.FakeRedis()
+
+
+@pytest.fixture
+def app(tmp_path: Any, monkeypatch: pytest.MonkeyPatch, fake_redis: fakeredis.FakeRedis) -> Iterator[Any]:
+    """A testing app with its context pushed; Redis is the fake_redis fixture."""
+    from app import create_app
+    from app.config import TestingConfig
+    from app.database import db
+
+    monkeypatch.setenv("ENCRYPTION_KEY", Fernet.generate_key().decode())
+    monkeypatch.setattr(TestingConfig, "SQLALCHEMY_DATABASE_URI", f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setattr(redis, "from_url", lambda url, **kwargs: fake_redis)
+    app = create_app("testing")
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
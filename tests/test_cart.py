@@ -0,0 +1,41 @@
+"""
+Merging a guest's session cart into the user's DB cart at login.
+"""
+from typing import Any, Dict
+
+import pytest
+
+from app.database import db
+from app.models import models
+from app.processor import cart
+
+
+@pytest.fixture
+def products(app: Any) -> Dict[str, int]:
+    supplier = models.Addon.query.filter_by(name="printful").first()
+    base = models.Product(name="Shirt", supplier_id=supplier.id, is_base=True)
+    db.session.add(base)
+    db.session.flush()
+    variant = models.Product(name="Shirt M", supplier_id=supplier.id, price=20.0, variant_of_id=base.id)
+    retired = models.Product(name="Old mug", supplier_id=supplier.id, price=8.0, active=False)
+    db.session.add_all([variant, retired])
+    db.session.commit()
+    return {"base": base.id, "variant": variant.id, "retired": retired.id}
+
+
+def test_merge_adds_quantities(products: Dict[str, int]) -> None:
+    user_id = models.User.query.first().id
+
+    assert cart.merge_guest_cart(user_id, {products["variant"]: 2}) == 1
+    assert cart.merge_guest_cart(user_id, {products["variant"]: 1}) == 1
+
+    assert models.Cart.query.filter_by(user_id=user_id, product_id=products["variant"]).one().quantity == 3
+
+
+def test_merge_drops_products_that_cannot_be_bought(products: Dict[str, int]) -> None:
+    user_id = models.User.query.first().id
+
+    merged = cart.merge_guest_cart(user_id, {products["base"]: 1, products["retired"]: 1, products["variant"]: 1, 999999: 1})
+
+    assert merged == 1
+    assert [item.product_id for item in models.Cart.query.filter_by(user_id=user_id)] == [products["variant"]]
@@ -0,0 +1,26 @@
+"""
+Addon config lookups.
+"""
+from typing import Any
+
+import pytest
+
+from app.database import db
+from app.models import models
+
+
+def test_configs_by_type(app: Any) -> None:
+    configs = models.get_config(addon_type="supplier")
+
+    assert len(configs) == models.Addon.query.filter_by(type="SUPPLIER").count()
+
+
+def test_addon_without_config_rows_is_an_error(app: Any) -> None:
+    addon = models.Addon(name="handmade", type="SUPPLIER", description="No config yet")
+    db.session.add(addon)
+    db.session.commit()
+
+    with pytest.raises(ValueError):
+        models.get_config(addon_type="SUPPLIER")
+    # The batch API leaves it out for callers that skip it
+    assert addon.id not in models.get_configs([addon.id])
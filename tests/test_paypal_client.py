@@ -0,0 +1,84 @@
+"""PaypalClient against the local PayPal stand-in."""
+import threading
+import time
+
+from app.addons.payments.paypal import functions
+from app.addons.payments.paypal.functions import EARLY_REFRESH, PaypalClient
+
+
+def make_client(stand_in, cache, client_id="shop"):
+    return PaypalClient(client_id, "secret", base_url=stand_in.url, cache=cache)
+
+
+def test_token_is_cached_and_shared(stand_in, fake_redis):
+    first = make_client(stand_in, fake_redis)
+    token = first.get_access_token()
+    assert first.get_access_token() == token
+
+    # Another worker with the same credentials picks the token up from Redis
+    assert make_client(stand_in, fake_redis).get_access_token() == token
+    assert stand_in.stats()["token"] == 1
+
+
+def test_token_refreshed_before_paypal_expiry(stand_in_factory, fake_redis):
+    stand_in = stand_in_factory(token_ttl=3600)
+    client = make_client(stand_in, fake_redis)
+    client.get_access_token()
+    assert 0 < fake_redis.ttl(client._token_key) <= 3600 - EARLY_REFRESH
+
+    stand_in = stand_in_factory(token_ttl=EARLY_REFRESH + 1)
+    client = make_client(stand_in, fake_redis)
+    token = client.get_access_token()
+    time.sleep(1.2)
+    assert client.get_access_token() != token
+    assert stand_in.stats()["token"] == 2
+
+
+def test_only_one_worker_fetches_a_token(stand_in_factory, fake_redis):
+    stand_in = stand_in_factory(latency=0.2)
+    clients = [make_client(stand_in, fake_redis) for _ in range(8)]
+    tokens = []
+    threads = [threading.Thread(target=lambda c=c: tokens.append(c.get_access_token())) for c in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(tokens) == 8 and len(set(tokens)) == 1
+    assert stand_in.stats()["token"] == 1
+
+
+def test_rejected_token_is_replaced(stand_in, fake_redis):
+    client = make_client(stand_in, fake_redis)
+    client.get_access_token()
+    fake_redis.set(client._token_key, "revoked")
+    client._token = ("revoked", time.time() + 60)
+
+    order = client.create_order(10.0, "EUR", "1")
+    assert order["status"] == "CREATED"
+    assert fake_redis.get(client._token_key).decode() != "revoked"
+
+
+def test_post_retry_keeps_request_id(stand_in, fake_redis):
+    client = make_client(stand_in, fake_redis)
+    stand_in.fail_next["/v2/checkout/orders"] = 1
+
+    order = client.create_order(10.0, "EUR", "1")
+
+    attempts = [request_id for method, path, request_id in stand_in.seen if path == "/v2/checkout/orders"]
+    assert len(attempts) == 2
+    assert attempts[0] and attempts[0] == attempts[1]
+    assert order["status"] == "CREATED"
+
+
+def test_same_request_id_returns_same_order(stand_in, fake_redis):
+    client = make_client(stand_in, fake_redis)
+    first = client.create_order(10.0, "EUR", "1", request_id="order-1")
+    again = client.create_order(10.0, "EUR", "1", request_id="order-1")
+    assert first["id"] == again["id"]
+    assert client.create_order(10.0, "EUR", "1", request_id="order-2")["id"] != first["id"]
+
+
+def test_sessions_are_pooled_per_host(stand_in, fake_redis):
+    assert make_client(stand_in, fake_redis).session is make_client(stand_in, fake_redis, "other").session
+    assert functions._session(stand_in.url) is functions._sessions[stand_in.url]
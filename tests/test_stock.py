@@ -0,0 +1,58 @@
+"""
+Stock reservations and the catalog version behind HTTP validators.
+"""
+from typing import Any
+
+import pytest
+
+from app.database import db
+from app.models import models
+from app.processor import stock
+from app.utils import catalog
+from app.utils.extensions import redis_client
+
+
+@pytest.fixture
+def variant(app: Any) -> models.Product:
+    supplier = models.Addon.query.filter_by(name="printful").first()
+    base = models.Product(name="Shirt", supplier_id=supplier.id, is_base=True)
+    db.session.add(base)
+    db.session.flush()
+    variant = models.Product(name="Shirt M", supplier_id=supplier.id, price=20.0, stock=3, variant_of_id=base.id)
+    db.session.add(variant)
+    db.session.commit()
+    models.refresh_variant_aggregates([base.id])
+    return variant
+
+
+def version() -> int:
+    return int(redis_client.client.hget(catalog.CATALOG_VERSION_KEY, "version") or 0)
+
+
+def test_reservation_within_stock_keeps_catalog_version(variant: models.Product) -> None:
+    catalog.get_product(variant.variant_of_id)
+    before = version()
+
+    stock.reserve({variant.id: 1})
+
+    assert version() == before
+    # The base's cached view lists variant stock and is rebuilt
+    assert not redis_client.client.exists(catalog._product_key(variant.variant_of_id))
+    db.session.expire_all()
+    assert variant.stock == 2
+
+
+def test_selling_out_and_restocking_bump_catalog_version(variant: models.Product) -> None:
+    before = version()
+
+    reservation_ids = stock.reserve({variant.id: 3})
+
+    assert version() == before + 1
+    db.session.expire_all()
+    assert db.session.get(models.Product, variant.variant_of_id).in_stock_count == 0
+
+    stock.release(reservation_ids)
+
+    assert version() == before + 2
+    db.session.expire_all()
+    assert db.session.get(models.Product, variant.variant_of_id).in_stock_count == 1
@@ -0,0 +1,138 @@
+"""
+Webhook ingestion and the stream consumer, driven through the PayPal addon
+with signature verification stubbed out.
+"""
+import json
+import time
+from typing import Any, Dict
+
+import pytest
+
+from app.database import db
+from app.models import models
+from app.processor import webhooks
+from app.utils.extensions import redis_client
+
+PAYPAL_ORDER_ID = "PP-ORDER-1"
+
+
+@pytest.fixture
+def paypal(app: Any, monkeypatch: pytest.MonkeyPatch) -> models.Addon:
+    import app.addons.payments.paypal as module
+
+    monkeypatch.setattr(module, "verify_webhook", lambda *args: True)
+    monkeypatch.setattr(webhooks, "_handlers", {})
+    return models.Addon.new(name="paypal", type="PAYMENT", active=True, description="PayPal")
+
+
+@pytest.fixture
+def payment(paypal: models.Addon) -> models.OrderPayment:
+    order = models.Order(user_id=models.User.query.first().id)
+    db.session.add(order)
+    db.session.flush()
+    payment = models.OrderPayment(
+        order_id=order.id, payment_processor_id=paypal.id, payment_id=PAYPAL_ORDER_ID,
+        reference_id=0, direction="IN", status="CREATED",
+    )
+    db.session.add(payment)
+    db.session.commit()
+    return payment
+
+
+def event(event_id: str, status: str) -> bytes:
+    if status == "APPROVED":
+        body: Dict[str, Any] = {"event_type": "CHECKOUT.ORDER.APPROVED", "resource": {"id": PAYPAL_ORDER_ID}}
+    else:
+        body = {
+            "event_type": f"PAYMENT.CAPTURE.{status}",
+            "resource": {"supplementary_data": {"related_ids": {"order_id": PAYPAL_ORDER_ID}}},
+        }
+    return json.dumps({"id": event_id, **body}).encode()
+
+
+def deliver(*bodies: bytes) -> None:
+    for body in bodies:
+        assert webhooks.ingest("paypal", {}, {}, body) == ("queued", 200)
+
+
+def pending() -> int:
+    return redis_client.client.xpending(webhooks.STREAM_KEY, webhooks.CONSUMER_GROUP)["pending"]
+
+
+def test_redelivered_event_is_queued_once(paypal: models.Addon) -> None:
+    body = event("WH-1", "COMPLETED")
+
+    assert webhooks.ingest("paypal", {}, {}, body) == ("queued", 200)
+    assert webhooks.ingest("paypal", {}, {}, body) == ("duplicate", 200)
+    assert redis_client.client.xlen(webhooks.STREAM_KEY) == 1
+
+
+def test_unknown_addon_is_not_queued(paypal: models.Addon) -> None:
+    assert webhooks.ingest("nope", {}, {}, event("WH-1", "COMPLETED")) == ("unknown", 404)
+
+
+def test_unprocessable_event_is_dead_lettered_and_acked(payment: models.OrderPayment, monkeypatch: pytest.MonkeyPatch) -> None:
+    deliver(event("WH-1", "COMPLETED"))
+    # The addon is switched off between ingestion and consumption
+    models.Addon.query.filter_by(name="paypal").update({"active": False})
+    db.session.commit()
+    monkeypatch.setattr(webhooks, "_handlers", {})
+
+    assert webhooks.consume_batch("c1", block_ms=None) == 1
+
+    dead = redis_client.client.xrange(webhooks.DEAD_LETTER_KEY)
+    assert [fields[b"event_id"] for _, fields in dead] == [b"WH-1"]
+    assert pending() == 0
+    assert db.session.get(models.OrderPayment, payment.id).status == "CREATED"
+
+
+def test_once_returns_at_once_on_an_empty_stream(app: Any) -> None:
+    started = time.monotonic()
+    result = app.test_cli_runner().invoke(args=["consume-webhooks", "--once", "--consumer", "c1"])
+
+    assert result.exit_code == 0, result.output
+    assert result.output == ""
+    assert time.monotonic() - started < 2
+
+
+def test_once_applies_queued_events(app: Any, payment: models.OrderPayment) -> None:
+    deliver(event("WH-1", "COMPLETED"))
+
+    result = app.test_cli_runner().invoke(args=["consume-webhooks", "--once", "--consumer", "c1"])
+
+    assert result.exit_code == 0, result.output
+    assert "1 events applied" in result.output
+    assert pending() == 0
+    db.session.expire_all()
+    assert payment.status == "COMPLETED"
+    assert payment.order.status == "PAID"
+
+
+def test_late_event_does_not_move_payment_back(payment: models.OrderPayment) -> None:
+    deliver(event("WH-1", "COMPLETED"))
+    assert webhooks.consume_batch("c1", block_ms=None) == 1
+    deliver(event("WH-2", "APPROVED"), event("WH-3", "PENDING"))
+    assert webhooks.consume_batch("c1", block_ms=None) == 2
+
+    db.session.expire_all()
+    assert payment.status == "COMPLETED"
+    assert payment.order.status == "PAID"
+
+
+def test_lower_status_later_in_a_batch_is_ignored(payment: models.OrderPayment) -> None:
+    deliver(event("WH-1", "COMPLETED"), event("WH-2", "PENDING"))
+
+    assert webhooks.consume_batch("c1", block_ms=None) == 2
+
+    db.session.expire_all()
+    assert payment.status == "COMPLETED"
+    assert payment.order.status == "PAID"
+
+
+def test_refund_follows_completion(payment: models.OrderPayment) -> None:
+    deliver(event("WH-1", "COMPLETED"), event("WH-2", "REFUNDED"))
+
+    assert webhooks.consume_batch("c1", block_ms=None) == 2
+
+    db.session.expire_all()
+    assert payment.status == "REFUNDED"